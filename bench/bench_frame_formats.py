@@ -0,0 +1,143 @@
+"""Throughput of each intermediate frame format in igf_render.FRAME_FORMATS.
+
+    python bench/bench_frame_formats.py [--frames N] [--size WxH] [--ffmpeg PATH] [--convert PATH]
+
+For every format, times the stages that write or read intermediate frames: ffmpeg extracting
+frames, the Pillow and ImageMagick crop and resize, and reading the resized frames back like the
+effects stage does. ffmpeg and convert default to the ones in PATH, then instagiffer.conf. The
+convert stage is skipped without ImageMagick.
+"""
+
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import PIL.Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import igf_common  # noqa: E402
+import igf_render  # noqa: E402
+
+
+def find_tool(path, name):
+    if path:
+        return path
+    conf = igf_common.InstaConfig(os.path.join(REPO_DIR, 'instagiffer.conf'))
+    for candidate in (shutil.which(name), conf.GetParam('paths', name)):
+        if candidate and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def list_frames(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+
+def dir_megabytes(directory):
+    return sum(os.path.getsize(fileName) for fileName in list_frames(directory)) / (1024 * 1024)
+
+
+def extract(ffmpeg, frameFormat, size, numFrames, outDir):
+    cmd = '"%s" -v error -f lavfi -i testsrc2=size=%s:rate=25 -frames:v %d %s"%s"' % (
+        ffmpeg,
+        size,
+        numFrames,
+        frameFormat.GetFfmpegOptions(),
+        os.path.join(outDir, 'image%04d.' + frameFormat.extension),
+    )
+    subprocess.run(shlex.split(cmd), check=True)
+
+
+def resize_pillow(frameFormat, inDir, outDir):
+    files = list_frames(inDir)
+    with PIL.Image.open(files[0]) as img:
+        size = img.size
+
+    geometry = igf_render.FrameGeometry(size, None, (size[0] // 2, size[1] // 2))
+    renderer = igf_render.PillowFrameRenderer(geometry, frameFormat=frameFormat)
+    for fileName in files:
+        outFile = os.path.join(outDir, os.path.basename(fileName))
+        if not renderer.Render(fileName, outFile):
+            raise RuntimeError('Unable to resize ' + fileName)
+
+
+def resize_convert(convert, frameFormat, inDir, outDir):
+    for fileName in list_frames(inDir):
+        outFile = os.path.join(outDir, os.path.basename(fileName))
+        cmd = '"%s" "%s" -resize 50%% -strip %s"%s"' % (
+            convert,
+            fileName,
+            frameFormat.GetConvertOptions(),
+            outFile,
+        )
+        subprocess.run(shlex.split(cmd), check=True)
+
+
+def read_frames(inDir):
+    for fileName in list_frames(inDir):
+        with PIL.Image.open(fileName) as img:
+            img.load()
+
+
+def timed(stage, *args):
+    start = time.perf_counter()
+    stage(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--ffmpeg')
+    parser.add_argument('--convert')
+    args = parser.parse_args()
+
+    ffmpeg = find_tool(args.ffmpeg, 'ffmpeg')
+    convert = find_tool(args.convert, 'convert')
+    if ffmpeg is None:
+        sys.exit('ffmpeg not found. Use --ffmpeg')
+
+    stages = ['extract', 'resize pillow', 'resize convert', 'read']
+    print('%d frames of %s. Frames per second per stage, and MB written' % (args.frames, args.size))
+    print('%-6s' % 'format' + ''.join('%16s' % stage for stage in stages) + '%10s' % 'MB')
+
+    for formatName, frameFormat in igf_render.FRAME_FORMATS.items():
+        with tempfile.TemporaryDirectory() as workDir:
+            frameDir = os.path.join(workDir, 'original')
+            resizeDir = os.path.join(workDir, 'resized')
+            os.makedirs(frameDir)
+            os.makedirs(resizeDir)
+
+            seconds = {}
+            seconds['extract'] = timed(
+                extract, ffmpeg, frameFormat, args.size, args.frames, frameDir
+            )
+            megabytes = dir_megabytes(frameDir)
+
+            seconds['resize pillow'] = timed(resize_pillow, frameFormat, frameDir, resizeDir)
+            if convert is not None:
+                seconds['resize convert'] = timed(
+                    resize_convert, convert, frameFormat, frameDir, resizeDir
+                )
+            seconds['read'] = timed(read_frames, resizeDir)
+            megabytes += dir_megabytes(resizeDir)
+
+        row = '%-6s' % formatName
+        for stage in stages:
+            if stage in seconds:
+                row += '%16.1f' % (args.frames / seconds[stage])
+            else:
+                row += '%16s' % '-'
+        print(row + '%10.1f' % megabytes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Per-call overhead of igf_common.run_process.
+
+    python bench/bench_run_process.py [--calls N] [--baseline REV]
+
+Runs short commands through run_process and reports the time per call on top of running the
+same command with subprocess.run. With --baseline, run_process as of git revision REV is timed
+too, e.g. 8abf797 for the version that polled every 100 ms.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import types
+import warnings
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import igf_common  # noqa: E402
+
+COMMANDS = {
+    'exit': 'import sys',
+    'sleep 30 ms': 'import time; time.sleep(0.03)',
+    'print 2000 lines': 'print("progress\\n" * 2000)',
+}
+
+
+def load_module_at(rev, moduleName):
+    """moduleName as of git revision rev"""
+    source = subprocess.run(
+        ['git', '-C', REPO_DIR, 'show', '%s:%s.py' % (rev, moduleName)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    module = types.ModuleType('%s_%s' % (moduleName, rev))
+    exec(compile(source, '%s@%s' % (moduleName, rev), 'exec'), module.__dict__)
+    return module
+
+
+def time_per_call(runCommand, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        runCommand()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=30)
+    parser.add_argument('--baseline', metavar='REV')
+    args = parser.parse_args()
+
+    runners = [('run_process', igf_common.run_process)]
+    if args.baseline:
+        baseline = load_module_at(args.baseline, 'igf_common')
+        # Older versions ask for line buffering on binary pipes
+        warnings.filterwarnings('ignore', 'line buffering', RuntimeWarning)
+        runners.append(('run_process@' + args.baseline, baseline.run_process))
+
+    print('%-18s %-22s %10s %10s' % ('command', 'runner', 'ms/call', 'overhead'))
+    for name, code in COMMANDS.items():
+        argv = [sys.executable, '-c', code]
+        cmd = '"%s" -c "%s"' % (sys.executable, code.replace('"', '\\"'))
+
+        direct = time_per_call(lambda: subprocess.run(argv, capture_output=True), args.calls)
+        print('%-18s %-22s %10.1f %10s' % (name, 'subprocess.run', direct * 1000, ''))
+
+        for runnerName, runProcess in runners:
+            perCall = time_per_call(lambda: runProcess(cmd, None, True), args.calls)
+            print(
+                '%-18s %-22s %10.1f %+10.1f'
+                % (name, runnerName, perCall * 1000, (perCall - direct) * 1000)
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 import base64
+import concurrent.futures
 import configparser
+import functools
 import glob
 import hashlib
 import json
@@ -11,6 +13,7 @@ import random
 import re
 import shutil
 import subprocess
+import threading
 import time
 import traceback
 import uuid
@@ -18,8 +21,13 @@ import uuid
 import PIL.Image
 import PIL.ImageDraw
 
+import igf_cache
 import igf_common
+import igf_frames
 import igf_paths
+import igf_render
+import igf_stages
+import igf_watch
 from igf_common import IM_A_MAC, IM_A_PC, __release__, re_scale, run_process
 
 if IM_A_PC:
@@ -31,6 +39,101 @@ IMGUR_API_URL = 'https://api.imgur.com/3/upload.json'
 __imgur_cid__ = '58fc34d08ab311d'
 
 
+def build_caption_envelope(envelopeName, fps, fromFrame, toFrame, numFrames, rng=random):
+    """Caption animation value, 0.0 to 1.0, for each of numFrames frames. The envelope's
+    pattern repeats from fromFrame to toFrame and is 0.0 elsewhere. rng rolls the random
+    pattern."""
+    animationDuration = 1.0
+
+    if 'slow' in envelopeName:
+        animationDuration = 2.0
+    if 'medium' in envelopeName:
+        animationDuration = 1.0
+    if 'fast' in envelopeName:
+        animationDuration = 0.5
+
+    dutyCycle = float(fps) * animationDuration
+    animStep = int(round(100 / dutyCycle))
+
+    if animStep == 0:
+        animStep = 1
+
+    saw = [x / 100.0 for x in range(0, 101, animStep)]
+    tri = [x / 100.0 for x in range(0, 101, animStep)]
+    squ = ([1.00] * int(dutyCycle)) + ([0.00] * int(dutyCycle))
+
+    if saw[-1] != 1.0:
+        saw.append(1.0)
+
+    if tri[-1] != 1.0:
+        tri.append(1.0)
+
+    if len(squ) == 0:
+        squ = [1.0, 0.0]
+
+    tri = tri + tri[::-1][1:-1]
+
+    totalTextFrames = 1 + toFrame - fromFrame
+
+    if 'triangle' in envelopeName:
+        patternEnv = tri
+    elif 'square' in envelopeName:
+        patternEnv = squ
+    elif 'random' in envelopeName:
+        patternEnv = [rng.randint(0, 100) / 100.0 for _ in range(0, 50)]
+    elif 'sawtooth' in envelopeName:
+        patternEnv = saw
+    else:
+        patternEnv = [1.0]
+
+    # repeat pattern
+    if totalTextFrames > 0:
+        repeats = -(-totalTextFrames // len(patternEnv))
+        patternEnv = (patternEnv * repeats)[0:totalTextFrames]
+
+    if 'fade' in envelopeName and 'in' in envelopeName:
+        for fx in range(0, min(len(saw), len(patternEnv))):
+            patternEnv[fx] *= saw[fx]
+
+    if 'fade' in envelopeName and 'out' in envelopeName:
+        si = 0
+        for fx in range(len(patternEnv) - 1, -1, -1):
+            patternEnv[fx] *= saw[si]
+            si += 1
+            if si >= len(saw):
+                break
+
+    animationEnv = [0.0] * (fromFrame - 1)
+    animationEnv += patternEnv
+    animationEnv += [0.0] * (numFrames - len(animationEnv))
+    return animationEnv
+
+
+def build_convert_batch_args(jobs):
+    """Chain (frameArgs, outputFileName) jobs into one convert argument string. Every frame
+    is processed in its own parenthesis with scoped settings and written out via -write."""
+    if len(jobs) == 1:
+        frameArgs, outputFileName = jobs[0]
+        return '%s "%s"' % (frameArgs, outputFileName)
+
+    args = '-respect-parentheses '
+    for frameArgs, outputFileName in jobs[:-1]:
+        args += ' ( %s -write "%s" ) +delete ' % (frameArgs, outputFileName)
+
+    frameArgs, outputFileName = jobs[-1]
+    args += ' ( %s ) "%s"' % (frameArgs, outputFileName)
+    return args
+
+
+def color_setting_arg(settings, section, key):
+    """A colour setting as convert takes it. Hex colours come from the snapshot's parsed
+    value, anything else, like a colour name, is passed on as written"""
+    color = settings.GetParamColor(section, key)
+    if color is None:
+        return settings.GetParam(section, key)
+    return igf_common.color_to_hex(color)
+
+
 class AnimatedGif:
     """
     Try to keep this class fully de-coupled from the GUI. lol.
@@ -66,11 +169,24 @@ class AnimatedGif:
         self.processedDir = workDir + os.sep + 'processed'
         self.captureDir = workDir + os.sep + 'capture'
         self.maskDir = workDir + os.sep + 'mask'
+        self.captionDir = workDir + os.sep + 'captions'
         self.downloadDir = workDir + os.sep + 'downloads'
         self.previewFile = workDir + os.sep + 'preview.gif'
+        self.frameHashFile = workDir + os.sep + 'framehashes.md5'
         self.vidThumbFile = workDir + os.sep + 'thumb.png'
         self.blankImgFile = workDir + os.sep + 'blank.gif'
         self.audioClipFile = workDir + os.sep + 'audio.wav'
+        self.presizedGeometry = None  # Set when extraction also wrote the cropped and resized frames
+        self.presizedSnapshot = None
+        self.frameStack = None  # Set when frames were extracted through the rawvideo pipe
+        self.frameManifest = None  # Source timestamps of the extracted frames
+        self.stageGraph = igf_stages.StageGraph(self.conf)
+        self.processedFrameKeys = {}  # processed frame path -> (frame key, file identity)
+        self.mergedFrameCounts = {}  # frame file identity -> duplicates culled after it
+        self.frameHashes = {}  # frame file identity -> MD5 of its pixels, from the decoder
+        self.captionEnvelopes = {}  # Per ImageProcessing run
+        self.captionLayersUsed = set()  # Caption layer files the last ImageProcessing run used
+        self.cullDuplicates = None  # Overrides autoDeleteDuplicateFrames in Build() when set
 
         self.OverwriteOutputGif(self.conf.GetParamBool('settings', 'overwriteGif'))
 
@@ -99,6 +215,7 @@ class AnimatedGif:
             (self.downloadDir, None),
             (self.captureDir, None),
             (self.maskDir, None),
+            (self.captionDir, None),
         ):
             if os.path.isdir(path):
                 continue
@@ -106,6 +223,22 @@ class AnimatedGif:
             if not os.path.isdir(path):
                 self.FatalError(f'Failed to create {name or "working"} directory: {path}')
 
+        # Frame directories are indexed in memory. The watcher catches edits made elsewhere
+        watcher = None
+        if self.conf.GetParamBool('performance', 'watchFrameDirs'):
+            watcher = igf_watch.DirectoryWatcher()
+        self.frameDirIndex = igf_frames.DirectoryIndex(self.frameDir, watcher)
+        self.resizeDirIndex = igf_frames.DirectoryIndex(self.resizeDir, watcher)
+        self.processedDirIndex = igf_frames.DirectoryIndex(self.processedDir, watcher)
+        self.frameStore = igf_frames.FrameStore(self.frameDirIndex)  # Order of the extracted frames
+
+        self.frameCache = None
+        cacheMB = self.conf.GetParamInt('performance', 'frameCacheMB')
+        if cacheMB > 0:
+            cacheDir = igf_paths.create_cache_dir(self.conf, workDir)
+            if cacheDir:
+                self.frameCache = igf_cache.FrameCache(cacheDir, cacheMB * 1024 * 1024)
+
         self.LoadFonts()
         logging.info('4')
         self.CheckPaths()
@@ -118,6 +251,7 @@ class AnimatedGif:
         logging.info('8')
         self.DeleteCapturedImages()
         self.DeleteMaskImages()
+        self.DeleteCaptionLayers()
         self.DeleteAudioClip()
 
         # self.DeleteGifOutput()
@@ -442,7 +576,11 @@ class AnimatedGif:
             logging.info('Export %s to %s...' % (fromFile, toFile))
 
             try:
-                shutil.copy(fromFile, toFile)
+                if fromFile.lower().endswith('.png'):
+                    shutil.copy(fromFile, toFile)
+                else:
+                    with PIL.Image.open(fromFile) as img:
+                        img.save(toFile)
             except Exception:
                 self.callback(True)
                 return False
@@ -456,11 +594,20 @@ class AnimatedGif:
         self.callback(True)
         return True
 
-    # If manual deletions are made, the enumeration gets messed up, which screws up the import
+    # Frame order lives in the frame store. Rename the files to match it for anything that goes
+    # by file name
     def ReEnumerateExtractedFrames(self):
-        if not self.ExtractedImagesExist():
-            return True
-        return self.ReEnumeratePngFrames(self.GetExtractedImagesDir(), self.GetExtractedImageList())
+        try:
+            renamed = self.frameStore.Materialize()
+        except OSError as e:
+            logging.error('Unable to re-enumerate frames: ' + str(e))
+            return False
+
+        if renamed:
+            logging.info('Re-enumerated %d frames' % (renamed))
+
+        self.callback(True)
+        return True
 
     def ReEnumeratePngFrames(self, directory, imageList):
         imageList.sort()
@@ -474,7 +621,7 @@ class AnimatedGif:
         for fromFile in imageList:
             self.callback(False)
 
-            toFile = '%simage%04d.png' % (directory + os.sep, x)
+            toFile = '%simage%04d%s' % (directory + os.sep, x, os.path.splitext(fromFile)[1])
             # logging.info("Re-enumerate %s to %s" % (fromFile, toFile))
             try:
                 shutil.move(fromFile, toFile)
@@ -484,35 +631,13 @@ class AnimatedGif:
 
             x += 1
 
+        self.RescanFrameDirs()
         self.callback(True)
 
         return retVal
 
     def ReverseFrames(self):
-        # Get current image list
-        currentImgList = self.GetExtractedImageList()
-        numImgs = len(currentImgList)
-
-        def GetOrigName(idx):
-            return '%simage%04d.png' % (self.GetExtractedImagesDir() + os.sep, idx)
-
-        def GetRenamedName(idx):
-            return '%scurrent_image%04d.png' % (
-                self.GetExtractedImagesDir() + os.sep,
-                idx,
-            )
-
-        for x in range(0, len(currentImgList)):
-            toFile = GetRenamedName(x + 1)
-            logging.info('Temporarily rename image %s to %s' % (currentImgList[x], toFile))
-            shutil.move(currentImgList[x], toFile)
-
-        for x in range(0, len(currentImgList)):
-            fromFile = GetRenamedName(numImgs - x)
-            toFile = GetOrigName(x + 1)
-            logging.info('Move %s to %s' % (fromFile, toFile))
-            shutil.move(fromFile, toFile)
-
+        self.frameStore.Reverse()
         return True
 
     def CreateBlankFrame(self, color):
@@ -548,7 +673,7 @@ class AnimatedGif:
                 xfadeFrames += 1
                 start -= 1
 
-        xfadeLen = xfadeFrames / 2
+        xfadeLen = xfadeFrames // 2
 
         logging.info(
             'Create cross fade between %d and %d (%d fade frames) - fade length: %d - %d frames total'
@@ -556,8 +681,13 @@ class AnimatedGif:
         )
 
         origImgList = self.GetExtractedImageList()
+        settings = self.conf.GetSnapshot()
+        frameFormat = self.GetExtractedFrameFormat(settings)
 
-        # Add up to start
+        # Frame a is blended in place with frame b, which goes away. The a and b ranges don't
+        # overlap, so frames can be blended in any order
+        tasks = []
+        fadedFrames = []
         for x in range(0, xfadeLen):
             fadePercent = (x + 1) * 100 / (xfadeLen + 1)
             ia = (start - 1 + x) % totCount
@@ -568,31 +698,24 @@ class AnimatedGif:
 
             logging.info('xfade %d with %d by %d percent' % (ia + 1, ib + 1, fadePercent))
 
-            cmdConvert = (
-                '"%s" -comment "Creating cross-fade:%d" "%s" "%s" -alpha on -compose dissolve -define compose:args=%d -composite "%s"'
-                % (
-                    self.conf.GetParam('paths', 'convert'),
-                    x * 100 / xfadeLen,
-                    fa,
-                    fb,
-                    fadePercent,
-                    fa,
-                )
+            task = functools.partial(
+                igf_render.blend_frames, fa, fb, fadePercent / 100.0, fa, frameFormat
             )
+            tasks.append((task, 1))
+            fadedFrames.append(fb)
 
-            if not run_process(cmdConvert, self.callback, False):
-                self.DeleteExtractedImages()
-                self.FatalError("Couldn't fade!")
+        if not self.RunFrameTasks(tasks, 'Creating cross-fade', self.GetWorkerCount(settings)):
+            self.DeleteExtractedImages()
+            self.FatalError("Couldn't fade!")
 
+        for fb in fadedFrames:
             try:
                 os.remove(fb)
             except Exception:
                 self.DeleteExtractedImages()
                 self.FatalError("Couldn't delete frame: " + fb)
 
-        if not self.ReEnumerateExtractedFrames():
-            self.FatalError('Failed to re-enumerate frames')
-
+        self.frameDirIndex.Invalidate()
         return True
 
     def ImportFrames(
@@ -626,23 +749,13 @@ class AnimatedGif:
         # Get current image list
         currentImgList = self.GetExtractedImageList()
 
-        # Temporarily rename existing images
-        for x in range(0, len(currentImgList)):
-            toFile = '%scurrent_image%04d.png' % (self.GetExtractedImagesDir(), x + 1)
-            logging.info('Temporarily rename image %s to %s' % (currentImgList[x], toFile))
-
-            if currentImgList[x] in importedImgList:
-                shutil.copy(currentImgList[x], toFile)
-            else:
-                shutil.move(currentImgList[x], toFile)
-
-            currentImgList[x] = toFile
-
-        # Temporarily rename and resize imported images
+        # Imported images only need names that don't clash with existing frames. The frame store
+        # keeps the order
         logging.info('Rename, resize and rotate imported image sequence')
+        importId = uuid.uuid4().hex[:8]
 
         def GetImportFileName(idx):
-            return '%simported_image%04d.png' % (self.GetExtractedImagesDir(), x)
+            return '%simported_%s_%04d.png' % (self.GetExtractedImagesDir(), importId, idx)
 
         x = 1
         # totalCount = len(importedImgList)
@@ -727,11 +840,8 @@ class AnimatedGif:
             if len(newImportList):
                 newImgList.append(newImportList.pop(0))
 
-        # Properly name the files
-        for x in range(0, len(newImgList)):
-            toFile = '%simage%04d.png' % (self.GetExtractedImagesDir(), x + 1)
-            logging.info('Move %s to %s' % (newImgList[x], toFile))
-            shutil.move(newImgList[x], toFile)
+        self.frameDirIndex.Invalidate()
+        self.frameStore.SetOrder(newImgList)
 
         self.callback(True)
         return True
@@ -931,46 +1041,21 @@ class AnimatedGif:
         return self.resizeDir + os.sep
 
     def GetResizedImagesLastModifiedTs(self):
-        if self.ResizedImagesExist():
-            largestTimestamp = os.stat(self.GetResizedImagesDir()).st_mtime
-            files = glob.glob(self.GetResizedImagesDir() + '*')
-
-            for f in files:
-                if os.stat(f).st_mtime > largestTimestamp:
-                    largestTimestamp = os.stat(f).st_mtime
-            return largestTimestamp
-        else:
-            return 0
-
-    def GetResizedImageList(self, idx=None):
-        ret = []
-        files = glob.glob(self.GetResizedImagesDir() + '*')
-        for f in files:
-            if idx is not None:
-                origFiles = self.GetExtractedImageList()
-                f = self.GetResizedImagesDir() + os.path.basename(origFiles[idx - 1])
-                return f
-                # doesn't handle deleted frames - DOESN'T WORK
-                # imageName = "image%04d.png" % (idx)
-                # if imageName in f:
-                #     return f
-
-            ret.append(f)
+        return self.resizeDirIndex.GetLastModifiedTs()
 
-        return ret
+    def GetResizedImageList(self, idx=None, settings=None):
+        files = self.resizeDirIndex.GetFiles()
+        if idx is not None and len(files) > 0:
+            return self.GetResizedImagePath(
+                self.GetExtractedImageList()[idx - 1], settings=settings
+            )
+        return files
 
     def ResizedImagesExist(self):
-        count = 0
-        files = glob.glob(self.GetResizedImagesDir() + '*')
-        for f in files:
-            count = count + 1
-
-        if count > 0:
-            return True
-        else:
-            return False
+        return len(self.resizeDirIndex.GetNames()) > 0
 
     def DeleteResizedImages(self):
+        self.resizeDirIndex.Invalidate()
         files = glob.glob(self.resizeDir + os.sep + '*')
         for f in files:
             try:
@@ -981,40 +1066,115 @@ class AnimatedGif:
     def GetExtractedImagesDir(self):
         return self.frameDir + os.sep
 
+    def GetFramesGeneration(self):
+        """Changes whenever extracted frames are added, removed, edited or reordered"""
+        return self.frameDirIndex.GetGeneration(), self.frameStore.generation
+
+    def GetFrameGeneration(self, framePath):
+        """Changes whenever the file at framePath is replaced or edited"""
+        return self.frameDirIndex.GetFileGeneration(framePath)
+
+    def GetStageInputs(self, stage, settings):
+        """What a stage depends on besides its configuration"""
+        if stage == igf_stages.STAGE_EXTRACT:
+            return self.videoPath, tuple(self.imageSequence), self.cullDuplicates
+        elif stage == igf_stages.STAGE_RESIZE:
+            maskFile = self.GetMaskFileName(settings.GetParamInt('blend', 'cinemagraphKeyFrameIdx'))
+            try:
+                maskId = igf_frames.file_identity(maskFile)
+            except OSError:
+                maskId = None
+            return self.GetFramesGeneration(), maskId
+        elif stage == igf_stages.STAGE_PROCESS:
+            return (
+                self.resizeDirIndex.GetGeneration(),
+                self.processedDirIndex.GetGeneration(),
+                self.GetFinalOutputFormat(),
+            )
+        elif stage == igf_stages.STAGE_ENCODE:
+            return self.processedDirIndex.GetGeneration(), self.gifOutPath, self.GifExists()
+        return ()
+
+    def IsStageStale(self, stage, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        return self.stageGraph.IsStale(stage, self.GetStageInputs(stage, settings), settings)
+
+    def MarkStageBuilt(self, stage, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        self.stageGraph.MarkBuilt(stage, self.GetStageInputs(stage, settings), settings)
+
+    def Build(self, lastStage=igf_stages.STAGE_ENCODE, onStage=None):
+        """Run the stages up to lastStage whose inputs changed since they last ran. Each stage
+        that runs makes the ones after it stale. onStage(stage) is called before a stage runs.
+        Returns False if a stage failed, which is left stale so the next build retries it.
+
+        Every stage reads its settings from one snapshot taken here, so changes made in the UI
+        during a build are picked up by the next one."""
+        settings = self.conf.GetSnapshot()
+        builders = {
+            igf_stages.STAGE_EXTRACT: functools.partial(self.BuildExtractStage, settings),
+            igf_stages.STAGE_RESIZE: functools.partial(self.CropAndResize, None, settings),
+            igf_stages.STAGE_PROCESS: functools.partial(self.ImageProcessing, -1, settings),
+            igf_stages.STAGE_ENCODE: functools.partial(self.Generate, True, settings),
+        }
+
+        for stage in self.stageGraph.order:
+            if self.IsStageStale(stage, settings):
+                logging.info('Build stage: ' + stage)
+                if onStage is not None:
+                    onStage(stage)
+                if not builders[stage]():
+                    logging.error('Build stage failed: ' + stage)
+                    return False
+                self.MarkStageBuilt(stage, settings)
+
+            if stage == lastStage:
+                break
+
+        return True
+
+    def BuildExtractStage(self, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        if not self.ExtractFrames(settings):
+            return False
+
+        cull = self.cullDuplicates
+        if cull is None:
+            cull = settings.GetParamBool('settings', 'autoDeleteDuplicateFrames')
+        if cull:
+            self.CheckDuplicates(True, settings)
+        return True
+
+    def RescanFrameDirs(self):
+        """Forget the cached listings of the frame directories. Call after files in them were
+        changed behind the engine's back, by the user or another program."""
+        for index in (self.frameDirIndex, self.resizeDirIndex, self.processedDirIndex):
+            index.Invalidate()
+
     def GetExtractedImagesLastModifiedTs(self):
         if self.ExtractedImagesExist():
-            largestTimestamp = os.stat(self.GetExtractedImagesDir()).st_mtime
-            files = glob.glob(self.GetExtractedImagesDir() + '*')
-
-            for f in files:
-                if os.path.exists(f) and os.stat(f).st_mtime > largestTimestamp:
-                    largestTimestamp = os.stat(f).st_mtime
-            return largestTimestamp
+            # Reordering frames doesn't touch the files
+            return max(self.frameDirIndex.GetLastModifiedTs(), self.frameStore.modifiedTs)
         else:
             return 0
 
     def ExtractedImagesExist(self):
-        count = 0
-        files = glob.glob(self.GetExtractedImagesDir() + '*')
-        for f in files:
-            count = count + 1
-
-        if count > 0:
-            return True
-        else:
-            return False
+        return len(self.frameDirIndex.GetNames()) > 0
 
     def GetNumFrames(self):
         return len(self.GetExtractedImageList())
 
     def GetExtractedImageList(self):
-        ret = []
-        files = glob.glob(self.GetExtractedImagesDir() + '*')
-        for f in files:
-            ret.append(f)
-        return ret
+        return self.frameStore.GetFiles()
 
     def DeleteExtractedImages(self):
+        self.frameStore.Reset()
+        self.mergedFrameCounts = {}
+        self.frameHashes = {}
+        self.frameDirIndex.Invalidate()
         files = glob.glob(self.GetExtractedImagesDir() + '*')
         for f in files:
             try:
@@ -1028,12 +1188,9 @@ class AnimatedGif:
     def GetProcessedImagesDir(self):
         return self.processedDir + os.sep
 
-    def GetProcessedImageList(self):
-        ret = []
-        files = glob.glob(self.GetProcessedImagesDir() + '*.' + self.GetIntermediaryFrameFormat())
-        for f in files:
-            ret.append(f)
-        return ret
+    def GetProcessedImageList(self, settings=None):
+        ext = '.' + self.GetIntermediaryFrameFormat(settings)
+        return [f for f in self.processedDirIndex.GetFiles() if f.endswith(ext)]
 
     def DeleteProcessedImages(self):
         if os.path.exists(self.previewFile):
@@ -1042,6 +1199,8 @@ class AnimatedGif:
             except Exception:
                 pass
 
+        self.processedDirIndex.Invalidate()
+        self.processedFrameKeys = {}
         files = glob.glob(self.GetProcessedImagesDir() + '*')
 
         for f in files:
@@ -1128,12 +1287,23 @@ class AnimatedGif:
         for f in files:
             os.remove(f)
 
+    def DeleteCaptionLayers(self, keep=()):
+        """Delete rendered caption layers, except for the files in keep"""
+        for f in glob.glob(self.captionDir + os.sep + '*'):
+            if f in keep:
+                continue
+            try:
+                os.remove(f)
+            except OSError:
+                logging.error(f"Can't delete {f}")
+
     def CopyFramesToResizeFolder(self):
         # Copy extracted images over again
         files = glob.glob(self.frameDir + os.sep + '*')
         for f in files:
             self.callback(False)
             shutil.copy(f, self.resizeDir)
+        self.resizeDirIndex.Invalidate()
         self.callback(True)
 
     def CopyFramesToProcessedFolder(self):
@@ -1141,6 +1311,7 @@ class AnimatedGif:
         files = glob.glob(self.resizeDir + os.sep + '*')
         for f in files:
             shutil.copy(f, self.processedDir)
+        self.processedDirIndex.Invalidate()
 
     def IsDownloadedVideo(self):
         return self.isUrl
@@ -1189,11 +1360,13 @@ class AnimatedGif:
         else:
             return None
 
-    def ExtractAudioClip(self):
-        audioPath = self.conf.GetParam('audio', 'path')
-        startTimeStr = float(self.conf.GetParam('audio', 'startTime'))
-        volume = int(self.conf.GetParam('audio', 'volume')) / 100.0
-        durationSec = self.GetTotalRuntimeSec()
+    def ExtractAudioClip(self, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        audioPath = settings.GetParam('audio', 'path')
+        startTimeStr = settings.GetParamFloat('audio', 'startTime')
+        volume = settings.GetParamInt('audio', 'volume') / 100.0
+        durationSec = self.GetTotalRuntimeSec(settings)
 
         if len(audioPath) == 0:
             return None
@@ -1203,8 +1376,8 @@ class AnimatedGif:
         except Exception:
             pass
 
-        cmdExtractImages = '"%s" -y -v verbose -ss %s -t %.1f -i "%s" -af "volume=%.1f" "%s"' % (
-            self.conf.GetParam('paths', 'ffmpeg'),
+        cmdExtractImages = '"%s" -y -v verbose -progress pipe:1 -nostats -ss %s -t %.1f -i "%s" -af "volume=%.1f" "%s"' % (
+            settings.GetParam('paths', 'ffmpeg'),
             startTimeStr,
             durationSec,
             audioPath,
@@ -1360,16 +1533,23 @@ class AnimatedGif:
         else:
             return False
 
-    def ExtractFrames(self):
+    def ExtractFrames(self, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
         # self.DeleteResizedImages()
-        self.DeleteExtractedImages()
+        self.ClearPresizedFrames()
+        self.frameStack = None
+        lastManifest = self.frameManifest
+        self.frameManifest = None
+        self.frameStore.Reset()
+        self.mergedFrameCounts = {}
 
-        doDeglitch = False
+        presizeGeometry = None
 
         # Video source?
         if self.SourceIsVideo():
-            startTimeStr = self.conf.GetParam('length', 'starttime')
-            durationSec = float(self.conf.GetParam('length', 'durationsec'))
+            startTimeStr = settings.GetParam('length', 'starttime')
+            durationSec = settings.GetParamFloat('length', 'durationsec')
 
             # User chose random start time
             if startTimeStr.lower() == 'random':
@@ -1379,22 +1559,6 @@ class AnimatedGif:
                     'Pick random start time between 0 and %d ms -> %s' % (vidLenMs, startTimeStr)
                 )
 
-            # Grab the previous second. This is where the error is found
-            if self.conf.GetParamBool('settings', 'fixSlowdownGlitch'):
-                startTimeMs = igf_common.duration_str_to_milliseconds(startTimeStr)
-
-                if startTimeMs > 2000:
-                    startTimeMs = startTimeMs - 2000
-                    startTimeStr = igf_common.milliseconds_to_duration_str(startTimeMs)
-                    durationSec = durationSec + 2.0
-                    doDeglitch = True
-                    logging.info(
-                        'Fixing FPS glitch. New start time: '
-                        + startTimeStr
-                        + '; New duration: '
-                        + str(durationSec)
-                    )
-
             # FFMPEG options (order matters!):
             # -sn: disable subtitles?
             # -t:  duration
@@ -1407,22 +1571,149 @@ class AnimatedGif:
             else:
                 verbosityLevel = 'verbose'  # error"
 
-            cmdExtractImages = '"%s" -v %s -sn -t %.1f -ss %s -i "%s" -r %s "%simage%%04d.png"' % (
-                self.conf.GetParam('paths', 'ffmpeg'),
-                verbosityLevel,
-                durationSec,
-                startTimeStr,
-                self.videoPath,
-                self.conf.GetParam('rate', 'framerate'),
+            frameRate = settings.GetParam('rate', 'framerate')
+            numFrames = int(round(durationSec * settings.GetParamFloat('rate', 'framerate')))
+            startUs = igf_frames.time_str_to_microseconds(startTimeStr)
+
+            # -r on its own emits a burst of back-to-back frames at the start of the clip, which
+            # shows up as a slowdown. The fps filter spaces frames evenly from the first one.
+            # Anchoring its grid at the seek point rather than the first decoded frame keeps
+            # frames on the same grid for any start time
+            rateFilter = ''
+            if settings.GetParamBool('settings', 'fixSlowdownGlitch'):
+                rateFilter = 'fps=%s:round=up:start_time=0,' % (frameRate)
+
+                # The first slot gets the first frame decoded after the seek point rather than
+                # the one on screen at the start time. Seek a slot early and drop that slot
+                prerollUs = igf_frames.get_preroll_microseconds(
+                    settings.GetParamFloat('rate', 'framerate')
+                )
+                if startUs is not None and startUs >= prerollUs:
+                    startTimeStr = igf_frames.microseconds_to_time_str(startUs - prerollUs)
+                    durationSec += prerollUs / igf_frames.US_PER_SEC
+                    rateFilter += 'trim=start_frame=1,setpts=PTS-STARTPTS,'
+
+            presizeGeometry = self.GetPresizeGeometry(settings)
+            frameStack = None
+            if presizeGeometry is None:
+                frameStack = self.GetFrameStack(settings, durationSec)
+
+            def GetExtractCommand(progressPipe):
+                return '"%s" -v %s -progress %s -nostats -sn -t %.3f -ss %s -i "%s" ' % (
+                    settings.GetParam('paths', 'ffmpeg'),
+                    verbosityLevel,
+                    progressPipe,
+                    durationSec,
+                    startTimeStr,
+                    self.videoPath,
+                )
+
+            # Frames extracted to disk with the fps filter sit on a known timestamp grid, so a
+            # later extraction that overlaps this one, or runs at a divisor of its rate, can
+            # reuse them
+            frameManifest = None
+            if (
+                rateFilter
+                and presizeGeometry is None
+                and frameStack is None
+                and startUs is not None
+                and frameRate.isdigit()
+            ):
+                frameManifest = igf_frames.FrameManifest(self.videoPath, int(frameRate), startUs)
+
+            # Frames on the fps filter grid can be counted exactly. Without a cap the slot added
+            # for the preroll can leave one frame too many
+            frameLimit = ''
+            if rateFilter:
+                frameLimit = '-frames:v %d ' % (numFrames)
+
+            extractOutputArgs = ''
+            if rateFilter:
+                extractOutputArgs += '-vf %s ' % (rateFilter.rstrip(','))
+            extractOutputArgs += frameLimit
+            extractOutputArgs += '-r %s ' % (frameRate)
+
+            cmdExtractToDisk = GetExtractCommand('pipe:1') + extractOutputArgs
+            cmdExtractToDisk += '%s"%simage%%04d.png"' % (
+                self.GetExtractedFrameFormat(settings).GetFfmpegOptions(),
                 self.frameDir + os.sep,
             )
+            hashOutput = self.GetFrameHashOutput(extractOutputArgs)
 
-            success = run_process(cmdExtractImages, self.callback)
+            if (
+                frameManifest is not None
+                and lastManifest is not None
+                and self.ExtractFramesIncrementally(
+                    settings, lastManifest, frameManifest, numFrames
+                )
+            ):
+                success = True
+
+            elif presizeGeometry is not None:
+                # One decode writes both the originals and the final size frames, so the crop
+                # and resize stage can be skipped
+                logging.info('Single-pass extraction: ' + presizeGeometry.GetFfmpegFilter())
+                self.DeleteExtractedImages()
+                self.DeleteResizedImages()
+
+                cmdExtractImages = GetExtractCommand('pipe:1') + (
+                    '-filter_complex "[0:v]%ssplit=2[full][small];[small]%s[sized]" '
+                    '-map "[full]" %s-r %s %s"%simage%%04d.png" '
+                    '-map "[sized]" %s-r %s %s"%simage%%04d.%s"'
+                ) % (
+                    rateFilter,
+                    presizeGeometry.GetFfmpegFilter(),
+                    frameLimit,
+                    frameRate,
+                    self.GetExtractedFrameFormat(settings).GetFfmpegOptions(),
+                    self.frameDir + os.sep,
+                    frameLimit,
+                    frameRate,
+                    self.GetFrameFormat(settings).GetFfmpegOptions(),
+                    self.resizeDir + os.sep,
+                    self.GetIntermediaryFrameFormat(settings),
+                )
+
+                success = run_process(cmdExtractImages, self.callback)
+                self.frameDirIndex.Invalidate()
+                self.resizeDirIndex.Invalidate()
+
+            elif frameStack is not None:
+                self.DeleteExtractedImages()
+
+                # Decoded frames come through stdout, so progress goes to stderr
+                cmdExtractImages = GetExtractCommand('pipe:2') + (
+                    '%s-r %s -vf %sscale=%d:%d,setsar=1 -f rawvideo -pix_fmt rgb24 -'
+                ) % (frameLimit, frameRate, rateFilter, frameStack.size[0], frameStack.size[1])
+
+                success = run_process(cmdExtractImages, self.callback, stdoutSink=frameStack.Feed)
+
+                if frameStack.overflow:
+                    logging.info('Frames did not fit in memory. Extracting to disk instead')
+                    success = self.ExtractFramesCached(cmdExtractToDisk, hashOutput)
+                elif success:
+                    success = self.WriteFrameStack(settings, frameStack)
+
+            else:
+                self.DeleteExtractedImages()
+                success = self.ExtractFramesCached(cmdExtractToDisk, hashOutput)
 
             if not success:
                 self.DeleteExtractedImages()
+                if presizeGeometry is not None:
+                    self.DeleteResizedImages()
+            elif presizeGeometry is not None:
+                self.presizedGeometry = presizeGeometry
+            elif frameManifest is not None:
+                try:
+                    extractedFrames = sorted(self.GetExtractedImageList())
+                    frameManifest.SetFrames(0, extractedFrames)
+                    self.frameManifest = frameManifest
+                except OSError:
+                    logging.error('Unable to index extracted frames')
 
         else:  # Sequence
+            self.DeleteExtractedImages()
             resizeArg = ' -resize %dx%d!' % (
                 self.GetVideoWidth(),
                 self.GetVideoHeight(),
@@ -1434,7 +1725,7 @@ class AnimatedGif:
                     cmdConvert = (
                         '"%s" -comment "Importing image seqeuence:%d" -comment "instagiffer" "%s" %s +set date:create +set date:modify "%s%s"'
                         % (
-                            self.conf.GetParam('paths', 'convert'),
+                            settings.GetParam('paths', 'convert'),
                             x * 100 / len(self.imageSequence),
                             self.imageSequence[x],
                             resizeArg,
@@ -1458,13 +1749,14 @@ class AnimatedGif:
                         + "' to png. File not found."
                     )
 
+            self.frameDirIndex.Invalidate()
             self.callback(True)
 
         # Verify we have at least one extracted frame
         if not os.path.exists(self.frameDir + os.sep + 'image0001.png'):
             if self.GetVideoLength() is not None:
                 if igf_common.duration_str_to_milliseconds(
-                    self.conf.GetParam('length', 'starttime')
+                    settings.GetParam('length', 'starttime')
                 ) > igf_common.duration_str_to_milliseconds(self.GetVideoLength()):
                     self.FatalError(
                         'Start time specified is greater than ' + self.GetVideoLength() + '.'
@@ -1476,65 +1768,459 @@ class AnimatedGif:
                     "Unable to extract images. Your start time might be greater than the video's length, which is unknown."
                 )
 
-        # DEGLITCH
-        # Delete the first second's worth of frames
-        if doDeglitch:
-            # self.callback(False, "De-glitch...")
-            deleteCount = 2 * int(self.conf.GetParam('rate', 'framerate'))
+        self.UpdatePresizedSnapshot()
+
+        # This command can take a while. Is it even necessary?
+        # self.CopyFramesToResizeFolder()
+        return True
 
-            logging.info('Deglitch. Remove frames 1 to %d' % deleteCount)
+    def ExtractFramesCached(self, cmdExtractImages, hashOutput=''):
+        """Run an extraction to the frames directory, or load its result from the frame cache.
+        hashOutput is an extra ffmpeg output from GetFrameHashOutput(). It's not part of the
+        cache key, and cached frames come without hashes."""
+        cacheKey = None
+        if self.frameCache is not None:
+            try:
+                sourceId = igf_cache.source_identity(self.videoPath, self.IsDownloadedVideo())
+            except OSError:
+                sourceId = None
 
-            for x in range(1, deleteCount + 1):
-                framePath = self.frameDir + os.sep
-                framePath += 'image%04d.png' % (x)
+            if sourceId is not None:
+                # The command holds every extraction parameter. Leave out the paths, which say
+                # nothing about the frames
+                extractParams = cmdExtractImages.replace(self.frameDir + os.sep, '')
+                extractParams = extractParams.replace(self.videoPath, '')
+                cacheKey = self.frameCache.GetKey(sourceId, extractParams)
 
-                if not os.path.exists(framePath):
-                    self.FatalError('De-glitch failed. Frame not found: ' + framePath)
                 try:
-                    os.remove(framePath)
-                except Exception:  # WindowsError:
-                    self.FatalError('De-glitch failed. Delete failed: ' + framePath)
+                    fetched = self.frameCache.Fetch(cacheKey, self.frameDir, self.callback)
+                except InterruptedError:
+                    # Aborted by the user. Don't go on to decode
+                    self.frameDirIndex.Invalidate()
+                    return False
 
-                self.callback(False)
-                # logging.info("Deglitch: Removed " + framePath)
+                if fetched is not None:
+                    self.frameDirIndex.Invalidate()
+                    self.callback(True)
+                    return True
+
+        self.RemoveFrameHashFile()
+        success = run_process(cmdExtractImages + ' ' + hashOutput, self.callback)
+        self.frameDirIndex.Invalidate()
+        if not success:
+            return False
 
-            # re-numerate after de-glitch
-            if not self.ReEnumerateExtractedFrames():
-                self.FatalError('Failed to re-enumerate frames')
+        if hashOutput:
+            self.LoadFrameHashes(sorted(self.GetExtractedImageList()))
 
-        # This command can take a while. Is it even necessary?
-        # self.CopyFramesToResizeFolder()
+        if cacheKey is not None:
+            self.frameCache.Store(cacheKey, sorted(self.GetExtractedImageList()))
         return True
 
-    def CheckDuplicates(self, cull=False):
-        dupCount = 0
-        hashes = {}
+    def GetFrameHashOutput(self, outputArgs):
+        """ffmpeg output that writes the MD5 of every decoded frame to the frame hash sidecar,
+        as rgb24 like the PNGs hold them. outputArgs are the filter and rate options of the
+        frames output, so both outputs get the same frames from one decode."""
+        return '%s-pix_fmt rgb24 -f framemd5 "%s"' % (outputArgs, self.frameHashFile)
 
-        for imgPath in self.GetExtractedImageList():
-            self.callback(False)
+    def RemoveFrameHashFile(self):
+        # Or ffmpeg asks whether to overwrite it
+        try:
+            os.remove(self.frameHashFile)
+        except OSError:
+            pass
 
-            sha_hash = hashlib.sha256(open(imgPath, 'rb').read()).digest()
+    def LoadFrameHashes(self, fileNames):
+        """Read the frame hash sidecar ffmpeg wrote along with fileNames, one hash per file"""
+        try:
+            with open(self.frameHashFile) as f:
+                hashes = [
+                    line.rsplit(',', 1)[-1].strip()
+                    for line in f
+                    if line.strip() and not line.startswith('#')
+                ]
+        except OSError:
+            return
 
-            if sha_hash in hashes:
-                dupCount += 1
-                hashes[sha_hash].append(imgPath)
+        if len(hashes) != len(fileNames):
+            logging.info(
+                'Got %d frame hashes for %d frames. Ignoring them' % (len(hashes), len(fileNames))
+            )
+            return
 
-                if cull is True:
-                    try:
-                        os.remove(imgPath)
-                        logging.info('Removing duplicate frame: %s' % (imgPath))
-                    except Exception:
-                        logging.error("Can't delete duplicate frame: %s" % (imgPath))
+        for fileName, frameHash in zip(fileNames, hashes, strict=True):
+            try:
+                self.frameHashes[igf_frames.file_identity(fileName)] = frameHash
+            except OSError:
+                pass
+
+    def GetDecodedFrameHashes(self, files):
+        """Decoder hashes of files, or None unless ffmpeg hashed every one of them"""
+        try:
+            hashes = [self.frameHashes.get(igf_frames.file_identity(f)) for f in files]
+        except OSError:
+            return None
+
+        if None in hashes:
+            return None
+        return hashes
+
+    def ExtractFramesIncrementally(self, settings, lastManifest, manifest, numFrames):
+        """Build numFrames frames for manifest from the frames lastManifest describes, decoding
+        only the ones that are missing at either end. A lower frame rate that divides the old
+        one just takes every Nth frame. Returns False if nothing could be reused, in which case
+        the caller extracts everything again."""
+        plan = lastManifest.GetReusePlan(manifest, numFrames)
+        if plan is None:
+            return False
+
+        headCount, reusedIds, tailCount = plan
+
+        # Every file has to be one we extracted. Anything else means frames were imported,
+        # deleted or edited since, and the user expects a fresh set
+        filesById = {}
+        try:
+            for f in self.GetExtractedImageList():
+                filesById[igf_frames.file_identity(f)] = f
+        except OSError:
+            return False
+
+        if set(filesById) != set(lastManifest.fileIds):
+            return False
+
+        logging.info(
+            'Reuse %d extracted frames. Extract %d before and %d after'
+            % (len(reusedIds), headCount, tailCount)
+        )
+
+        frameDir = self.GetExtractedImagesDir()
+
+        def ExtractRange(firstIdx, count, prefix):
+            # Same preroll as a full extraction, see ExtractFrames
+            preroll = 1 if manifest.GetFrameTimeUs(firstIdx - 1) >= 0 else 0
+
+            outputArgs = (
+                '-vf fps=%d:round=up:start_time=0,trim=start_frame=%d,setpts=PTS-STARTPTS '
+                '-frames:v %d -r %d '
+            ) % (manifest.frameRate, preroll, count, manifest.frameRate)
+
+            cmdExtractImages = (
+                '"%s" -v verbose -progress pipe:1 -nostats -sn -ss %s -i "%s" %s%s"%s%s%%04d.png" %s'
+            ) % (
+                settings.GetParam('paths', 'ffmpeg'),
+                igf_frames.microseconds_to_time_str(manifest.GetFrameTimeUs(firstIdx - preroll)),
+                self.videoPath,
+                outputArgs,
+                self.GetExtractedFrameFormat(settings).GetFfmpegOptions(),
+                frameDir,
+                prefix,
+                self.GetFrameHashOutput(outputArgs),
+            )
+
+            self.RemoveFrameHashFile()
+            if not run_process(cmdExtractImages, self.callback):
+                return False
+
+            self.LoadFrameHashes(sorted(glob.glob(frameDir + prefix + '*.png')))
+            return True
+
+        if headCount and not ExtractRange(0, headCount, 'head'):
+            return False
+        if tailCount and not ExtractRange(headCount + len(reusedIds), tailCount, 'tail'):
+            return False
+
+        # The new numbering overlaps the old one, so move reused frames out of the way first.
+        # Frames that were culled as duplicates share a file. Give each its own copy again and
+        # let duplicate detection sort them out
+        movedTo = {}
+        reusedFiles = []
+        try:
+            for fileId in reusedIds:
+                tempName = '%sreuse%04d.png' % (frameDir, len(reusedFiles) + 1)
+                if fileId in movedTo:
+                    shutil.copy(movedTo[fileId], tempName)
+                    if fileId in self.frameHashes:
+                        self.frameHashes[igf_frames.file_identity(tempName)] = self.frameHashes[
+                            fileId
+                        ]
+                else:
+                    shutil.move(filesById.pop(fileId), tempName)
+                    movedTo[fileId] = tempName
+                reusedFiles.append(tempName)
+
+            for f in filesById.values():
+                os.remove(f)
+        except OSError as e:
+            logging.error('Unable to reuse extracted frames: ' + str(e))
+            return False
+
+        # head < reuse < tail, which is the order ReEnumeratePngFrames sorts them in
+        orderedFiles = (
+            sorted(glob.glob(frameDir + 'head*.png'))
+            + reusedFiles
+            + sorted(glob.glob(frameDir + 'tail*.png'))
+        )
+        return self.ReEnumeratePngFrames(self.frameDir, orderedFiles)
+
+    def GetFrameStack(self, settings, durationSec):
+        """Empty stack for rawvideo extraction, or None if that's off or the clip won't fit"""
+        if not settings.GetParamBool('performance', 'rawPipeExtract'):
+            return None
+
+        size = self.GetVideoWidth(), self.GetVideoHeight()
+        maxBytes = settings.GetParamInt('performance', 'rawPipeMaxMB') * 1024 * 1024
+        if min(size) <= 0 or maxBytes <= 0:
+            return None
+
+        frameStack = igf_render.FrameStack(size, maxBytes)
+
+        # ffmpeg can hand out a frame more than duration * rate
+        expectedFrames = math.ceil(durationSec * settings.GetParamFloat('rate', 'framerate')) + 1
+        if expectedFrames * frameStack.frameBytes > maxBytes:
+            logging.info(
+                'Extracting to disk. %d frames need more than %d MB'
+                % (expectedFrames, maxBytes // (1024 * 1024))
+            )
+            return None
+
+        return frameStack
+
+    def WriteFrameStack(self, settings, frameStack):
+        """Write the in-memory frames out as originals for the UI and everything else that
+        works on files"""
+        fileNames = [
+            '%simage%04d.png' % (self.frameDir + os.sep, idx + 1)
+            for idx in range(frameStack.GetNumFrames())
+        ]
+
+        try:
+            compressLevel = self.GetExtractedFrameFormat(settings).pngCompression
+            success = frameStack.WriteFrames(
+                fileNames,
+                self.GetWorkerCount(settings),
+                self.callback,
+                1 if compressLevel is None else compressLevel,
+            )
+
+            # Same hash ffmpeg's framemd5 gives an rgb24 frame
+            for fileId, idx in frameStack.fileIds.items():
+                self.frameHashes[fileId] = frameStack.GetFrameHash(idx)
+        except OSError as e:
+            logging.error('Unable to write extracted frames: ' + str(e))
+            success = False
+
+        self.frameDirIndex.Invalidate()
+        self.callback(True)
+
+        if success:
+            self.frameStack = frameStack
+        return success
+
+    def GetPresizeGeometry(self, settings):
+        """Geometry for single-pass extraction, or None if frames have to go through the crop and
+        resize stage"""
+        if not settings.GetParamBool('performance', 'singlePassExtract'):
+            return None
+
+        # The blend needs the full resolution key frame and mask
+        if settings.GetParamBool('blend', 'cinemagraph'):
+            return None
+
+        geometry = self.GetFrameGeometry(settings)
+        if geometry is None or geometry.GetCropBox() is False or min(geometry.finalSize) <= 0:
+            return None
+
+        return geometry
+
+    def ClearPresizedFrames(self):
+        self.presizedGeometry = None
+        self.presizedSnapshot = None
+
+    def GetExtractedImagesSnapshot(self):
+        """Name, size and modification time of the extracted frames, in animation order"""
+        snapshot = []
+        for f in self.GetExtractedImageList():
+            fileStat = os.stat(f)
+            snapshot.append((os.path.basename(f), fileStat.st_size, fileStat.st_mtime_ns))
+        return snapshot
+
+    def UpdatePresizedSnapshot(self):
+        if self.presizedGeometry is not None:
+            self.presizedSnapshot = self.GetExtractedImagesSnapshot()
+
+    def PresizedFramesValid(self, settings):
+        """True if the resized frames written during extraction are still good. Any change to the
+        crop and resize settings, a cinemagraph blend, or edits to the original frames mean they
+        have to be redone from the originals."""
+        if self.presizedGeometry is None:
+            return False
+
+        if settings.GetParamBool('blend', 'cinemagraph'):
+            return False
 
+        if self.GetFrameGeometry(settings) != self.presizedGeometry:
+            return False
+
+        try:
+            snapshot = self.GetExtractedImagesSnapshot()
+        except OSError:
+            return False
+
+        # Frames reordered since extraction no longer match the resized ones by number
+        if snapshot != self.presizedSnapshot:
+            return False
+
+        sequenceNames = self.frameStore.GetSequenceNames()
+        resizedNames = sorted(os.path.basename(f) for f in self.GetResizedImageList())
+        expectedNames = [
+            os.path.basename(self.GetResizedImagePath(f, sequenceNames, settings))
+            for f in self.GetExtractedImageList()
+        ]
+        return resizedNames == expectedNames
+
+    def RemovePresizedFrame(self, settings, framePath, sequenceNames):
+        """Keep the frames written by single-pass extraction in step with the originals.
+        sequenceNames is the frame order from before any frames were removed."""
+        if self.presizedGeometry is None:
+            return
+
+        resizedPath = self.GetResizedImagePath(framePath, sequenceNames, settings)
+        try:
+            os.remove(resizedPath)
+        except OSError:
+            logging.error("Can't delete resized frame: %s" % (resizedPath))
+
+    def ReEnumeratePresizedFrames(self):
+        """Close the gaps left by RemovePresizedFrame(), so resized frames are numbered in
+        animation order again"""
+        if self.presizedGeometry is None:
+            return True
+        return self.ReEnumeratePngFrames(self.resizeDir, self.GetResizedImageList())
+
+    def GetDuplicateDetectionMode(self, settings):
+        mode = settings.GetParam('settings', 'duplicateFrameDetection').lower()
+        if mode == igf_frames.DUPLICATES_PERCEPTUAL:
+            return mode
+        return igf_frames.DUPLICATES_EXACT
+
+    def GetDuplicateThreshold(self, settings):
+        return settings.GetParamFloat('settings', 'duplicateFrameThreshold', 0.1)
+
+    def CheckDuplicates(self, cull=False, settings=None):
+        """Count duplicate frames and, with cull, delete them.
+
+        In exact mode a frame is a duplicate if it's byte for byte the same as any earlier frame.
+        In perceptual mode it's a duplicate if it looks like the last frame kept, within
+        duplicateFrameThreshold percent, which catches re-encoded video and still stretches of
+        screen captures. Frames are hashed or scaled down on all workers.
+
+        Each culled frame is credited to the frame kept before it, see GetMergedFrameCount().
+        """
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        perceptual = self.GetDuplicateDetectionMode(settings) == igf_frames.DUPLICATES_PERCEPTUAL
+        threshold = self.GetDuplicateThreshold(settings)
+        if perceptual:
+            getFrameKey = igf_frames.luma_signature
+        else:
+            getFrameKey = igf_frames.hash_file
+
+        files = self.GetExtractedImageList()
+        hashes = {}
+        lastKeptPath = None
+        lastKeptKey = None
+        duplicates = []  # (duplicate, its twin, the frame kept before it)
+
+        # Hashes ffmpeg took while extracting save reading the files again. They're only
+        # comparable with each other, so it's all or nothing
+        decodedHashes = None
+        if not perceptual:
+            decodedHashes = self.GetDecodedFrameHashes(files)
+
+        workers = self.GetWorkerCount(settings)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            if decodedHashes is not None:
+                frameKeys = decodedHashes
             else:
-                hashes[sha_hash] = [imgPath]
+                frameKeys = pool.map(getFrameKey, files)
+
+            for imgPath, frameKey in zip(files, frameKeys, strict=True):
+                self.callback(False)
+
+                if perceptual:
+                    twinPath = None
+                    if (
+                        lastKeptKey is not None
+                        and igf_frames.luma_signature_difference(lastKeptKey, frameKey) <= threshold
+                    ):
+                        twinPath = lastKeptPath
+                else:
+                    twinPath = hashes.get(frameKey)
 
-        if cull and dupCount > 0:
-            self.ReEnumerateExtractedFrames()
+                if twinPath is not None:
+                    duplicates.append((imgPath, twinPath, lastKeptPath))
+                    continue
+
+                if not perceptual:
+                    hashes[frameKey] = imgPath
+                lastKeptPath = imgPath
+                lastKeptKey = frameKey
+
+        if cull:
+            # The manifest can only stand a frame in for a byte-identical one
+            if perceptual and len(duplicates) > 0:
+                self.frameManifest = None
+
+            sequenceNames = self.frameStore.GetSequenceNames()
+            for imgPath, twinPath, prevPath in duplicates:
+                if not perceptual:
+                    self.MergeDuplicateFrame(imgPath, twinPath)
+
+                self.CountMergedFrame(prevPath)
+
+                try:
+                    os.remove(imgPath)
+                    logging.info('Removing duplicate frame: %s' % (imgPath))
+                except Exception:
+                    logging.error("Can't delete duplicate frame: %s" % (imgPath))
+
+                self.RemovePresizedFrame(settings, imgPath, sequenceNames)
+
+        if cull and len(duplicates) > 0:
+            self.RescanFrameDirs()
+            self.ReEnumeratePresizedFrames()
+            self.UpdatePresizedSnapshot()
 
         self.callback(True)
 
-        return dupCount
+        return len(duplicates)
+
+    def CountMergedFrame(self, keptPath):
+        try:
+            keptId = igf_frames.file_identity(keptPath)
+        except OSError:
+            return
+        self.mergedFrameCounts[keptId] = self.mergedFrameCounts.get(keptId, 0) + 1
+
+    def GetMergedFrameCount(self, framePath):
+        """Number of duplicate frames culled right after framePath. It should be shown for that
+        many extra frame times to keep the animation's timing."""
+        if not self.mergedFrameCounts:
+            return 0
+        # The frames directory index already has every frame's identity from its last scan
+        return self.mergedFrameCounts.get(self.frameDirIndex.GetFileId(framePath), 0)
+
+    def MergeDuplicateFrame(self, imgPath, keptPath):
+        """Point the manifest's slot for a frame that's about to be deleted at its twin"""
+        if self.frameManifest is None:
+            return
+
+        try:
+            self.frameManifest.MergeDuplicate(
+                igf_frames.file_identity(imgPath), igf_frames.file_identity(keptPath)
+            )
+        except OSError:
+            self.frameManifest = None
 
     def PositionToGravity(self, positionStr):
         # Positioning
@@ -1555,21 +2241,58 @@ class AnimatedGif:
         else:
             raise ValueError('Invalid position to gravity value')
 
-    # png is prefered
-    def GetIntermediaryFrameFormat(self):
-        return 'png'
+    def GetFrameFormat(self, settings):
+        """Format of the resized and processed frames"""
+        name = settings.GetParam('performance', 'intermediateFormat').lower()
+        frameFormat = igf_render.FRAME_FORMATS.get(name)
+        if frameFormat is None:
+            frameFormat = igf_render.FRAME_FORMATS[igf_render.FRAME_FORMAT_PNG]
+
+        # Transparent cinemagraphs need the alpha channel all the way through
+        if not frameFormat.hasAlpha and settings.GetParamBool(
+            'blend', 'cinemagraphUseTransparency'
+        ):
+            frameFormat = igf_render.FRAME_FORMATS[igf_render.FRAME_FORMAT_PNG]
+
+        return frameFormat
+
+    def GetExtractedFrameFormat(self, settings):
+        """Extracted frames stay PNG since they're previewed, edited and exported as they are.
+        Only the compression level follows the intermediate format."""
+        frameFormat = self.GetFrameFormat(settings)
+        if frameFormat.extension != 'png':
+            frameFormat = igf_render.FRAME_FORMATS[igf_render.FRAME_FORMAT_PNG]
+        return frameFormat
+
+    def GetIntermediaryFrameFormat(self, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        return self.GetFrameFormat(settings).extension
+
+    def GetResizedImagePath(self, framePath, sequenceNames=None, settings=None):
+        """Where the crop and resize stage puts an extracted frame. Resized frames are numbered
+        in animation order, so the extracted frames never have to be renamed. Pass
+        frameStore.GetSequenceNames() when looking up many frames."""
+        if sequenceNames is None:
+            sequenceNames = self.frameStore.GetSequenceNames()
+        return (
+            self.GetResizedImagesDir()
+            + sequenceNames[framePath]
+            + '.'
+            + self.GetIntermediaryFrameFormat(settings)
+        )
 
     def GetFinalOutputFormat(self):
         if self.gifOutPath is None:
             return ''
         return igf_paths.get_file_extension(self.gifOutPath)
 
-    def BlitImage(self, layerIdx, beforeFXchain):
+    def BlitImage(self, settings, layerIdx, beforeFXchain):
         cmdProcImage = ''
         layerId = 'imagelayer%d' % (layerIdx)
-        imgPath = self.conf.GetParam(layerId, 'path')
+        imgPath = settings.GetParam(layerId, 'path')
 
-        if self.conf.GetParamBool(layerId, 'applyFx') != beforeFXchain:
+        if settings.GetParamBool(layerId, 'applyFx') != beforeFXchain:
             return ''
 
         if imgPath is None or imgPath == '':
@@ -1578,11 +2301,11 @@ class AnimatedGif:
         if not os.path.exists(imgPath):
             self.FatalError('Unable to find specified image file:\n%s' % (imgPath))
 
-        gravity = self.PositionToGravity(self.conf.GetParam(layerId, 'positioning'))
-        resize = self.conf.GetParam(layerId, 'resize')
-        opacity = self.conf.GetParam(layerId, 'opacity')
-        xNudge = int(self.conf.GetParam(layerId, 'xNudge'))
-        yNudge = int(self.conf.GetParam(layerId, 'yNudge'))
+        gravity = self.PositionToGravity(settings.GetParam(layerId, 'positioning'))
+        resize = settings.GetParam(layerId, 'resize')
+        opacity = settings.GetParam(layerId, 'opacity')
+        xNudge = settings.GetParamInt(layerId, 'xNudge')
+        yNudge = settings.GetParamInt(layerId, 'yNudge')
 
         # -compose dissolve -define compose:args=%d -composite
         cmdProcImage += ' ( "%s"  -resize %d%% ) ' % (imgPath, resize)
@@ -1593,13 +2316,19 @@ class AnimatedGif:
 
         return cmdProcImage
 
-    def CaptionProcessing(self, captionIdx, frameIdx, beforeFXchain, borderOffset):
+    def CaptionProcessing(
+        self, settings, captionIdx, frameIdx, beforeFXchain, borderOffset, frameSize=None
+    ):
+        """convert operators that draw a caption on a frame, as set in the settings snapshot.
+        frameSize is the size of the frame at this point in the chain. With it, and
+        cacheCaptionLayers on, the caption is drawn once into a layer and each frame just
+        composites it at its animated offset."""
         captionId = 'caption%d' % (captionIdx)
         cmdProcImage = ''
 
-        if len(self.conf.GetParam(captionId, 'text')) > 0:
-            fromFrame = int(self.conf.GetParam(captionId, 'frameStart'))
-            toFrame = int(self.conf.GetParam(captionId, 'frameEnd'))
+        if len(settings.GetParam(captionId, 'text')) > 0:
+            fromFrame = settings.GetParamInt(captionId, 'frameStart')
+            toFrame = settings.GetParamInt(captionId, 'frameEnd')
 
             if frameIdx < fromFrame or frameIdx > toFrame:
                 return ''
@@ -1608,114 +2337,50 @@ class AnimatedGif:
             return ''
 
         # tricky please
-        if self.conf.GetParamBool(captionId, 'applyFx') != beforeFXchain:
+        if settings.GetParamBool(captionId, 'applyFx') != beforeFXchain:
             return ''
 
-        opacity = float(self.conf.GetParam(captionId, 'opacity'))  # Starting opacity
+        opacity = settings.GetParamFloat(captionId, 'opacity')  # Starting opacity
         # We need to nudge the font so it doesn't ride up against the edge
         positionAdjX = 0
         positionAdjY = 0
+        # Animated movement on top of that
+        animAdjX = 0
+        animAdjY = 0
         #
         # Time-based effects
         #
 
-        animationEnvelopeName = self.conf.GetParam(captionId, 'animationEnvelope').lower()
+        animationEnvelopeName = settings.GetParam(captionId, 'animationEnvelope').lower()
 
         if animationEnvelopeName != 'off':
-            fps = int(self.conf.GetParam('rate', 'framerate'))
-            animationDuration = 1.0
-
-            if 'slow' in animationEnvelopeName:
-                animationDuration = 2.0
-            if 'medium' in animationEnvelopeName:
-                animationDuration = 1.0
-            if 'fast' in animationEnvelopeName:
-                animationDuration = 0.5
-
-            dutyCycle = float(fps) * animationDuration
-            animStep = int(round(100 / dutyCycle))
-
-            if animStep == 0:
-                animStep = 1
-
-            saw = [x / 100.0 for x in range(0, 101, animStep)]
-            tri = [x / 100.0 for x in range(0, 101, animStep)]
-            squ = ([1.00] * int(dutyCycle)) + ([0.00] * int(dutyCycle))
-
-            if saw[-1] != 1.0:
-                saw.append(1.0)
-
-            if tri[-1] != 1.0:
-                tri.append(1.0)
-
-            if len(squ) == 0:
-                squ = [1.0, 0.0]
-
-            tri = tri + tri[::-1][1:-1]
-            rnd = []
-
-            for _ in range(0, 50):
-                rnd.append(random.randint(0, 100) / 100.0)
-
-            totalTextFrames = 1 + toFrame - fromFrame
-
-            patternEnv = []
-            if 'triangle' in animationEnvelopeName:
-                patternEnv = tri
-            elif 'square' in animationEnvelopeName:
-                patternEnv = squ
-            elif 'random' in animationEnvelopeName:
-                patternEnv = rnd
-            elif 'sawtooth' in animationEnvelopeName:
-                patternEnv = saw
-            else:
-                patternEnv = [1.0]
-
-            # repeat pattern
-            if totalTextFrames > 0:
-                patternEnv = ([op for op in patternEnv * totalTextFrames])[0:totalTextFrames]
-
-            if 'fade' in animationEnvelopeName and 'in' in animationEnvelopeName:
-                for fx in range(0, min(len(saw), len(patternEnv))):
-                    patternEnv[fx] *= saw[fx]
-
-            if 'fade' in animationEnvelopeName and 'out' in animationEnvelopeName:
-                si = 0
-                for fx in range(len(patternEnv) - 1, -1, -1):
-                    patternEnv[fx] *= saw[si]
-                    si += 1
-                    if si >= len(saw):
-                        break
-
-            animationEnv = [0.0] * (fromFrame - 1)
-            animationEnv += patternEnv
-            animationEnv += [0.0] * (self.GetNumFrames() - len(animationEnv))
+            animationEnv = self.GetCaptionEnvelope(settings, captionId, fromFrame, toFrame)
 
             # Animation type: Blink
-            if self.conf.GetParam(captionId, 'animationType').lower() == 'blink':
+            if settings.GetParam(captionId, 'animationType').lower() == 'blink':
                 opacity *= animationEnv[frameIdx - 1]
 
-            if self.conf.GetParam(captionId, 'animationType').lower() == 'left-right':
+            if settings.GetParam(captionId, 'animationType').lower() == 'left-right':
                 moveRange = 50
-                positionAdjX += -moveRange / 2 + (moveRange * animationEnv[frameIdx - 1])
+                animAdjX += -moveRange / 2 + (moveRange * animationEnv[frameIdx - 1])
 
-            if self.conf.GetParam(captionId, 'animationType').lower() == 'up-down':
+            if settings.GetParam(captionId, 'animationType').lower() == 'up-down':
                 moveRange = 50
-                positionAdjY += -moveRange / 2 + (moveRange * animationEnv[frameIdx - 1])
+                animAdjY += -moveRange / 2 + (moveRange * animationEnv[frameIdx - 1])
 
-            if self.conf.GetParam(captionId, 'animationType').lower() == 'subtle change':
+            if settings.GetParam(captionId, 'animationType').lower() == 'subtle change':
                 moveRange = 2
                 moveAmount = -moveRange / 2 + (moveRange * animationEnv[frameIdx - 1])
-                positionAdjY += moveAmount
-                positionAdjX += moveAmount
+                animAdjY += moveAmount
+                animAdjX += moveAmount
                 opacity *= re_scale(animationEnv[frameIdx - 1], (0.0, 1.0), (0.8, 1.0))
 
         if opacity <= 1:
             return ''
 
-        captionText = self.conf.GetParam(captionId, 'text')
-        captionMargin = int(self.conf.GetParam('captiondefaults', 'margin'))
-        gravity = self.PositionToGravity(self.conf.GetParam(captionId, 'positioning'))
+        captionText = settings.GetParam(captionId, 'text')
+        captionMargin = settings.GetParamInt('captiondefaults', 'margin')
+        gravity = self.PositionToGravity(settings.GetParam(captionId, 'positioning'))
 
         if gravity.find('West') != -1 or gravity.find('East') != -1:
             positionAdjX += captionMargin + borderOffset
@@ -1729,20 +2394,20 @@ class AnimatedGif:
         captionText = captionText.replace('"', '\\"')
         captionText = captionText.replace('@', '\\@')
 
-        fontFamily = self.conf.GetParam(captionId, 'font')
-        fontStyle = self.conf.GetParam(captionId, 'style')
+        fontFamily = settings.GetParam(captionId, 'font')
+        fontStyle = settings.GetParam(captionId, 'style')
 
         if self.fonts is None:
             fontId = None
         else:
             fontId = self.fonts.GetFontId(fontFamily, fontStyle)
-        fontSize = int(self.conf.GetParam(captionId, 'size').replace('pt', ''))
-        fontColor = '"%s"' % (self.conf.GetParam(captionId, 'color'))
-        fontOuterColor = '"%s"' % (self.conf.GetParam(captionId, 'outlineColor'))
-        fontOutlineThickness = int(self.conf.GetParam(captionId, 'outlineThickness'))
+        fontSize = int(settings.GetParam(captionId, 'size').replace('pt', ''))
+        fontColor = '"%s"' % (color_setting_arg(settings, captionId, 'color'))
+        fontOuterColor = '"%s"' % (color_setting_arg(settings, captionId, 'outlineColor'))
+        fontOutlineThickness = settings.GetParamInt(captionId, 'outlineThickness')
         fontOpacity = int(opacity)
-        isSmooth = False  # int(self.conf.GetParam(captionId, 'smoothOutline'))
-        hasShadow = int(self.conf.GetParam(captionId, 'dropShadow'))
+        isSmooth = False  # int(settings.GetParam(captionId, 'smoothOutline'))
+        hasShadow = settings.GetParamInt(captionId, 'dropShadow')
 
         fontBlur = ''
         outlineBlur = ''
@@ -1763,13 +2428,27 @@ class AnimatedGif:
         if fontId is None:
             self.FatalError('Unable to find font: %s (%s) ' % (fontFamily, fontStyle))
 
+        cacheLayer = frameSize is not None and settings.GetParamBool(
+            'performance', 'cacheCaptionLayers'
+        )
+
+        # Whole pixels, truncated like -annotate %+d truncates. Both paths use the same numbers,
+        # so a cached layer lands exactly where drawing the caption on the frame would put it
+        animShiftX = int(positionAdjX + animAdjX) - int(positionAdjX)
+        animShiftY = int(positionAdjY + animAdjY) - int(positionAdjY)
+        positionAdjX = int(positionAdjX)
+        positionAdjY = int(positionAdjY)
+        if not cacheLayer:
+            positionAdjX += animShiftX
+            positionAdjY += animShiftY
+
         cmdProcImage += '( +clone -alpha transparent -font %s -pointsize %d -gravity %s ' % (
             fontId,
             fontSize,
             gravity,
         )
 
-        interlineSpacing = int(self.conf.GetParam(captionId, 'interlineSpacing'))
+        interlineSpacing = settings.GetParamInt(captionId, 'interlineSpacing')
 
         if interlineSpacing != 0:
             cmdProcImage += ' -interline-spacing %d ' % (interlineSpacing)
@@ -1821,17 +2500,83 @@ class AnimatedGif:
         if hasShadow:
             cmdProcImage += ' ( +clone -gravity none -background none -shadow 60x1-5-5 ) +swap -compose over -composite '
 
-        cmdProcImage += ' ) -compose dissolve -define compose:args=%d -composite ' % (fontOpacity)
+        cmdProcImage += ' ) '
+
+        if cacheLayer:
+            # Under the caption's gravity, -geometry offsets point the same way as -annotate ones.
+            # Gravity and geometry are reset after, so later operators see neither
+            layerFile = self.GetCaptionLayer(settings, cmdProcImage, frameSize)
+            return (
+                ' ( "%s" ) -gravity %s -geometry %+d%+d -compose dissolve -define compose:args=%d -composite +gravity -geometry +0+0 '
+                % (layerFile, gravity, animShiftX, animShiftY, fontOpacity)
+            )
+
+        cmdProcImage += ' -compose dissolve -define compose:args=%d -composite +gravity ' % (
+            fontOpacity
+        )
         return cmdProcImage
 
-    def CropAndResize(self, argFrameIdx=None):
-        files = glob.glob(self.frameDir + os.sep + '*.png')
-        files.sort()
+    def GetCaptionLayer(self, settings, layerArgs, frameSize):
+        """Transparent frame-sized image with a caption drawn by layerArgs, which are applied to
+        a clone of the frame. Layers are rendered once and kept by what's in them."""
+        layerKey = hashlib.sha256(repr((layerArgs, tuple(frameSize))).encode('utf-8')).hexdigest()
+        layerFile = '%s%scaption_%s.png' % (self.captionDir, os.sep, layerKey[:20])
+
+        self.captionLayersUsed.add(layerFile)
+        if os.path.exists(layerFile):
+            return layerFile
+
+        cmdRenderLayer = (
+            '"%s" -size %dx%d xc:none %s -compose over -composite -comment "instagiffer" "%s"'
+            % (
+                settings.GetParam('paths', 'convert'),
+                frameSize[0],
+                frameSize[1],
+                layerArgs,
+                layerFile,
+            )
+        )
+
+        if not run_process(cmdRenderLayer, self.callback, False, False) or not os.path.exists(
+            layerFile
+        ):
+            self.FatalError('Unable to render caption')
+
+        return layerFile
+
+    def GetCaptionEnvelope(self, settings, captionId, fromFrame, toFrame):
+        """Animation envelope of a caption, built once per ImageProcessing run. The random
+        envelope is seeded by the caption, so it comes out the same every time."""
+        envelopeName = settings.GetParam(captionId, 'animationEnvelope').lower()
+        fps = settings.GetParamInt('rate', 'framerate')
+        envelopeKey = captionId, envelopeName, fps, fromFrame, toFrame
+
+        if envelopeKey not in self.captionEnvelopes:
+            rng = random.Random('%s:%s' % (captionId, settings.GetParam(captionId, 'text')))
+            self.captionEnvelopes[envelopeKey] = build_caption_envelope(
+                envelopeName, fps, fromFrame, toFrame, self.GetNumFrames(), rng
+            )
+
+        return self.captionEnvelopes[envelopeKey]
+
+    def CropAndResize(self, argFrameIdx=None, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        if self.PresizedFramesValid(settings):
+            logging.info('Frames were already cropped and resized during extraction')
+            return True
+
+        # Once any frame is redone here, the ones from extraction can't be trusted anymore
+        self.ClearPresizedFrames()
+
+        files = self.GetExtractedImageList()
+        # Resized and processed frames are named after their place in the animation
+        sequenceNames = self.frameStore.GetSequenceNames()
 
         origWidth = self.GetVideoWidth()
         origHeight = self.GetVideoHeight()
 
-        cinemagraphKeyFrame = int(self.conf.GetParam('blend', 'cinemagraphKeyFrameIdx'))
+        cinemagraphKeyFrame = settings.GetParamInt('blend', 'cinemagraphKeyFrameIdx')
         keyframeFile = files[cinemagraphKeyFrame]
 
         if argFrameIdx is not None:
@@ -1844,31 +2589,42 @@ class AnimatedGif:
             self.DeleteResizedImages()
             frameIdx = 1
 
+        renderer = None
+        if self.GetResizeBackend(settings) == igf_render.RESIZE_BACKEND_PILLOW:
+            geometry = self.GetFrameGeometry(settings)
+            if geometry is not None:
+                renderer = igf_render.PillowFrameRenderer(
+                    geometry, self.frameStack, self.GetFrameFormat(settings)
+                )
+                if not renderer.CanRender():
+                    renderer = None
+
+        jobs = []
+        tasks = []
         for f in files:
             inputFileName = f
-            outputFileName = self.resizeDir + os.sep + os.path.basename(f)
+            outputFileName = self.GetResizedImagePath(f, sequenceNames, settings)
 
-            cmdResize = (
-                '"%s" -comment "Crop and Resize:%d" -comment "instagiffer" "%s" -resize %dx%d! +repage '
-                % (
-                    self.conf.GetParam('paths', 'convert'),
-                    min(len(files), frameIdx - 1) * 100 / len(files),
-                    inputFileName,
-                    origWidth,
-                    origHeight,
-                )
-            )
+            isBlended = frameIdx > 1 and settings.GetParamBool('blend', 'cinemagraph')
+
+            # Blending stays with ImageMagick
+            if renderer is not None and not isBlended:
+                tasks.append((functools.partial(renderer.Render, inputFileName, outputFileName), 1))
+                frameIdx += 1
+                continue
+
+            cmdResize = '"%s" -resize %dx%d! +repage ' % (inputFileName, origWidth, origHeight)
             cmdResize += '  -strip '  # Get rid of weird gamma correction
 
             #
             # Blend: Cinemagraph
             #
 
-            if frameIdx > 1 and self.conf.GetParamBool('blend', 'cinemagraph'):
+            if isBlended:
                 maskFile = self.GetMaskFileName(cinemagraphKeyFrame)
 
                 negation = ''
-                if self.conf.GetParamBool('blend', 'cinemagraphInvert'):
+                if settings.GetParamBool('blend', 'cinemagraphInvert'):
                     negation = ' +negate '
 
                 if os.path.isfile(maskFile):
@@ -1877,7 +2633,7 @@ class AnimatedGif:
                         '-alpha off -compose copy_opacity -composite ) -compose over -composite '
                     )
                     # Transparent cinemagraphs
-                    if self.conf.GetParamBool('blend', 'cinemagraphUseTransparency'):
+                    if settings.GetParamBool('blend', 'cinemagraphUseTransparency'):
                         cmdResize += (
                             f' ( ( "{maskFile}" {negation} ) -fill black -fuzz 0%% +opaque "#ffffff" '
                             '-negate -transparent black -negate ) -compose copy_opacity -composite '
@@ -1887,17 +2643,17 @@ class AnimatedGif:
             # Crop
             #
 
-            if self.conf.GetParam('size', 'cropenabled'):
+            if settings.GetParam('size', 'cropenabled'):
                 cmdResize += (
                     ' +repage '
                     + ' -crop '
-                    + self.conf.GetParam('size', 'cropwidth')
+                    + settings.GetParam('size', 'cropwidth')
                     + 'x'
-                    + self.conf.GetParam('size', 'cropheight')
+                    + settings.GetParam('size', 'cropheight')
                     + '+'
-                    + self.conf.GetParam('size', 'cropoffsetx')
+                    + settings.GetParam('size', 'cropoffsetx')
                     + '+'
-                    + self.conf.GetParam('size', 'cropoffsety')
+                    + settings.GetParam('size', 'cropoffsety')
                     + ' +repage'
                 )
 
@@ -1905,37 +2661,220 @@ class AnimatedGif:
             # Resize
             #
 
-            x, y = self.GetCroppedAndResizedDimensions()
+            x, y = self.GetCroppedAndResizedDimensions(settings)
             cmdResize += ' -resize %dx%d! ' % (x, y)
-            cmdResize += ' "%s" ' % (outputFileName)
-
-            if not run_process(cmdResize, self.callback, False, False):
-                errMsg = 'Image crop, resize, and blend failed or aborted'
-                self.DeleteResizedImages()
-                self.FatalError(errMsg)
-                return False
+            cmdResize += self.GetFrameFormat(settings).GetConvertOptions()
+            jobs.append((cmdResize, outputFileName))
 
             frameIdx += 1
+
+        comment = 'Crop and Resize'
+        workers = self.GetWorkerCount(settings)
+        tasks += self.BuildConvertTasks(settings, jobs, comment, workers)
+
+        if not self.RunFrameTasks(tasks, comment, workers):
+            errMsg = 'Image crop, resize, and blend failed or aborted'
+            self.DeleteResizedImages()
+            self.FatalError(errMsg)
+            return False
+
+        self.resizeDirIndex.Invalidate()
         return True
 
-    def ImageProcessing(self, previewFrameIdx=-1):
+    def GetResizeBackend(self, settings):
+        backend = settings.GetParam('performance', 'resizeBackend').lower()
+        if backend not in igf_render.RESIZE_BACKENDS:
+            backend = igf_render.RESIZE_BACKEND_IMAGEMAGICK
+        return backend
+
+    def GetFrameGeometry(self, settings):
+        """Crop and resize geometry for the current settings, or None if it can't be parsed."""
+        crop = None
+        try:
+            if settings.GetParam('size', 'cropenabled'):
+                crop = [
+                    settings.GetParamInt('size', key, None)
+                    for key in ('cropwidth', 'cropheight', 'cropoffsetx', 'cropoffsety')
+                ]
+                if None in crop:
+                    return None
+            finalSize = self.GetCroppedAndResizedDimensions(settings)
+        except ValueError:
+            return None
+
+        return igf_render.FrameGeometry(
+            (self.GetVideoWidth(), self.GetVideoHeight()), crop, finalSize
+        )
+
+    def GetConvertBatchSize(self, settings):
+        return max(1, settings.GetParamInt('performance', 'convertBatchSize', 1))
+
+    def GetWorkerCount(self, settings):
+        workers = settings.GetParamInt('performance', 'workers', 0)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        return workers
+
+    def GetImageMagickThreadLimit(self, settings, workers):
+        """OpenMP threads each convert may use when workers run side by side. By default the
+        cores are split evenly between workers so we don't oversubscribe the CPU."""
+        threads = settings.GetParamInt('performance', 'imageMagickThreads', 0)
+        if threads <= 0:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+        return threads
+
+    def RunConvertJobs(self, settings, jobs, comment, workers=1):
+        tasks = self.BuildConvertTasks(settings, jobs, comment, workers)
+        return self.RunFrameTasks(tasks, comment, workers)
+
+    def BuildConvertTasks(self, settings, jobs, comment, workers=1):
+        """Turn per-frame convert jobs into tasks for RunFrameTasks.
+
+        Each job is a (frameArgs, outputFileName) tuple, where frameArgs is the input file
+        followed by the operators for that frame. Up to GetConvertBatchSize() frames are chained
+        through a single convert process to save on process startup.
+        """
+        if len(jobs) == 0:
+            return []
+
+        batchSize = self.GetConvertBatchSize(settings)
+        if workers > 1:
+            # Make sure every worker gets something to do
+            batchSize = max(1, min(batchSize, math.ceil(len(jobs) / workers)))
+
+        numBatches = math.ceil(len(jobs) / batchSize)
+        workers = min(workers, numBatches)
+
+        threadLimit = ''
+        if workers > 1:
+            threadLimit = '-limit thread %d ' % (self.GetImageMagickThreadLimit(settings, workers))
+
+        tasks = []
+        for batchStart in range(0, len(jobs), batchSize):
+            cmdConvert = '"%s" %s-comment "%s:%d" -comment "instagiffer" %s' % (
+                settings.GetParam('paths', 'convert'),
+                threadLimit,
+                comment,
+                batchStart * 100 / len(jobs),
+                build_convert_batch_args(jobs[batchStart : batchStart + batchSize]),
+            )
+            task = functools.partial(run_process, cmdConvert, returnOutput=False, callBackFinalize=False)
+            tasks.append((task, min(batchSize, len(jobs) - batchStart)))
+
+        return tasks
+
+    def RunFrameTasks(self, tasks, comment, workers=1):
+        """Run per-frame tasks. A task is a (task, frameCount) tuple, task(callback) does the work
+        for frameCount frames and returns True on success.
+
+        With more than one worker, tasks run concurrently, at most `workers` at a time, and
+        progress is reported from this thread as they complete. A task that raises counts as
+        failed, which aborts the others, so the caller reports it through FatalError.
+        """
+        if len(tasks) == 0:
+            return True
+
+        totalFrames = sum(count for _, count in tasks)
+        workers = min(workers, len(tasks))
+
+        if workers <= 1:
+            framesDone = 0
+            for task, count in tasks:
+                try:
+                    if not task(self.callback):
+                        return False
+                except Exception:
+                    logging.exception('%s: frame task failed' % (comment))
+                    return False
+
+                framesDone += count
+                percent = int(framesDone * 100 / totalFrames)
+                if not self.callback(percent, '%d%% %s' % (percent, comment)):
+                    return False
+            return True
+
+        # The progress callback drives the GUI, so only this thread may call it. Workers just
+        # watch the abort flag, which makes run_process kill the running convert.
+        abortEvent = threading.Event()
+
+        def WorkerCallback(*args):
+            return not abortEvent.is_set()
+
+        success = True
+        framesDone = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(task, WorkerCallback): count for task, count in tasks}
+
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, timeout=0.1, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for future in done:
+                    framesDone += pending.pop(future)
+                    try:
+                        if not future.result():
+                            success = False
+                    except Exception:
+                        logging.exception('%s: frame task failed' % (comment))
+                        success = False
+
+                percent = int(framesDone * 100 / totalFrames)
+                if not self.callback(percent, '%d%% %s' % (percent, comment)):
+                    success = False
+
+                if not success:
+                    abortEvent.set()
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    break
+
+        return success
+
+    def ImageProcessing(self, previewFrameIdx=-1, settings=None):
         # Dump the settings
         # if __release__ == False:
         #     self.conf.Dump()
 
+        # Settings can change in the UI while this runs. Every frame is made from the same ones
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+
         if previewFrameIdx >= 0:
             genPreview = True
             frameIdx = previewFrameIdx + 1
-            files = [self.GetResizedImageList(frameIdx)]
+            files = [self.GetResizedImageList(frameIdx, settings)]
             logging.info('Processing frame %d' % (frameIdx))
         else:
             genPreview = False
             logging.info('Processing frames')
-            files = glob.glob(self.resizeDir + os.sep + '*.png')
-            self.DeleteProcessedImages()
+            files = self.GetResizedImageList()
             frameIdx = 1
 
         files.sort()
+        jobs = []
+        frameKeys = {}
+        self.captionEnvelopes = {}
+
+        frameFormat = self.GetFrameFormat(settings)
+        frameExtension = frameFormat.extension
+        frameFormatArgs = ' -format %s ' % (frameExtension) + frameFormat.GetConvertOptions()
+        isGifOutput = self.GetFinalOutputFormat() == igf_paths.EXT_GIF
+
+        # Caption layers are drawn at the frame size. Resized frames all share one geometry
+        baseFrameSize = None
+        self.captionLayersUsed = set()
+        if (
+            files
+            and settings.GetParamBool('performance', 'cacheCaptionLayers')
+            and any(settings.GetParam('caption%d' % (x), 'text') for x in range(1, 30))
+        ):
+            try:
+                with PIL.Image.open(files[0]) as img:
+                    baseFrameSize = img.size
+            except OSError:
+                baseFrameSize = None
+
         for f in files:
             inputFileName = f
 
@@ -1947,34 +2886,30 @@ class AnimatedGif:
                     + os.sep
                     + os.path.splitext(os.path.basename(f))[0]
                     + '.'
-                    + self.GetIntermediaryFrameFormat()
+                    + frameExtension
                 )
 
             borderOffset = 0
-            if self.conf.GetParamBool('effects', 'border'):
+            if settings.GetParamBool('effects', 'border'):
                 thickness = re_scale(
-                    int(self.conf.GetParam('effects', 'borderAmount')),
+                    settings.GetParamInt('effects', 'borderAmount'),
                     (0, 100),
                     (1, 40),
                 )
                 borderOffset = thickness
 
-            cmdProcImage = (
-                '"%s" -comment "Applying Filters, Effects and Captions:%d" -comment "instagiffer" "%s" '
-                % (
-                    self.conf.GetParam('paths', 'convert'),
-                    min(frameIdx - 1, len(files)) * 100 / len(files),
-                    inputFileName,
-                )
-            )
+            cmdProcImage = '"%s" ' % (inputFileName)
+            frameSize = baseFrameSize
 
             # Pre Filter fonts
             for x in range(1, 30):
-                cmdProcImage += self.CaptionProcessing(x, frameIdx, True, borderOffset)
+                cmdProcImage += self.CaptionProcessing(
+                    settings, x, frameIdx, True, borderOffset, frameSize
+                )
 
             # Pre Filter blits
             for x in range(1, 2):
-                cmdProcImage += self.BlitImage(x, True)
+                cmdProcImage += self.BlitImage(settings, x, True)
 
             #
             # Effects
@@ -1982,31 +2917,31 @@ class AnimatedGif:
 
             # Brightness and contrast (not supported in older versions of Imagemagick)
             if (
-                self.conf.GetParam('effects', 'brightness') != '0'
-                or self.conf.GetParam('effects', 'brightness') != '0'
+                settings.GetParam('effects', 'brightness') != '0'
+                or settings.GetParam('effects', 'brightness') != '0'
             ):
                 cmdProcImage += '-brightness-contrast %sx%s ' % (
-                    self.conf.GetParam('effects', 'brightness'),
-                    self.conf.GetParam('effects', 'contrast'),
+                    settings.GetParam('effects', 'brightness'),
+                    settings.GetParam('effects', 'contrast'),
                 )
 
-            if self.conf.GetParamBool('effects', 'sharpen'):
+            if settings.GetParamBool('effects', 'sharpen'):
                 cmdProcImage += '-sharpen 3 '
 
-            if self.conf.GetParamBool('effects', 'oilPaint'):
+            if settings.GetParamBool('effects', 'oilPaint'):
                 cmdProcImage += '-morphology OpenI Disk:1.75 '
 
-            if self.conf.GetParam('color', 'saturation') != '0':
+            if settings.GetParam('color', 'saturation') != '0':
                 scaledVal = 100 + re_scale(
-                    int(self.conf.GetParam('color', 'saturation')),
+                    settings.GetParamInt('color', 'saturation'),
                     (-100, 100),
                     (-80, 80),
                 )
                 cmdProcImage += '-modulate 100,%d ' % (scaledVal)
 
-            if self.conf.GetParamBool('effects', 'nashville'):
+            if settings.GetParamBool('effects', 'nashville'):
                 amt = re_scale(
-                    int(self.conf.GetParam('effects', 'nashvilleAmount')),
+                    settings.GetParamInt('effects', 'nashvilleAmount'),
                     (0, 100),
                     (10, 65),
                 )
@@ -2022,9 +2957,9 @@ class AnimatedGif:
                 cmdProcImage += ' -contrast -modulate 100,150,100 -auto-gamma '
 
             # Sepia
-            if self.conf.GetParamBool('effects', 'sepiaTone'):
+            if settings.GetParamBool('effects', 'sepiaTone'):
                 scaledVal = re_scale(
-                    int(self.conf.GetParam('effects', 'sepiaToneAmount')),
+                    settings.GetParamInt('effects', 'sepiaToneAmount'),
                     (0, 100),
                     (75, 100),
                 )
@@ -2033,19 +2968,19 @@ class AnimatedGif:
             # Cartoon
             # cmdProcImage += '-edge 1 -negate -normalize -colorspace Gray -blur 0x.5 -contrast-stretch 0x50% '
 
-            if self.conf.GetParamBool('effects', 'colorTint'):
-                color = '"%s"' % (self.conf.GetParam('effects', 'colorTintColor'))
+            if settings.GetParamBool('effects', 'colorTint'):
+                color = '"%s"' % (color_setting_arg(settings, 'effects', 'colorTintColor'))
                 amt = re_scale(
-                    int(self.conf.GetParam('effects', 'colorTintAmount')),
+                    settings.GetParamInt('effects', 'colorTintAmount'),
                     (0, 100),
                     (30, 100),
                 )
                 cmdProcImage += '-fill %s -tint %d ' % (color, amt)
 
             # Fade edges
-            if self.conf.GetParamBool('effects', 'fadeEdges'):
-                rad = 100 - int(self.conf.GetParam('effects', 'fadeEdgeAmount'))
-                sig = 100 - int(self.conf.GetParam('effects', 'fadeEdgeAmount'))
+            if settings.GetParamBool('effects', 'fadeEdges'):
+                rad = 100 - settings.GetParamInt('effects', 'fadeEdgeAmount')
+                sig = 100 - settings.GetParamInt('effects', 'fadeEdgeAmount')
                 rad = re_scale(rad, (0, 100), (20, 60))
                 sig = re_scale(sig, (0, 100), (50, 5000))
                 vx = -30
@@ -2058,22 +2993,22 @@ class AnimatedGif:
                 )
 
             # Blur
-            if int(self.conf.GetParam('effects', 'blur')) > 0:
+            if settings.GetParamInt('effects', 'blur') > 0:
                 rad = 0
-                sig = re_scale(int(self.conf.GetParam('effects', 'blur')), (0, 100), (1, 11))
+                sig = re_scale(settings.GetParamInt('effects', 'blur'), (0, 100), (1, 11))
                 cmdProcImage += '-blur %dx%s ' % (rad, sig)
 
             # Border
             if borderOffset > 0:
-                color = self.conf.GetParam('effects', 'borderColor')
+                color = color_setting_arg(settings, 'effects', 'borderColor')
                 thickness = borderOffset
                 cmdProcImage += '-bordercolor "%s" -border %d ' % (color, thickness)
 
             # Enhancement: Dithering
 
             # misc size optimization -normalize
-            if self.conf.GetParamBool('effects', 'sharpen'):
-                sharpAmount = int(self.conf.GetParam('effects', 'sharpenAmount'))
+            if settings.GetParamBool('effects', 'sharpen'):
+                sharpAmount = settings.GetParamInt('effects', 'sharpenAmount')
                 scaledVal = re_scale(sharpAmount, (0, 100), (0, 5))
                 ditherIdx = 0
 
@@ -2093,45 +3028,109 @@ class AnimatedGif:
                 cmdProcImage += '-dither none '
 
             # Post Filter captions
+            if frameSize is not None:
+                frameSize = frameSize[0] + 2 * borderOffset, frameSize[1] + 2 * borderOffset
+
             for x in range(1, 30):
-                cmdProcImage += self.CaptionProcessing(x, frameIdx, False, borderOffset)
+                cmdProcImage += self.CaptionProcessing(
+                    settings, x, frameIdx, False, borderOffset, frameSize
+                )
 
             # Post Filter blits
             for x in range(1, 2):
-                cmdProcImage += self.BlitImage(x, False)
+                cmdProcImage += self.BlitImage(settings, x, False)
 
             #
             # Colorspace conversion
             #
-            if self.conf.GetParam('color', 'colorspace') != 'CMYK':
+            if settings.GetParam('color', 'colorspace') != 'CMYK':
                 cmdProcImage += '-colorspace %s ' % (
-                    self.conf.GetParam('color', 'colorspace')
+                    settings.GetParam('color', 'colorspace')
                 )  # -matte
 
             # Color palette - gif only
-            if self.GetFinalOutputFormat() == igf_paths.EXT_GIF:
-                cmdProcImage += ' -depth 8 -colors %s ' % (self.conf.GetParam('color', 'numcolors'))
+            if isGifOutput:
+                cmdProcImage += ' -depth 8 -colors %s ' % (settings.GetParam('color', 'numcolors'))
 
-            cmdProcImage += ' -format %s ' % (self.GetIntermediaryFrameFormat())
-            cmdProcImage += '"%s" ' % (outputFileName)
+            cmdProcImage += frameFormatArgs
+            frameIdx += 1
 
-            if not run_process(cmdProcImage, self.callback, False, False):
-                errMsg = 'Image processing failed or aborted'
-                self.DeleteProcessedImages()
-                self.FatalError(errMsg)
-                return False
+            # Frames whose inputs are the same as last time are already done
+            if not genPreview:
+                frameKey = self.GetProcessedFrameKey(settings, cmdProcImage, inputFileName)
+                frameKeys[outputFileName] = frameKey
+                if self.IsProcessedFrameCurrent(outputFileName, frameKey):
+                    continue
 
-            frameIdx += 1
+            jobs.append((cmdProcImage, outputFileName))
+
+        if not genPreview:
+            logging.info(
+                'Processing %d of %d frames. The rest are unchanged' % (len(jobs), len(files))
+            )
+            self.DeleteStaleProcessedImages(frameKeys)
+
+        if not self.RunConvertJobs(
+            settings, jobs, 'Applying Filters, Effects and Captions', self.GetWorkerCount(settings)
+        ):
+            errMsg = 'Image processing failed or aborted'
+            self.DeleteProcessedImages()
+            self.FatalError(errMsg)
+            return False
+
+        self.processedDirIndex.Invalidate()
+
+        if not genPreview:
+            # Layers of captions that have since been edited or removed
+            self.DeleteCaptionLayers(keep=self.captionLayersUsed)
+            self.processedFrameKeys = {
+                fileName: (frameKey, self.processedDirIndex.GetFileId(fileName))
+                for fileName, frameKey in frameKeys.items()
+            }
         return True
 
+    def GetProcessedFrameKey(self, settings, frameArgs, inputFileName):
+        """Identifies everything a processed frame is made from: the convert operators for it,
+        which include the captions shown on that frame and their animation values, and the
+        files those operators read"""
+        inputIds = [self.resizeDirIndex.GetFileId(inputFileName)]
+
+        for layerIdx in range(1, 2):
+            imgPath = settings.GetParam('imagelayer%d' % (layerIdx), 'path')
+            if imgPath:
+                try:
+                    inputIds.append(igf_frames.file_identity(imgPath))
+                except OSError:
+                    inputIds.append(None)
+
+        return hashlib.sha256(repr((frameArgs, inputIds)).encode('utf-8')).hexdigest()
+
+    def IsProcessedFrameCurrent(self, fileName, frameKey):
+        """True if fileName was processed from frameKey and hasn't been touched since"""
+        fileId = self.processedDirIndex.GetFileId(fileName)
+        return fileId is not None and self.processedFrameKeys.get(fileName) == (frameKey, fileId)
+
+    def DeleteStaleProcessedImages(self, frameKeys):
+        """Delete processed frames that no longer have a resized frame to come from"""
+        for f in self.processedDirIndex.GetFiles():
+            if f not in frameKeys:
+                try:
+                    os.remove(f)
+                except OSError:
+                    self.FatalError("Can't delete %s. Is it open in another program?" % (f))
+
+        self.processedDirIndex.Invalidate()
+
     # Generate final output. Returns size of generated GIF in bytes
-    def Generate(self, skipProcessing=False):
+    def Generate(self, skipProcessing=False, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
         err = ''
         fileName = self.GetNextOutputPath()
 
         # Process all frames
         if not skipProcessing:
-            self.ImageProcessing()
+            self.ImageProcessing(settings=settings)
 
         #
         # Now what file format are we dealing with?
@@ -2139,35 +3138,35 @@ class AnimatedGif:
 
         if self.GetFinalOutputFormat() == igf_paths.EXT_GIF:
             # Using convert util
-            cmdCreateGif = '"%s" ' % (self.conf.GetParam('paths', 'convert'))
+            cmdCreateGif = '"%s" -monitor ' % (settings.GetParam('paths', 'convert'))
             # Playback rate and looping
-            cmdCreateGif += ' -delay %d ' % (self.GetGifFrameDelay())
-            cmdCreateGif += ' -loop %d ' % (int(self.conf.GetParam('rate', 'numLoops')))
+            cmdCreateGif += ' -delay %d ' % (self.GetGifFrameDelay(settings=settings))
+            cmdCreateGif += ' -loop %d ' % (settings.GetParamInt('rate', 'numLoops'))
 
-            if self.conf.GetParamBool('blend', 'cinemagraphUseTransparency'):
+            if settings.GetParamBool('blend', 'cinemagraphUseTransparency'):
                 cmdCreateGif += ' -alpha set -dispose %d ' % (
-                    int(self.conf.GetParamBool('blend', 'cinemagraphKeyFrameIdx'))
+                    int(settings.GetParamBool('blend', 'cinemagraphKeyFrameIdx'))
                 )
             else:
                 cmdCreateGif += '-layers optimizePlus '
 
             # Input files
-            cmdCreateGif += (
-                '"' + self.processedDir + os.sep + '*.' + self.GetIntermediaryFrameFormat() + '" '
-            )
+            cmdCreateGif += self.GetGifInputArgs(settings)
             cmdCreateGif += '"' + fileName + '"'
 
             (out, err) = run_process(cmdCreateGif, self.callback, returnOutput=True)
 
         elif self.GetFinalOutputFormat() in ('.mp4', 'webm'):
-            self.ExtractAudioClip()
+            self.ExtractAudioClip(settings)
 
-            secPerFrame = self.GetGifFrameDelay() * 10 / 1000.0
+            secPerFrame = self.GetGifFrameDelay(settings=settings) * 10 / 1000.0
             fps = 1.0 / secPerFrame
             finalFps = 30
             framesDir = self.GetProcessedImagesDir()
 
-            self.ReEnumeratePngFrames(self.GetProcessedImagesDir(), self.GetProcessedImageList())
+            self.ReEnumeratePngFrames(
+                self.GetProcessedImagesDir(), self.GetProcessedImageList(settings)
+            )
 
             #
             # - vf Make width/height even
@@ -2178,18 +3177,18 @@ class AnimatedGif:
             # "e:\ffmpeg\ffmpeg.exe" -r 1/5 -start_number 0 -i "E:\images\01\padlock%3d.png" -c:v libx264 -r 30 -pix_fmt yuv420p e:\out.mp4
 
             cmdConvertToVideo = (
-                '"%s" -v verbose -y -r %.2f -start_number 0 -i "%simage%%04d.%s" '
+                '"%s" -v verbose -progress pipe:1 -nostats -y -r %.2f -start_number 0 -i "%simage%%04d.%s" '
                 % (
-                    self.conf.GetParam('paths', 'ffmpeg'),
+                    settings.GetParam('paths', 'ffmpeg'),
                     fps,
                     framesDir,
-                    self.GetIntermediaryFrameFormat(),
+                    self.GetIntermediaryFrameFormat(settings),
                 )
             )
 
             # Audio
-            if self.conf.GetParamBool('audio', 'audioEnabled'):
-                if not os.path.exists(self.conf.GetParam('audio', 'path')):
+            if settings.GetParamBool('audio', 'audioEnabled'):
+                if not os.path.exists(settings.GetParam('audio', 'path')):
                     self.FatalError('Could not find audio file')
 
                 if self.GetFinalOutputFormat() in ['webm']:
@@ -2197,11 +3196,11 @@ class AnimatedGif:
                 else:
                     audioCodec = 'aac -strict experimental'
 
-                volume = int(self.conf.GetParam('audio', 'volume')) / 100.0
+                volume = settings.GetParamInt('audio', 'volume') / 100.0
 
                 cmdConvertToVideo += ' -ss "%s" -i "%s" -af "volume=%.f" -c:a %s -b:a 128k  ' % (
-                    self.conf.GetParam('audio', 'startTime'),
-                    self.conf.GetParam('audio', 'path'),
+                    settings.GetParam('audio', 'startTime'),
+                    settings.GetParam('audio', 'path'),
                     volume,
                     audioCodec,
                 )
@@ -2232,19 +3231,19 @@ class AnimatedGif:
 
         # Run the gif optimizer
         if self.GetFinalOutputFormat() == 'gif':
-            self.AlterGifFrameTiming(fileName)
-            self.OptimizeGif(fileName)
+            self.AlterGifFrameTiming(settings, fileName)
+            self.OptimizeGif(settings, fileName)
 
         return self.GetSize()
 
-    def AlterGifFrameTiming(self, fileName):
-        frameTimingsStr = self.conf.GetParam('rate', 'customFrameTimingMs')
+    def AlterGifFrameTiming(self, settings, fileName):
+        frameTimingsStr = settings.GetParam('rate', 'customFrameTimingMs')
 
         if len(frameTimingsStr) == 0:
             return
 
         cmdChangeGifTiming = '"%s" "%s" ' % (
-            self.conf.GetParam('paths', 'convert'),
+            settings.GetParam('paths', 'convert'),
             fileName,
         )
 
@@ -2263,16 +3262,16 @@ class AnimatedGif:
         cmdChangeGifTiming += ' "%s"' % (fileName)
         (out, err) = run_process(cmdChangeGifTiming, self.callback, returnOutput=True)
 
-    def OptimizeGif(self, fileName):
+    def OptimizeGif(self, settings, fileName):
         # Run optimizer
-        if self.conf.GetParamBool('size', 'fileOptimizer') and os.path.exists(
-            self.conf.GetParam('paths', 'gifsicle')
+        if settings.GetParamBool('size', 'fileOptimizer') and os.path.exists(
+            settings.GetParam('paths', 'gifsicle')
         ):
             olevel = 3
             beforeSize = self.GetSize()
 
             cmdOptimizeGif = '"%s" -O%d --colors 256 "%s" -o "%s"' % (
-                self.conf.GetParam('paths', 'gifsicle'),
+                settings.GetParam('paths', 'gifsicle'),
                 olevel,
                 fileName,
                 fileName,
@@ -2286,10 +3285,12 @@ class AnimatedGif:
                 'Optimization shaved off %.1f kB' % (float(beforeSize - afterSize) / 1024.0)
             )
 
-    def GenerateFramePreview(self, idx):
+    def GenerateFramePreview(self, idx, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
         idx -= 1
-        self.CropAndResize(idx)
-        self.ImageProcessing(idx)
+        self.CropAndResize(idx, settings)
+        self.ImageProcessing(idx, settings)
         self.callback(True)
         return self.previewFile
 
@@ -2305,16 +3306,70 @@ class AnimatedGif:
         else:
             return 0
 
-    def GetTotalRuntimeSec(self):
-        secPerFrame = (self.GetGifFrameDelay() * 10) / 1000.0
-        totalSec = secPerFrame * self.GetNumFrames()
+    def GetTotalRuntimeSec(self, settings=None):
+        totalSec = (sum(self.GetFrameDelays(settings)) * 10) / 1000.0
         return totalSec
 
-    def GetGifFrameDelay(self, modifyer=None):
+    def GetFrameDelays(self, settings=None):
+        """Delay of each frame in 1/100ths of a second. Frames that stand in for culled
+        duplicates are held for the duplicates' time too."""
+        frameDelay = self.GetGifFrameDelay(settings=settings)
+        return [
+            frameDelay * (1 + self.GetMergedFrameCount(f)) for f in self.GetExtractedImageList()
+        ]
+
+    def GetGifInputArgs(self, settings):
+        """Processed frames for the GIF encoder. When delays differ, frames go in as runs of
+        file name ranges sharing a -delay, rather than one name per frame."""
+        frameFiles = self.GetProcessedImageList(settings)
+        frameDelays = self.GetFrameDelays(settings)
+        ext = self.GetIntermediaryFrameFormat(settings)
+
+        if len(frameDelays) != len(frameFiles):
+            logging.error(
+                '%d processed frames for %d frame delays. Held frames play at the normal rate'
+                % (len(frameFiles), len(frameDelays))
+            )
+            return '"%s%s*.%s" ' % (self.processedDir, os.sep, ext)
+
+        if len(set(frameDelays)) <= 1:
+            return '"%s%s*.%s" ' % (self.processedDir, os.sep, ext)
+
+        # Processed frames are numbered in animation order. Consecutive numbers with the same
+        # delay make a range. Anything else goes in by name
+        runs = []  # [delay, first number, last number, file name]
+        for fileName, delay in zip(frameFiles, frameDelays, strict=True):
+            number = igf_frames.get_frame_number(fileName)
+            if runs and number is not None:
+                lastRun = runs[-1]
+                if lastRun[0] == delay and lastRun[2] is not None and lastRun[2] + 1 == number:
+                    lastRun[2] = number
+                    continue
+            runs.append([delay, number, number, fileName])
+
+        inputArgs = ''
+        for delay, first, last, fileName in runs:
+            if first is None or first == last:
+                inputArgs += '-delay %d "%s" ' % (delay, fileName)
+            else:
+                inputArgs += '-delay %d "%s%simage%%04d.%s[%d-%d]" ' % (
+                    delay,
+                    self.processedDir,
+                    os.sep,
+                    ext,
+                    first,
+                    last,
+                )
+
+        return inputArgs
+
+    def GetGifFrameDelay(self, modifyer=None, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
         if modifyer is None:
-            modifyer = int(self.conf.GetParam('rate', 'speedmodifier'))
+            modifyer = settings.GetParamInt('rate', 'speedmodifier')
 
-        timePerFrame = 100 // int(self.conf.GetParam('rate', 'framerate'))
+        timePerFrame = 100 // settings.GetParamInt('rate', 'framerate')
         speedModification = modifyer
         normalizedMod = 1 + (abs(speedModification) - 0) * (timePerFrame - 0) / (10 - 0)
         gifFrameDelay = timePerFrame
@@ -2357,12 +3412,12 @@ class AnimatedGif:
     def CompatibilityWarningsEnabled(self):
         return self.conf.GetParamBool('warnings', 'socialMedia')
 
-    def GetCroppedAndResizedDimensions(self):
-        w, h = self.conf.GetParam('size', 'resizePostCrop').split('x')
+    def GetCroppedAndResizedDimensions(self, settings):
+        w, h = settings.GetParam('size', 'resizePostCrop').split('x')
         return int(w), int(h)
 
     def GetCompatibilityWarning(self):
-        w, h = self.GetCroppedAndResizedDimensions()
+        w, h = self.GetCroppedAndResizedDimensions(self.conf.GetSnapshot())
         aspectRatio = w / float(h)
 
         warnings = ''
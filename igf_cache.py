@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+
+TEMP_PREFIX = 'tmp-'
+STALE_TEMP_SEC = 3600
+SAMPLE_SIZE = 65536
+
+
+def source_identity(path, sampled=False):
+    """Identify a source file. Path, size and modification time are enough for the user's own
+    files. Downloads get rewritten whenever they're fetched again, so for those sample the content
+    instead."""
+    fileStat = os.stat(path)
+    if not sampled:
+        return '%s|%d|%d' % (os.path.abspath(path), fileStat.st_size, fileStat.st_mtime_ns)
+
+    contentHash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for offset in (0, fileStat.st_size // 2, max(0, fileStat.st_size - SAMPLE_SIZE)):
+            f.seek(offset)
+            contentHash.update(f.read(SAMPLE_SIZE))
+
+    return '%d|%s' % (fileStat.st_size, contentHash.hexdigest())
+
+
+class FrameCache:
+    """Extracted frames kept across sessions, keyed by the source and how it was extracted.
+
+    Entries are directories named after their key. They are built under a temporary name and
+    renamed into place, and removed by renaming them away first, so several Instagiffer processes
+    can share the cache without locking. Entries are evicted least recently used first once the
+    cache grows past maxBytes.
+    """
+
+    def __init__(self, root, maxBytes):
+        self.root = root
+        self.maxBytes = maxBytes
+
+    def GetKey(self, *parts):
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def GetEntryDir(self, key):
+        return os.path.join(self.root, key)
+
+    def Fetch(self, key, destDir, callback=None):
+        """Copy a cached entry's frames into destDir. Returns the new file names, or None on a miss.
+        Raises InterruptedError if callback aborts the copy"""
+        entryDir = self.GetEntryDir(key)
+        try:
+            names = sorted(os.listdir(entryDir))
+            os.utime(entryDir)
+        except OSError:
+            return None
+
+        copied = []
+        try:
+            for name in names:
+                fileName = os.path.join(destDir, name)
+                shutil.copyfile(os.path.join(entryDir, name), fileName)
+                copied.append(fileName)
+
+                percent = int(len(copied) * 100 / len(names))
+                message = '%d%% Loading cached frames' % (percent)
+                if callback is not None and not callback(percent, message):
+                    raise InterruptedError('Aborted')
+        except OSError as e:
+            # Evicted by another process while we were at it, or aborted
+            logging.info('Frame cache entry %s unavailable: %s' % (key, e))
+            for fileName in copied:
+                try:
+                    os.remove(fileName)
+                except OSError:
+                    pass
+
+            if isinstance(e, InterruptedError):
+                raise
+            return None
+
+        logging.info('Loaded %d frames from cache entry %s' % (len(copied), key))
+        return copied
+
+    def Store(self, key, fileNames):
+        if len(fileNames) == 0 or self.maxBytes <= 0:
+            return False
+
+        entryDir = self.GetEntryDir(key)
+        if os.path.isdir(entryDir):
+            return True
+
+        tempDir = os.path.join(self.root, TEMP_PREFIX + uuid.uuid4().hex)
+        try:
+            os.makedirs(tempDir)
+            for fileName in fileNames:
+                shutil.copyfile(fileName, os.path.join(tempDir, os.path.basename(fileName)))
+            os.rename(tempDir, entryDir)
+        except OSError as e:
+            # Another process may have stored the same entry first
+            logging.info('Frame cache entry %s not stored: %s' % (key, e))
+            shutil.rmtree(tempDir, ignore_errors=True)
+            return False
+
+        self.Evict()
+        return True
+
+    def Evict(self):
+        entries = []
+        now = time.time()
+
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.stat(path).st_mtime
+                if name.startswith(TEMP_PREFIX):
+                    # Left behind by a process that died mid-store
+                    if now - mtime > STALE_TEMP_SEC:
+                        self.Remove(path)
+                    continue
+
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+            except OSError:
+                continue
+
+            entries.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            logging.info('Evict frame cache entry ' + os.path.basename(path))
+            self.Remove(path)
+            total -= size
+
+    def Remove(self, path):
+        trashDir = os.path.join(self.root, TEMP_PREFIX + uuid.uuid4().hex)
+        try:
+            os.rename(path, trashDir)
+        except OSError:
+            return  # Somebody else got to it
+        shutil.rmtree(trashDir, ignore_errors=True)
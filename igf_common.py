@@ -1,14 +1,20 @@
 import configparser
+import functools
+import hashlib
 import locale
 import logging
 import os
 import re
+import selectors
 import shlex
+import string
 import subprocess
 import sys
 import time
-from queue import Queue
+from collections import deque
+from queue import Empty, Queue
 from threading import Thread
+from types import MappingProxyType
 
 __release__ = True
 IM_A_MAC = sys.platform == 'darwin'
@@ -23,6 +29,70 @@ __version__ = INSTAGIFFER_VERSION + INSTAGIFFER_PRERELEASE
 __changelogUrl__ = 'http://instagiffer.com/post/146636589471/instagiffer-175-macpc'
 __faqUrl__ = 'http://www.instagiffer.com/post/51787746324/frequently-asked-questions'
 DEFAULT_FONT = 'Impact'
+# How often run_process reports to its callback while a process is running quietly
+CALLBACK_INTERVAL_SEC = 0.1
+PIPE_READ_SIZE = 65536
+# Only the tail end of a process' output is kept around for returnOutput and logging
+MAX_CAPTURED_LINES = 1000
+LINE_RE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)')
+YOUTUBE_DL_PROGRESS_RE = re.compile(r'\[download\]\s+([0-9\.]+)% of')
+FFMPEG_PROGRESS_RE = re.compile(r'^out_time=(\d+):(\d+):(\d+\.\d+)')
+FFMPEG_STATS_RE = re.compile(r'frame=.+time=(\d+):(\d+):(\d+\.\d+)')
+IM_MONITOR_RE = re.compile(r'^(.+?)(?:\[.*\])?: \d+ of \d+, (\d+)% complete')
+
+
+def resolve_param_value(value):
+    """What GetParam makes of a value from the config file"""
+    # Expand variables
+    try:
+        value = os.path.expandvars(value)
+    except Exception:
+        pass
+
+    if value.startswith(';'):
+        value = ''
+
+    return value
+
+
+def param_to_bool(val):
+    boolVal = True
+
+    if isinstance(val, int):
+        boolVal = not (val == 0)
+    elif val is None:
+        boolVal = False
+    elif val == '':
+        boolVal = False
+    elif val.lower() == 'false' or val == '0':
+        boolVal = False
+
+    return boolVal
+
+
+def param_to_int(val, default=0):
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return default
+
+
+def param_to_color(val):
+    """(r, g, b) or (r, g, b, a) of a #rgb, #rrggbb or #rrggbbaa colour, None if val isn't one"""
+    if not isinstance(val, str) or not val.startswith('#'):
+        return None
+
+    digits = val[1:]
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    if len(digits) not in (6, 8) or any(digit not in string.hexdigits for digit in digits):
+        return None
+
+    return tuple(int(digits[i : i + 2], 16) for i in range(0, len(digits), 2))
+
+
+def color_to_hex(color):
+    return '#' + ''.join('%02x' % (channel) for channel in color)
 
 
 class InstaConfig:
@@ -32,6 +102,7 @@ class InstaConfig:
     def __init__(self, configPath):
         self.path = configPath
         self.config: None | configparser.ConfigParser = None
+        self.snapshot = None
 
         # Load configuration file
         if not os.path.exists(self.path):
@@ -41,6 +112,7 @@ class InstaConfig:
 
     def ReloadFromFile(self):
         self.config = None
+        self.snapshot = None
         self.config = configparser.ConfigParser()
         self.config.read(self.path)
 
@@ -73,36 +145,36 @@ class InstaConfig:
 
         # We are dealing with strings or unicode
 
-        # Expand variables
-        try:
-            retVal = os.path.expandvars(retVal)
-        except Exception:
-            pass
-
         # Config file encoding is UTF-8
         # if not isinstance(retVal, unicode):
         if not isinstance(retVal, str):
             retVal = str(retVal, 'utf-8')
 
-        if retVal.startswith(';'):
-            retVal = ''
+        return resolve_param_value(retVal)
+
+    def GetSectionNames(self):
+        if self.config is None:
+            return []
+        return self.config.sections()
 
-        return retVal
+    def GetSectionItems(self, category):
+        """(key, value) pairs of a section, uninterpolated"""
+        if self.config is None or category.lower() not in self.config:
+            return []
+        return self.config.items(category.lower(), raw=True)
 
     def GetParamBool(self, category, key):
-        val = self.GetParam(category, key)
-        boolVal = True
+        return param_to_bool(self.GetParam(category, key))
 
-        if isinstance(val, int):
-            boolVal = not (val == 0)
-        elif val is None:
-            boolVal = False
-        elif val == '':
-            boolVal = False
-        elif val.lower() == 'false' or val == '0':
-            boolVal = False
+    def GetParamInt(self, category, key, default=0):
+        return param_to_int(self.GetParam(category, key), default)
 
-        return boolVal
+    def GetSnapshot(self):
+        """ConfigSnapshot of the current settings. The same one is handed out until a setting
+        changes."""
+        if self.snapshot is None:
+            self.snapshot = ConfigSnapshot(self)
+        return self.snapshot
 
     def SetParam(self, category, key, value):
         if self.config is None:
@@ -120,6 +192,7 @@ class InstaConfig:
             value = str(value)
 
         self.config[category.lower()][key.lower()] = value
+        self.snapshot = None
         return 1
 
     def SetParamBool(self, category, key, value):
@@ -163,44 +236,176 @@ class InstaConfig:
         logging.info('===============================================================')
 
 
+class ConfigSnapshot:
+    """Read-only copy of an InstaConfig's settings, from InstaConfig.GetSnapshot().
+
+    Every value is resolved the way InstaConfig.GetParam resolves it, and parsed as a boolean,
+    a number and a colour, when the snapshot is taken. Reading a setting is a dict lookup, and
+    a stage that gets handed a snapshot sees the same settings from start to end, whatever the
+    UI changes meanwhile. GetHash() identifies the settings, for use as a cache key.
+    """
+
+    __slots__ = ('values', 'bools', 'ints', 'floats', 'colors', 'hash')
+
+    def __init__(self, config):
+        values = {}
+        for section in config.GetSectionNames():
+            for key, value in config.GetSectionItems(section):
+                try:
+                    value = config.GetParam(section, key)
+                except configparser.Error:
+                    value = resolve_param_value(value)  # Stray '%', as in fuzz=0%
+                values[section.lower(), key.lower()] = value
+
+        ints = {}
+        floats = {}
+        for paramKey, value in values.items():
+            try:
+                ints[paramKey] = int(value)
+            except ValueError:
+                pass
+            try:
+                floats[paramKey] = float(value)
+            except ValueError:
+                pass
+
+        colors = {}
+        for paramKey, value in values.items():
+            color = param_to_color(value)
+            if color is not None:
+                colors[paramKey] = color
+
+        bools = {paramKey: param_to_bool(value) for paramKey, value in values.items()}
+
+        object.__setattr__(self, 'values', MappingProxyType(values))
+        object.__setattr__(self, 'bools', MappingProxyType(bools))
+        object.__setattr__(self, 'ints', MappingProxyType(ints))
+        object.__setattr__(self, 'floats', MappingProxyType(floats))
+        object.__setattr__(self, 'colors', MappingProxyType(colors))
+        object.__setattr__(
+            self,
+            'hash',
+            hashlib.sha256(repr(sorted(values.items())).encode('utf-8')).hexdigest(),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ConfigSnapshot is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('ConfigSnapshot is read-only')
+
+    def GetHash(self):
+        return self.hash
+
+    def GetParamKey(self, category, key):
+        """Where a setting is stored, taking platform specific sections into account"""
+        paramKey = category.lower(), key.lower()
+        if paramKey in self.values:
+            return paramKey
+        return paramKey[0] + '-' + sys.platform, paramKey[1]
+
+    def GetParam(self, category, key):
+        return self.values.get(self.GetParamKey(category, key), '')
+
+    def GetParamBool(self, category, key):
+        return self.bools.get(self.GetParamKey(category, key), False)
+
+    def GetParamInt(self, category, key, default=0):
+        return self.ints.get(self.GetParamKey(category, key), default)
+
+    def GetParamFloat(self, category, key, default=0.0):
+        return self.floats.get(self.GetParamKey(category, key), default)
+
+    def GetParamColor(self, category, key):
+        """(r, g, b) or (r, g, b, a) of a colour setting. None if it's not a #hex colour"""
+        return self.colors.get(self.GetParamKey(category, key))
+
+    def GetSectionNames(self):
+        return sorted({section for section, _ in self.values})
+
+    def GetSectionItems(self, category):
+        category = category.lower()
+        return [
+            (key, value) for (section, key), value in self.values.items() if section == category
+        ]
+
+
+class OutputLineBuffer:
+    """Splits a process output stream into lines and only keeps the last maxLines of them."""
+
+    def __init__(self, maxLines=MAX_CAPTURED_LINES):
+        self.lines = deque(maxlen=maxLines)
+        self.partial = ''
+
+    def Feed(self, text):
+        """Add a chunk of output. Returns the lines it completed."""
+        self.partial += text
+        newLines = LINE_RE.findall(self.partial)
+        consumed = sum(len(line) for line in newLines)
+        self.partial = self.partial[consumed:]
+
+        # Someone is printing a very long line without ever ending it
+        if len(self.partial) > PIPE_READ_SIZE:
+            newLines.append(self.partial)
+            self.partial = ''
+
+        self.lines.extend(newLines)
+        return newLines
+
+    def GetText(self):
+        return ''.join(self.lines) + self.partial
+
+
+@functools.lru_cache(maxsize=8)
+def command_progress(cmd):
+    """imagemagick - figure out what we're doing based on comments in the command line."""
+    imSearch = re.search(r'^"?.+(convert\.exe|convert)"?.+-comment"? "([^"]+):(-?\d+)"', cmd)
+    if not imSearch:
+        return None, False
+
+    n = int(imSearch.group(3))
+    if n == -1:
+        return '%s' % (imSearch.group(2)), False
+
+    return '%d%% %s' % (n, imSearch.group(2)), n
+
+
 def default_output_handler(stdoutLines, stderrLines, cmd):
-    """Convert process output to status bar messages.
+    """Convert new lines of process output to status bar messages.
     There is some cross-cutting here.
     """
     s = None
     i = False
 
-    for outData in [stdoutLines, stderrLines, cmd]:
-        if outData is None or len(outData) == 0:
-            continue
-
-        if IM_A_MAC and isinstance(outData, list):
-            outData = ' '.join('"{0}"'.format(arg) for arg in outData)
-        else:
-            outData = ' '.join('"{0}"'.format(arg) for arg in outData)
-
+    for line in (stdoutLines or []) + (stderrLines or []):
         # youtube dl
-        youtubeDlSearch = re.search(r'\[download\]\s+([0-9\.]+)% of', outData, re.MULTILINE)
+        youtubeDlSearch = YOUTUBE_DL_PROGRESS_RE.search(line)
         if youtubeDlSearch:
             i = int(float(youtubeDlSearch.group(1)))
             s = 'Downloaded %d%%...' % (i)
+            continue
 
-        # ffmpeg frame extraction progress
-        ffmpegSearch = re.search(r'frame=.+time=(\d+:\d+:\d+\.\d+)', outData, re.MULTILINE)
+        # ffmpeg -progress pipe:1 reports and regular stats lines
+        ffmpegSearch = FFMPEG_PROGRESS_RE.search(line) or FFMPEG_STATS_RE.search(line)
         if ffmpegSearch:
-            secs = duration_str_to_milliseconds(ffmpegSearch.group(1))
-            s = 'Extracted %.1f seconds...' % (secs / 1000.0)
+            h, m, sec = ffmpegSearch.groups()
+            secs = int(h) * 3600 + int(m) * 60 + float(sec)
+            s = 'Extracted %.1f seconds...' % (secs)
+            continue
 
-        # imagemagick - figure out what we're doing based on comments
-        imSearch = re.search(r'^".+(convert\.exe|convert)".+-comment"? "([^"]+):(\d+)"', outData)
-        if imSearch:
-            n = int(imSearch.group(3))
+        # imagemagick -monitor
+        imMonitorSearch = IM_MONITOR_RE.search(line)
+        if imMonitorSearch:
+            i = int(imMonitorSearch.group(2))
+            s = '%d%% %s' % (i, imMonitorSearch.group(1))
 
-            if n == -1:
-                s = '%s' % (imSearch.group(2))
-            else:
-                i = n
-                s = '%d%% %s' % (i, imSearch.group(2))
+    if cmd:
+        if isinstance(cmd, list):
+            cmd = ' '.join('"{0}"'.format(arg) for arg in cmd)
+
+        cmdStatus, cmdPercent = command_progress(cmd)
+        if cmdStatus is not None:
+            s, i = cmdStatus, cmdPercent
 
     return s, i
 
@@ -211,7 +416,13 @@ def run_process(
     returnOutput=False,
     callBackFinalize=True,
     outputTranslator=default_output_handler,
+    stdoutSink=None,
 ):
+    """Run cmd and report progress through callback until it exits.
+
+    If stdoutSink is given, it gets the process's raw stdout bytes instead of them being decoded
+    and captured. Returning False from it kills the process, just like the callback.
+    """
     if not __release__:
         logging.info('Running Command: ' + cmd)
     try:
@@ -243,8 +454,6 @@ def run_process(
         startupinfo = None
         cmd = shlex.split(cmd)
 
-    logging.info('z')
-
     pipe = subprocess.Popen(
         cmd,
         startupinfo=startupinfo,
@@ -252,77 +461,69 @@ def run_process(
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         env=env,
-        bufsize=1,
         close_fds=ON_POSIX,
     )
-    qOut = Queue()
-    qErr = Queue()
-    tOut = Thread(target=enqueue_process_output, args=('OUT', pipe.stdout, qOut))
-    tErr = Thread(target=enqueue_process_output, args=('ERR', pipe.stderr, qErr))
 
-    tOut.start()
-    tErr.start()
-
-    logging.info('a')
     callbackReturnedFalse = False
+    sinkReturnedFalse = False
 
-    stdout = ''
-    stderr = ''
+    stdout = OutputLineBuffer()
+    stderr = OutputLineBuffer()
+    newStdout = []
+    newStderr = []
 
     percent = None
+    lastCallbackTs = 0.0
+    outputEvents = iter_process_output(pipe)
+
+    # The first round goes out before any output arrives so short-lived processes still give
+    # the caller a chance to update the GUI and abort.
+    stdoutChunk, stderrChunk = None, None
     while True:
-        statusStr = None
-        stderrLines = None
-        stdoutLines = None
-        logging.info('b')
+        if stdoutChunk is not None:
+            if stdoutSink is not None:
+                sinkReturnedFalse = not stdoutSink(stdoutChunk)
+            else:
+                newStdout += stdout.Feed(decode_process_output(stdoutChunk))
+        if stderrChunk is not None:
+            newStderr += stderr.Feed(decode_process_output(stderrChunk))
 
-        try:
-            while True:  # Exhaust the queue
-                stdoutLines = qOut.get_nowait()
-                stdout += str(stdoutLines)
-        except Exception:
-            pass
+        # Output can arrive in bursts. Don't hammer the GUI more often than the polling loop used to
+        now = time.monotonic()
+        if lastCallbackTs == 0.0 or now - lastCallbackTs >= CALLBACK_INTERVAL_SEC:
+            lastCallbackTs = now
+            statusStr = None
+            percentDoneInt = percent
 
-        try:
-            while True:
-                stderrLines = qErr.get_nowait()
-                stderr += str(stderrLines)
-        except Exception:
-            pass
-
-        logging.info('c')
-        if outputTranslator is not None:
-            # try:
-            logging.info('d')
-            statusStr, percentDoneInt = outputTranslator(stdoutLines, stderrLines, cmd)
-            logging.info('d')
-
-            if isinstance(percentDoneInt, int):
-                percent = percentDoneInt
-            elif percent is not None:
-                percentDoneInt = percent
-            logging.info('e')
-
-            # except Exception:
-            #    pass
-
-        # Caller wants to abort!
-        if callback is not None and not callback(percentDoneInt, statusStr):
+            if outputTranslator is not None:
+                statusStr, percentDoneInt = outputTranslator(newStdout, newStderr, cmd)
+
+                if isinstance(percentDoneInt, int):
+                    percent = percentDoneInt
+                elif percent is not None:
+                    percentDoneInt = percent
+
+            newStdout = []
+            newStderr = []
+
+            # Caller wants to abort!
+            if callback is not None and not callback(percentDoneInt, statusStr):
+                callbackReturnedFalse = True
+
+        if callbackReturnedFalse or sinkReturnedFalse:
             try:
                 pipe.terminate()
                 pipe.kill()
             except Exception:
                 logging.error('RunProcess: kill() or terminate() caused an exception')
-
-            callbackReturnedFalse = True
             break
-        logging.info('f')
 
-        # Check if done
-        if pipe.poll() is not None:
+        try:
+            stdoutChunk, stderrChunk = next(outputEvents)
+        except StopIteration:
             break
 
-        time.sleep(0.1)  # Polling frequency. Lengthening this will decrease responsiveness
+    outputEvents.close()
 
     # Notify callback of exit. Check callballFinalize so we don't prematurely reset the progress bar
     if callback is not None and callBackFinalize is True:
@@ -332,18 +533,23 @@ def run_process(
     if callbackReturnedFalse:
         logging.error('RunProcess was aborted by caller')
         # return False
+    if sinkReturnedFalse:
+        logging.error('RunProcess: output was rejected')
 
     # result
     try:
-        remainingStdout = ''
-        remainingStderr = ''
         remainingStdout, remainingStderr = pipe.communicate()
-    except OSError as error:
+        if stdoutSink is None:
+            stdout.Feed(decode_process_output(remainingStdout))
+        elif remainingStdout and not sinkReturnedFalse:
+            stdoutSink(remainingStdout)
+        stderr.Feed(decode_process_output(remainingStderr))
+    except (OSError, ValueError) as error:
         logging.error('Encountered error communicating with sub-process' + str(error))
 
-    success = pipe.returncode == 0
-    stdout += str(remainingStdout)
-    stderr += str(remainingStderr)
+    success = pipe.returncode == 0 and not sinkReturnedFalse
+    stdout = stdout.GetText()
+    stderr = stderr.GetText()
 
     # Logging
     if not __release__:
@@ -360,10 +566,82 @@ def run_process(
         return success
 
 
+def decode_process_output(data):
+    if not data:
+        return ''
+    return data.decode(locale.getpreferredencoding(False), errors='replace')
+
+
+def iter_process_output(pipe, timeout=CALLBACK_INTERVAL_SEC):
+    """Yield (stdout, stderr) byte chunks as soon as the process writes them, or (None, None)
+    when it stays quiet for `timeout` seconds. Ends when the process has exited."""
+    if ON_POSIX:
+        streams = _iter_pipes_select(pipe, timeout)
+    else:
+        streams = _iter_pipes_threaded(pipe, timeout)
+
+    yield from streams
+
+    # Output closed, but the process might still be running
+    while True:
+        try:
+            pipe.wait(timeout)
+            return
+        except subprocess.TimeoutExpired:
+            yield None, None
+
+
+def _iter_pipes_select(pipe, timeout):
+    with selectors.DefaultSelector() as selector:
+        selector.register(pipe.stdout, selectors.EVENT_READ, 'OUT')
+        selector.register(pipe.stderr, selectors.EVENT_READ, 'ERR')
+
+        while selector.get_map():
+            chunks = {'OUT': None, 'ERR': None}
+
+            for key, _ in selector.select(timeout):
+                data = os.read(key.fd, PIPE_READ_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                chunks[key.data] = (chunks[key.data] or b'') + data
+
+            yield chunks['OUT'], chunks['ERR']
+
+
+def _iter_pipes_threaded(pipe, timeout):
+    """Windows can't select() on pipes. Readers push into a single queue instead, which we
+    block on, so we still wake up as soon as anything happens."""
+    qOut = Queue()
+    for streamId, stream in (('OUT', pipe.stdout), ('ERR', pipe.stderr)):
+        Thread(target=enqueue_process_output, args=(streamId, stream, qOut), daemon=True).start()
+
+    openStreams = 2
+    while openStreams:
+        chunks = {'OUT': None, 'ERR': None}
+
+        try:
+            events = [qOut.get(timeout=timeout)]
+            while not qOut.empty():
+                events.append(qOut.get_nowait())
+        except Empty:
+            events = []
+
+        for streamId, data in events:
+            if data is None:
+                openStreams -= 1
+            else:
+                chunks[streamId] = (chunks[streamId] or b'') + data
+
+        yield chunks['OUT'], chunks['ERR']
+
+
 def enqueue_process_output(streamId, inStream, outQueue):
-    for line in iter(inStream.readline, b''):
-        # logging.info(streamId + ": " + line)
-        outQueue.put(line)
+    # read1 hands over whatever is available, which also works for binary output
+    for data in iter(lambda: inStream.read1(PIPE_READ_SIZE), b''):
+        # logging.info(streamId + ": " + data)
+        outQueue.put((streamId, data))
+    outQueue.put((streamId, None))
 
 
 def duration_str_to_milliseconds(str, throw_parse_error=False):
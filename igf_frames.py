@@ -0,0 +1,345 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import time
+import uuid
+from fractions import Fraction
+
+import PIL.Image
+import PIL.ImageChops
+import PIL.ImageStat
+
+US_PER_SEC = 1_000_000
+
+DUPLICATES_EXACT = 'exact'
+DUPLICATES_PERCEPTUAL = 'perceptual'
+LUMA_SIGNATURE_SIZE = 16
+
+
+def file_identity(fileName):
+    """What makes an extracted frame file the same file: it survives renames, but not edits."""
+    fileStat = os.stat(fileName)
+    return fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns
+
+
+def hash_file(fileName):
+    """SHA-256 of a file. The file is mapped rather than read, so hashing frames on several
+    threads doesn't copy each one into memory first."""
+    with open(fileName, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha256(data).digest()
+
+
+def get_frame_number(fileName, nameFormat='image%04d'):
+    """Number of a frame file named by nameFormat, like 42 for image0042.png. None if it's
+    named some other way."""
+    stem = os.path.splitext(os.path.basename(fileName))[0]
+    prefix = nameFormat.split('%')[0]
+    digits = stem[len(prefix) :]
+    if not stem.startswith(prefix) or not digits.isdigit():
+        return None
+
+    number = int(digits)
+    if nameFormat % (number) != stem:
+        return None
+    return number
+
+
+def luma_signature(fileName, size=LUMA_SIGNATURE_SIZE):
+    """Tiny grayscale copy of an image. Encoding noise averages out at this size, changes in
+    the picture don't."""
+    with PIL.Image.open(fileName) as img:
+        return img.convert('L').resize((size, size), PIL.Image.Resampling.BOX)
+
+
+def luma_signature_difference(a, b):
+    """Mean difference between two luma signatures, in percent"""
+    return PIL.ImageStat.Stat(PIL.ImageChops.difference(a, b)).mean[0] * 100 / 255
+
+
+def time_str_to_microseconds(timeStr):
+    """Parse [[hh:]mm:]ss[.frac] the way ffmpeg does. Returns None if it can't be parsed."""
+    try:
+        total = Fraction(0)
+        for token in timeStr.strip().split(':'):
+            total = total * 60 + Fraction(token)
+    except (ValueError, ZeroDivisionError, AttributeError):
+        return None
+
+    if total < 0:
+        return None
+    return int(total * US_PER_SEC)
+
+
+def microseconds_to_time_str(us):
+    return '%d.%06d' % divmod(us, US_PER_SEC)
+
+
+def get_preroll_microseconds(frameRate):
+    """One frame slot, rounded up to whole microseconds"""
+    return math.ceil(US_PER_SEC / frameRate)
+
+
+class FrameManifest:
+    """Extracted video frames indexed by their timestamp in the source.
+
+    Frames sit on a grid: frame n was sampled at originUs + n / frameRate seconds. The manifest
+    holds a contiguous run of grid slots and the identity of the file holding each one. Files are
+    tracked by identity rather than name so renumbering doesn't invalidate anything, and several
+    slots can share a file when duplicates were culled.
+    """
+
+    def __init__(self, videoPath, frameRate, originUs):
+        self.videoPath = videoPath
+        self.frameRate = frameRate
+        self.originUs = originUs
+        self.firstIdx = 0
+        self.fileIds = []
+
+    def GetGridIndex(self, timeUs):
+        """Grid slot sampled at timeUs, or None if timeUs falls between slots"""
+        n, remainder = divmod((timeUs - self.originUs) * self.frameRate, US_PER_SEC)
+        if remainder:
+            return None
+        return n
+
+    def GetFrameTimeUs(self, n):
+        return self.originUs + n * US_PER_SEC // self.frameRate
+
+    def SetFrames(self, firstIdx, fileNames):
+        self.firstIdx = firstIdx
+        self.fileIds = [file_identity(f) for f in fileNames]
+
+    def MergeDuplicate(self, removedId, keptId):
+        """A frame file was deleted because keptId holds the same picture"""
+        self.fileIds = [keptId if fileId == removedId else fileId for fileId in self.fileIds]
+
+    def GetReusePlan(self, target, numFrames):
+        """Work out how to fill numFrames slots of the target manifest, starting at its origin,
+        from the frames we have. The target's frame rate has to divide ours, in which case every
+        Nth frame is taken.
+
+        Returns (headCount, reusedIds, tailCount): frames to decode before the reused ones, the
+        identities of reused frames in order, and frames to decode after them. None if nothing can
+        be reused.
+        """
+        if target.videoPath != self.videoPath or target.frameRate <= 0:
+            return None
+        if self.frameRate % target.frameRate:
+            return None
+
+        n0 = self.GetGridIndex(target.originUs)
+        if n0 is None:
+            return None
+
+        stride = self.frameRate // target.frameRate
+        oldEnd = self.firstIdx + len(self.fileIds)
+
+        # Target slot j lands on our slot n0 + j * stride
+        reuseStart = max(0, -((n0 - self.firstIdx) // stride))
+        reuseEnd = min(numFrames, -((n0 - oldEnd) // stride))
+        if reuseEnd <= reuseStart:
+            return None
+
+        reusedIds = [
+            self.fileIds[n0 + j * stride - self.firstIdx] for j in range(reuseStart, reuseEnd)
+        ]
+        return reuseStart, reusedIds, numFrames - reuseEnd
+
+
+class DirectoryIndex:
+    """Cached listing of a frames directory, with the newest modification time in it.
+
+    The directory is scanned on first use and after Invalidate(). Whoever writes or deletes
+    files in it is expected to call Invalidate() when done, so nothing lists the directory
+    between changes. With a watcher, changes made by other programs invalidate it too.
+
+    Every scan that finds files added, removed or rewritten bumps the generation, so checking
+    whether something changed is a comparison. Renames alone don't count. Each file name also
+    gets a generation, bumped whenever the file under that name changes.
+    """
+
+    def __init__(self, directory, watcher=None):
+        self.directory = directory
+        self.names = None
+        self.fileIds = {}  # name -> file identity as of the last scan
+        self.fileGenerations = {}
+        self.generation = 0
+        self.lastFileGeneration = 0
+        self.lastModifiedTs = 0
+        self.watcher = watcher
+
+        if watcher is not None:
+            watcher.Watch(directory, self.Invalidate)
+
+    def Invalidate(self):
+        self.names = None
+
+    def Rescan(self):
+        fileIds = {}
+        lastModifiedTs = os.stat(self.directory).st_mtime
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                # Same as glob's *
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    # Not entry.stat(), which has no inode number on Windows
+                    fileStat = os.stat(entry.path)
+                except OSError:
+                    continue
+                fileIds[entry.name] = fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns
+                lastModifiedTs = max(lastModifiedTs, fileStat.st_mtime)
+
+        if sorted(fileIds.values()) != sorted(self.fileIds.values()):
+            self.generation += 1
+
+        fileGenerations = {}
+        for name, fileId in fileIds.items():
+            if self.fileIds.get(name) == fileId:
+                fileGenerations[name] = self.fileGenerations[name]
+            else:
+                self.lastFileGeneration += 1
+                fileGenerations[name] = self.lastFileGeneration
+
+        self.names = sorted(fileIds)
+        self.fileIds = fileIds
+        self.fileGenerations = fileGenerations
+        self.lastModifiedTs = lastModifiedTs
+
+    def GetNames(self):
+        if self.watcher is not None:
+            self.watcher.Poll()
+
+        if self.names is None:
+            try:
+                self.Rescan()
+            except OSError:
+                return []
+        return list(self.names)
+
+    def GetFiles(self):
+        return [os.path.join(self.directory, name) for name in self.GetNames()]
+
+    def GetGeneration(self):
+        self.GetNames()
+        return self.generation
+
+    def GetFileGeneration(self, fileName):
+        """Generation of the file currently named fileName, None if there's no such file"""
+        self.GetNames()
+        return self.fileGenerations.get(os.path.basename(fileName))
+
+    def GetFileId(self, fileName):
+        """file_identity() of fileName as of the last scan, None if there's no such file"""
+        self.GetNames()
+        return self.fileIds.get(os.path.basename(fileName))
+
+    def GetLastModifiedTs(self):
+        """Newest modification time of the directory or any file in it, as of the last scan"""
+        if not self.GetNames():
+            return 0
+        return self.lastModifiedTs
+
+
+class FrameStore:
+    """The extracted frames directory, in animation order.
+
+    Order is kept in a list of file names rather than encoded in the names themselves, so
+    reversing, deleting, inserting and riffling frames only reorders the list. Files deleted
+    from the directory drop out of the order and new ones are appended by name, so code that
+    just writes or removes files keeps working. Later stages name their output after each
+    frame's place in the order, see GetSequenceNames(). Materialize() renames the files
+    themselves for tools that need them numbered, like a file browser.
+    """
+
+    def __init__(self, index, nameFormat='image%04d'):
+        self.index = index
+        self.directory = index.directory
+        self.nameFormat = nameFormat
+        self.names = None  # None means sorted by name
+        self.generation = 0  # Bumped when the order changes
+        self.modifiedTs = 0
+
+    def Reset(self):
+        """Forget the order. Frames go back to being sorted by name."""
+        if self.names is not None:
+            self.generation += 1
+        self.names = None
+
+    def GetFiles(self):
+        names = self.index.GetNames()
+        if self.names is not None:
+            present = set(names)
+            ordered = [name for name in self.names if name in present]
+            known = set(ordered)
+            self.names = ordered + [name for name in names if name not in known]
+            names = self.names
+
+        return [os.path.join(self.directory, name) for name in names]
+
+    def SetOrder(self, fileNames):
+        """Frames in the given order. Files in the directory that aren't listed go at the end."""
+        self.names = [os.path.basename(f) for f in fileNames]
+        self.generation += 1
+        self.modifiedTs = time.time()
+
+    def Reverse(self):
+        self.SetOrder(reversed(self.GetFiles()))
+
+    def GetSequenceNames(self):
+        """Numbered name, without extension, of each frame's place in the order, by file name"""
+        return {f: self.nameFormat % (idx + 1) for idx, f in enumerate(self.GetFiles())}
+
+    def Materialize(self):
+        """Rename frames to a numbered sequence in animation order. Only frames that are out of
+        place are touched. They're moved aside first so none lands on one that hasn't moved
+        yet. If a rename fails, the frames get their old names back and the error is raised."""
+        moves = []
+        for f, name in self.GetSequenceNames().items():
+            toFile = os.path.join(self.directory, name + os.path.splitext(f)[1])
+            if f != toFile:
+                moves.append((f, toFile))
+
+        tempNames = []
+        renamed = 0
+        try:
+            for f, _ in moves:
+                tempName = os.path.join(
+                    self.directory, 'tmp-%s%s' % (uuid.uuid4().hex, os.path.splitext(f)[1])
+                )
+                os.rename(f, tempName)
+                tempNames.append(tempName)
+
+            for tempName, (_, toFile) in zip(tempNames, moves, strict=True):
+                os.rename(tempName, toFile)
+                renamed += 1
+        except OSError:
+            self.UndoMoves(moves, tempNames, renamed)
+            raise
+        finally:
+            if moves:
+                self.index.Invalidate()
+
+        self.names = None
+        return len(moves)
+
+    def UndoMoves(self, moves, tempNames, renamed):
+        """Put frames back where Materialize() found them. The first `renamed` of them already
+        went on to their new names, the rest of tempNames are still aside"""
+        # Clear the new names first, since they may be old names of other frames
+        for tempName, (_, toFile) in zip(tempNames[:renamed], moves, strict=False):
+            try:
+                os.rename(toFile, tempName)
+            except OSError:
+                logging.error("Can't move %s back" % (toFile))
+
+        for tempName, (f, _) in zip(tempNames, moves, strict=False):
+            try:
+                os.rename(tempName, f)
+            except OSError:
+                logging.error("Can't move %s back to %s" % (tempName, f))
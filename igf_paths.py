@@ -121,6 +121,23 @@ def create_working_dir(conf):
     return temp_dir
 
 
+def create_cache_dir(conf, work_dir):
+    """Root of the frame cache shared by all sessions. It lives in the working directory unless
+    configured otherwise, so deleting temporary files clears it too."""
+    cache_dir = conf.GetParam('paths', 'cacheDir')
+    if not cache_dir:
+        cache_dir = work_dir + os.sep + 'cache'
+
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError:
+            logging.error('Failed to create cache directory: ' + cache_dir)
+            return ''
+
+    return cache_dir
+
+
 def get_fail_safe_dir(conf, badPath):
     """For language auto-fix."""
     path = badPath
@@ -0,0 +1,262 @@
+import concurrent.futures
+import hashlib
+
+import PIL.Image
+
+import igf_frames
+
+RESIZE_BACKEND_IMAGEMAGICK = 'imagemagick'
+RESIZE_BACKEND_PILLOW = 'pillow'
+RESIZE_BACKENDS = RESIZE_BACKEND_IMAGEMAGICK, RESIZE_BACKEND_PILLOW
+
+
+class FrameFormat:
+    """File format of the frames handed from one stage to the next. The fast ones skip zlib on
+    every write and read at the cost of disk space."""
+
+    def __init__(self, extension, pngCompression=None, hasAlpha=True):
+        self.extension = extension
+        self.pngCompression = pngCompression  # zlib level, None for the encoder's default
+        self.hasAlpha = hasAlpha
+
+    def GetConvertOptions(self):
+        if self.pngCompression is None:
+            return ''
+        return ' -define png:compression-level=%d ' % (self.pngCompression)
+
+    def GetFfmpegOptions(self):
+        if self.pngCompression is None:
+            return ''
+        return '-compression_level %d ' % (self.pngCompression)
+
+    def GetSaveOptions(self):
+        if self.pngCompression is None:
+            return {}
+        return {'compress_level': self.pngCompression}
+
+
+FRAME_FORMAT_PNG = 'png'
+FRAME_FORMATS = {
+    FRAME_FORMAT_PNG: FrameFormat('png'),
+    'png0': FrameFormat('png', pngCompression=0),
+    'ppm': FrameFormat('ppm', hasAlpha=False),
+    'bmp': FrameFormat('bmp', hasAlpha=False),
+}
+
+
+class FrameGeometry:
+    """What the crop and resize stage does to every frame: a forced resize to the video's
+    display size, an optional crop, and a forced resize to the final size."""
+
+    def __init__(self, origSize, crop, finalSize):
+        self.origSize = tuple(origSize)
+        self.crop = None if crop is None else tuple(crop)  # width, height, x, y
+        self.finalSize = tuple(finalSize)
+
+    def __eq__(self, other):
+        if not isinstance(other, FrameGeometry):
+            return NotImplemented
+        return self.Key() == other.Key()
+
+    def __hash__(self):
+        return hash(self.Key())
+
+    def Key(self):
+        return self.origSize, self.GetCropBox(), self.finalSize
+
+    def GetCropBox(self):
+        """Crop rectangle as (left, top, right, bottom) with ImageMagick's -crop semantics: a
+        zero width or height means all of it, and the rectangle is clipped to the image.
+        Returns None if there's nothing to crop, False if the rectangle misses the image."""
+        if self.crop is None:
+            return None
+
+        origWidth, origHeight = self.origSize
+        width, height, x, y = self.crop
+
+        if width <= 0:
+            width = origWidth
+        if height <= 0:
+            height = origHeight
+
+        left = max(0, x)
+        top = max(0, y)
+        right = min(origWidth, x + width)
+        bottom = min(origHeight, y + height)
+
+        if right <= left or bottom <= top:
+            return False
+
+        if (left, top, right, bottom) == (0, 0, origWidth, origHeight):
+            return None
+
+        return left, top, right, bottom
+
+    def GetFfmpegFilter(self):
+        """The same steps as an ffmpeg filter chain"""
+        origWidth, origHeight = self.origSize
+        filters = ['scale=%d:%d:flags=bicubic' % (origWidth, origHeight), 'setsar=1']
+
+        cropBox = self.GetCropBox()
+        if cropBox:
+            left, top, right, bottom = cropBox
+            filters.append('crop=%d:%d:%d:%d' % (right - left, bottom - top, left, top))
+
+        filters.append('scale=%d:%d:flags=lanczos' % self.finalSize)
+        return ','.join(filters)
+
+
+class FrameStack:
+    """Decoded RGB frames in one contiguous buffer, as read from ffmpeg's rawvideo output.
+
+    Frames are also written to disk for everything that works on files. Those files are mapped
+    back to their frame by identity (inode, size, mtime), so renames and deletions are followed
+    and edited files simply stop matching.
+    """
+
+    def __init__(self, size, maxBytes):
+        self.size = tuple(size)
+        self.frameBytes = self.size[0] * self.size[1] * 3
+        self.maxBytes = maxBytes
+        self.data = bytearray()
+        self.fileIds = {}
+        self.overflow = False
+
+    def Feed(self, data):
+        """Append raw output. Returns False once the stack would grow past maxBytes."""
+        if len(self.data) + len(data) > self.maxBytes:
+            self.overflow = True
+            return False
+        self.data += data
+        return True
+
+    def GetNumFrames(self):
+        return len(self.data) // self.frameBytes
+
+    def GetImage(self, idx):
+        start = idx * self.frameBytes
+        view = memoryview(self.data)[start : start + self.frameBytes]
+        return PIL.Image.frombuffer('RGB', self.size, view, 'raw', 'RGB', 0, 1)
+
+    def GetFrameHash(self, idx):
+        start = idx * self.frameBytes
+        return hashlib.md5(memoryview(self.data)[start : start + self.frameBytes]).hexdigest()
+
+    def WriteFrames(self, fileNames, workers=1, callback=None, compressLevel=1):
+        """Save frames to fileNames, one per frame, as quickly compressed PNGs. Returns False if
+        the callback asked to stop."""
+        fileNames = fileNames[: self.GetNumFrames()]
+
+        def WriteFrame(idx):
+            self.GetImage(idx).save(fileNames[idx], compress_level=compressLevel)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(WriteFrame, idx) for idx in range(len(fileNames))]
+
+            for idx, future in enumerate(futures):
+                future.result()
+                self.fileIds[igf_frames.file_identity(fileNames[idx])] = idx
+
+                percent = int((idx + 1) * 100 / len(fileNames))
+                message = '%d%% Writing frames' % (percent)
+                if callback is not None and not callback(percent, message):
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    return False
+
+        return True
+
+    def GetFileImage(self, fileName):
+        """Frame that was written to fileName, or None if the file is not one of ours anymore"""
+        try:
+            idx = self.fileIds.get(igf_frames.file_identity(fileName))
+        except OSError:
+            return None
+
+        if idx is None:
+            return None
+        return self.GetImage(idx)
+
+
+class PillowFrameRenderer:
+    """Crop and resize frames in-process with Pillow instead of a convert round trip."""
+
+    def __init__(self, geometry, frameStack=None, frameFormat=None):
+        self.geometry = geometry
+        self.frameStack = frameStack
+        self.frameFormat = frameFormat or FRAME_FORMATS[FRAME_FORMAT_PNG]
+
+    def CanRender(self):
+        return self.geometry.GetCropBox() is not False and min(self.geometry.finalSize) > 0
+
+    def RenderImage(self, img):
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+        img = resize_image(img, self.geometry.origSize)
+
+        cropBox = self.geometry.GetCropBox()
+        if cropBox:
+            img = img.crop(cropBox)
+
+        return resize_image(img, self.geometry.finalSize)
+
+    def Render(self, inputFileName, outputFileName, callback=None):
+        try:
+            img = None
+            if self.frameStack is not None:
+                img = self.frameStack.GetFileImage(inputFileName)
+
+            if img is not None:
+                img = self.RenderImage(img)
+            else:
+                with PIL.Image.open(inputFileName) as img:
+                    # A frame that needs no crop or resize comes back as is, so read it before
+                    # the file is closed
+                    img.load()
+                    img = self.RenderImage(img)
+
+            if img.mode == 'RGBA' and not self.frameFormat.hasAlpha:
+                img = img.convert('RGB')
+
+            # Metadata isn't carried over, which is what -strip does
+            img.save(outputFileName, **self.frameFormat.GetSaveOptions())
+        except (OSError, ValueError):
+            return False
+
+        return True
+
+
+def blend_frames(fileNameA, fileNameB, alpha, outputFileName, frameFormat=None, callback=None):
+    """Dissolve frame B into frame A, like convert -compose dissolve with alpha * 100 as the
+    percentage. Returns False if either frame can't be read or the result can't be written."""
+    frameFormat = frameFormat or FRAME_FORMATS[FRAME_FORMAT_PNG]
+
+    try:
+        with PIL.Image.open(fileNameA) as imgA, PIL.Image.open(fileNameB) as imgB:
+            hasAlpha = 'A' in imgA.getbands() or 'A' in imgB.getbands()
+            mode = 'RGBA' if hasAlpha and frameFormat.hasAlpha else 'RGB'
+            blendA = imgA.convert(mode)
+            blendB = resize_image(imgB.convert(mode), blendA.size)
+
+        PIL.Image.blend(blendA, blendB, alpha).save(
+            outputFileName, **frameFormat.GetSaveOptions()
+        )
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+
+def resize_image(img, size):
+    """Forced resize like ImageMagick's -resize WxH!. Lanczos when shrinking, a cubic filter
+    when enlarging."""
+    size = tuple(int(v) for v in size)
+    if img.size == size:
+        return img
+
+    if size[0] < img.size[0] or size[1] < img.size[1]:
+        resample = PIL.Image.Resampling.LANCZOS
+    else:
+        resample = PIL.Image.Resampling.BICUBIC
+
+    return img.resize(size, resample)
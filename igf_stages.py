@@ -0,0 +1,130 @@
+import hashlib
+
+STAGE_EXTRACT = 'extract'
+STAGE_RESIZE = 'resize'
+STAGE_PROCESS = 'process'
+STAGE_ENCODE = 'encode'
+
+
+class Stage:
+    """One step of the pipeline: the configuration it reads and the stage it builds on.
+
+    keys are (section, key) pairs, sections are section name prefixes whose every key counts,
+    so 'caption' covers captiondefaults and caption1 to caption30.
+    """
+
+    def __init__(self, name, upstream=None, keys=(), sections=()):
+        self.name = name
+        self.upstream = upstream
+        self.keys = tuple((section.lower(), key.lower()) for section, key in keys)
+        self.sections = tuple(section.lower() for section in sections)
+
+
+STAGES = (
+    Stage(
+        STAGE_EXTRACT,
+        keys=(
+            ('length', 'startTime'),
+            ('length', 'durationSec'),
+            ('rate', 'frameRate'),
+            ('settings', 'autoDeleteDuplicateFrames'),
+            ('settings', 'duplicateFrameDetection'),
+            ('settings', 'duplicateFrameThreshold'),
+            ('settings', 'fixSlowdownGlitch'),
+            ('performance', 'singlePassExtract'),
+            ('performance', 'rawPipeExtract'),
+        ),
+    ),
+    Stage(
+        STAGE_RESIZE,
+        upstream=STAGE_EXTRACT,
+        keys=(
+            ('size', 'cropEnabled'),
+            ('size', 'cropOffsetX'),
+            ('size', 'cropOffsetY'),
+            ('size', 'cropWidth'),
+            ('size', 'cropHeight'),
+            ('size', 'resizePostCrop'),
+            ('performance', 'resizeBackend'),
+            ('performance', 'intermediateFormat'),
+        ),
+        sections=('blend',),
+    ),
+    Stage(
+        STAGE_PROCESS,
+        upstream=STAGE_RESIZE,
+        keys=(('performance', 'intermediateFormat'), ('performance', 'cacheCaptionLayers')),
+        sections=('effects', 'color', 'caption', 'imagelayer'),
+    ),
+    Stage(
+        STAGE_ENCODE,
+        upstream=STAGE_PROCESS,
+        keys=(
+            ('rate', 'speedModifier'),
+            ('rate', 'numLoops'),
+            ('rate', 'customFrameTimingMs'),
+            ('size', 'fileOptimizer'),
+            ('blend', 'cinemagraphUseTransparency'),
+            ('blend', 'cinemagraphKeyFrameIdx'),
+        ),
+        sections=('audio',),
+    ),
+)
+
+
+class StageGraph:
+    """Decide which stages need to run, like make does.
+
+    A stage's inputs are the configuration it declares, whatever else the caller passes in
+    (frame generations, source paths) and the inputs its upstream stage was last built from.
+    A stage is stale when the hash of its inputs differs from the one it was last built with,
+    so rebuilding a stage from new inputs makes everything after it stale too. The
+    configuration comes from the settings snapshot passed in, or the current one.
+    """
+
+    def __init__(self, conf, stages=STAGES):
+        self.conf = conf
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self.builtHashes = {}
+        self.configValues = {}  # stage name -> (settings hash, values)
+
+    def GetConfigValues(self, stage, settings=None):
+        if settings is None:
+            settings = self.conf.GetSnapshot()
+        cached = self.configValues.get(stage.name)
+        if cached is not None and cached[0] == settings.GetHash():
+            return cached[1]
+
+        values = [(section, key, settings.GetParam(section, key)) for section, key in stage.keys]
+
+        for section in settings.GetSectionNames():
+            if stage.sections and section.startswith(stage.sections):
+                values += [
+                    (section, key, value) for key, value in settings.GetSectionItems(section)
+                ]
+
+        self.configValues[stage.name] = settings.GetHash(), values
+        return values
+
+    def GetInputHash(self, name, extraInputs=(), settings=None):
+        stage = self.stages[name]
+        inputs = [self.GetConfigValues(stage, settings), tuple(extraInputs)]
+        if stage.upstream is not None:
+            inputs.append(self.builtHashes.get(stage.upstream))
+
+        return hashlib.sha256(repr(inputs).encode('utf-8')).hexdigest()
+
+    def IsStale(self, name, extraInputs=(), settings=None):
+        builtHash = self.builtHashes.get(name)
+        return builtHash is None or builtHash != self.GetInputHash(name, extraInputs, settings)
+
+    def MarkBuilt(self, name, extraInputs=(), settings=None):
+        self.builtHashes[name] = self.GetInputHash(name, extraInputs, settings)
+
+    def Invalidate(self, name=None):
+        """Force a stage, or every stage, to be rebuilt"""
+        if name is None:
+            self.builtHashes = {}
+        else:
+            self.builtHashes.pop(name, None)
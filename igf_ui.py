@@ -23,6 +23,7 @@ import PIL.ImageTk
 import igf_animgif
 import igf_common
 import igf_paths
+import igf_stages
 from igf_common import IM_A_MAC, IM_A_PC, __release__, __version__, re_scale
 
 if IM_A_PC:
@@ -39,8 +40,11 @@ def notify_user(title, msg):
 class GifPlayerWidget(tkinter.Label):
     """Tkinter widget that plays a gif."""
 
-    def __init__(self, master, processedImgList, frameDelayMs, resizable, soundPath=None):
+    def __init__(
+        self, master, processedImgList, frameDelayMs, resizable, soundPath=None, frameDelaysMs=None
+    ):
         self.delay = frameDelayMs
+        self.frameDelays = frameDelaysMs  # Per frame, overrides delay
         self.images = []
         self.frames = []
         self.resizable = resizable
@@ -56,7 +60,7 @@ class GifPlayerWidget(tkinter.Label):
         super().__init__(image=self.frames[0], padx=10, pady=10)
 
         self.idx = 0
-        self.cancel = self.after(self.delay, self.Play)
+        self.cancel = self.after(self.GetDelay(), self.Play)
 
         if self.resizable:
             self.columnconfigure(0, weight=1)
@@ -65,6 +69,11 @@ class GifPlayerWidget(tkinter.Label):
         self.currW = self.winfo_width()
         self.currH = self.winfo_height()
 
+    def GetDelay(self):
+        if self.frameDelays is not None and self.idx < len(self.frameDelays):
+            return self.frameDelays[self.idx]
+        return self.delay
+
     def GetInfo(self):
         width, height = self.images[0].size
         return f'Dimensions: {width}x{height}'
@@ -120,7 +129,7 @@ class GifPlayerWidget(tkinter.Label):
             self.currH = self.winfo_height()
 
         self.config(image=self.frames[self.idx])
-        self.cancel = self.after(self.delay + resizePause, self.Play)
+        self.cancel = self.after(self.GetDelay() + resizePause, self.Play)
 
 
 class GifApp:
@@ -137,18 +146,12 @@ class GifApp:
         self.tempDir = None
         self.captions = {}
 
-        self.cropResizeChanges = 0
-        self.captionChanges = 0
-        self.miscGifChanges = 1
-        self.frameTimingOrCompressionChanges = 0
-        self.audioChanges = 0
-
         self.screenCapDlgGeometry = ''
         self.mainTimerValueMS = 2000
         self.savePath = None
         self.parent.withdraw()  # Hide. add components then show at the end
-        self.thumbNailsUpdatedTs = 0
-        self.thumbNailCache = {}
+        self.thumbNailsGeneration = None
+        self.thumbNailCache = {}  # path -> (frame generation, size, thumbnail)
         self.maskEventList = []
         self.maskEdited = False
         self.maskDraw: None | PIL.ImageDraw.ImageDraw = None
@@ -1107,6 +1110,7 @@ class GifApp:
         self.RestartTimer()
 
         self.parent.bind('<Escape>', self.OnCancel)
+        self.parent.bind('<FocusIn>', self.OnFocusIn)
 
         # Screen Capture Dialog variables
         #######################################################################
@@ -1246,9 +1250,6 @@ class GifApp:
         if igf_paths.get_file_extension(savePath) not in igf_paths.EXT_VIDEO:
             savePath += igf_paths.EXT_GIF
 
-        if self.savePath != savePath:
-            self.miscGifChanges += 1
-
         self.savePath = savePath
 
         self.conf.SetParam('paths', 'gifOutputPath', self.savePath)
@@ -1342,7 +1343,7 @@ class GifApp:
 
         # File size optimize
         if len(self.fileSizeOptimize.get()):
-            self.frameTimingOrCompressionChanges += self.conf.SetParamBool(
+            self.conf.SetParamBool(
                 'size', 'fileOptimizer', bool(int(self.fileSizeOptimize.get()) == 1)
             )
 
@@ -1355,6 +1356,11 @@ class GifApp:
                 logging.info('Cancel Event')
                 self.cancelRequest = True
 
+    def OnFocusIn(self, event):
+        # Frames may have been edited in another program while we were away
+        if self.gif is not None:
+            self.gif.RescanFrameDirs()
+
     def OnFpsChanged(self, event):
         self.RestartTimer()
 
@@ -1558,44 +1564,51 @@ class GifApp:
         # Cached thumbnail mode
         if self.conf.GetParamBool('settings', 'cacheThumbs'):
             # Update thumbnail memory cache
-            framesOnDiskTs = self.gif.GetExtractedImagesLastModifiedTs()
-            if self.thumbNailsUpdatedTs < framesOnDiskTs:
+            framesGeneration = self.gif.GetFramesGeneration()
+            if self.thumbNailsGeneration != framesGeneration:
                 logging.info(
-                    'Thumbnail cache is stale (%d < %d)'
-                    % (self.thumbNailsUpdatedTs, framesOnDiskTs)
+                    'Thumbnail cache is stale (%s != %s)'
+                    % (self.thumbNailsGeneration, framesGeneration)
                 )
-                self.thumbNailsUpdatedTs = -1
+                self.thumbNailsGeneration = None
                 newThumbCache = {}
-                self.thumbNailCache = {}  # erase cache
+                thumbSize = (int(px2 - px) + 1, int(py2 - py) + 1)
 
                 self.SetStatus('Updating thumbnail previews...')
 
                 for thumbPath in imgList:
                     self.OnShowProgress(False)
+
+                    # Frames that were only moved around or kept keep their thumbnail
+                    frameGeneration = self.gif.GetFrameGeneration(thumbPath)
+                    cached = self.thumbNailCache.get(thumbPath)
+                    if cached is not None and cached[:2] == (frameGeneration, thumbSize):
+                        newThumbCache[thumbPath] = cached
+                        continue
+
                     try:
-                        newThumbCache[thumbPath] = PIL.Image.open(thumbPath)
-                        newThumbCache[thumbPath] = newThumbCache[thumbPath].resize(
-                            (int(px2 - px) + 1, int(py2 - py) + 1),
-                            PIL.Image.Resampling.NEAREST,
+                        thumb = PIL.Image.open(thumbPath).resize(
+                            thumbSize, PIL.Image.Resampling.NEAREST
                         )
                     except OSError:
                         logging.error(
                             f'Unable to generate thumbnail for {thumbPath}. Image does not exist'
                         )
-                        self.thumbNailsUpdatedTs = -2
                         return
 
+                    newThumbCache[thumbPath] = (frameGeneration, thumbSize, thumb)
+
                 self.SetStatus('')
                 self.OnShowProgress(True)
 
                 self.thumbNailCache = newThumbCache
-                self.thumbNailsUpdatedTs = time.time()
+                self.thumbNailsGeneration = framesGeneration
 
             try:
-                img = self.thumbNailCache[imgPath]
+                img = self.thumbNailCache[imgPath][2]
             except Exception:
                 logging.error(f'Thumbnail cache miss: {imgPath}. Marking thumbnail cache as stale')
-                self.thumbNailsUpdatedTs = -3
+                self.thumbNailsGeneration = None
                 return
         #
         # Direct-from-disk thumbnail mode
@@ -1728,8 +1741,7 @@ class GifApp:
                     % (x + 1, os.path.basename(frameList[x]))
                 )
 
-        # Tell cache not to update. Deletes are OK
-        self.thumbNailsUpdatedTs = time.time()
+            self.gif.RescanFrameDirs()
 
         self.SetThumbNailIndex()
 
@@ -1983,6 +1995,9 @@ class GifApp:
 
         self.ProcessImage(1)
 
+        # Show the frames numbered in animation order
+        self.gif.ReEnumerateExtractedFrames()
+
         openExplorerCmd = ''
 
         if IM_A_PC:
@@ -2218,7 +2233,7 @@ class GifApp:
             return
         self.guiBusy = True
 
-        self.lastProcessTsByLevel = [0, 0, 0, 0]
+        self.extractedFramesGeneration = None
 
         # The following settings engine -> App
 
@@ -2351,26 +2366,15 @@ class GifApp:
         if self.gif is None:
             return False
 
-        timeOrRateSettingChanges = 0
-        sizeSettingChanges = 0
-        gifSettingChanges = 0
-        fileFormatSettingChanges = 0
-
         if processStages >= 1:
             startTime = self.GetStartTimeString()
 
-            timeOrRateSettingChanges += self.gif.GetConfig().SetParam(
-                'rate', 'frameRate', str(self.sclFps.get())
-            )
-            timeOrRateSettingChanges += self.gif.GetConfig().SetParam(
-                'length', 'startTime', startTime
-            )
-            timeOrRateSettingChanges += self.gif.GetConfig().SetParam(
-                'length', 'durationSec', self.spnDuration.get()
-            )
+            self.gif.GetConfig().SetParam('rate', 'frameRate', str(self.sclFps.get()))
+            self.gif.GetConfig().SetParam('length', 'startTime', startTime)
+            self.gif.GetConfig().SetParam('length', 'durationSec', self.spnDuration.get())
 
             # Sanity checks
-            if timeOrRateSettingChanges > 0:
+            if self.gif.IsStageStale(igf_stages.STAGE_EXTRACT):
                 totalFrames = int(float(self.spnDuration.get()) * int(self.sclFps.get()))
                 if totalFrames > 9999:
                     return (
@@ -2383,40 +2387,27 @@ class GifApp:
                         'Be careful!',
                         "You're about to make a really long GIF. Are you sure you want to continue?",
                     ):
+                        # Don't ask again until the settings change
+                        self.gif.MarkStageBuilt(igf_stages.STAGE_EXTRACT)
                         return False, 'User chose not to make a really long GIF'
 
         if processStages >= 2:
+            # The mask file itself is one of the resize stage's inputs
             if self.isCinemagraph.get():
-                if self.maskEdited:
-                    sizeSettingChanges += 1
-                    self.maskEdited = 0
+                self.maskEdited = False
 
-            sizeSettingChanges += self.cropResizeChanges
-            sizeSettingChanges += self.gif.GetConfig().SetParamBool(
-                'blend', 'cinemaGraph', self.isCinemagraph.get()
-            )
-            sizeSettingChanges += self.gif.GetConfig().SetParamBool(
+            self.gif.GetConfig().SetParamBool('blend', 'cinemaGraph', self.isCinemagraph.get())
+            self.gif.GetConfig().SetParamBool(
                 'blend', 'cinemaGraphInvert', self.invertCinemagraph.get()
             )
-            sizeSettingChanges += self.gif.GetConfig().SetParam(
-                'size', 'cropOffsetX', self.cropStartX
-            )
-            sizeSettingChanges += self.gif.GetConfig().SetParam(
-                'size', 'cropOffsetY', self.cropStartY
-            )
-            sizeSettingChanges += self.gif.GetConfig().SetParam('size', 'cropWidth', self.cropWidth)
-            sizeSettingChanges += self.gif.GetConfig().SetParam(
-                'size', 'cropHeight', self.cropHeight
-            )
-            sizeSettingChanges += self.gif.GetConfig().SetParam(
+            self.gif.GetConfig().SetParam('size', 'cropOffsetX', self.cropStartX)
+            self.gif.GetConfig().SetParam('size', 'cropOffsetY', self.cropStartY)
+            self.gif.GetConfig().SetParam('size', 'cropWidth', self.cropWidth)
+            self.gif.GetConfig().SetParam('size', 'cropHeight', self.cropHeight)
+            self.gif.GetConfig().SetParam(
                 'size', 'resizePostCrop', self.finalSize
             )  # str(self.sclResize.get()))
 
-            if not preview:
-                self.cropResizeChanges = 0
-            else:
-                self.cropResizeChanges += sizeSettingChanges
-
         if processStages >= 3:
             colorSpace = 'CMYK'
             saturation = 0
@@ -2429,116 +2420,42 @@ class GifApp:
             if self.isBlurred.get():
                 blur = self.blurredAmount.get()
 
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'brightness', self.sclBright.get() * 10
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'contrast', self.sclBright.get() * 10
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam('color', 'saturation', saturation)
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'effects', 'sharpen', self.isSharpened.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'sharpenAmount', self.sharpenedAmount.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'effects', 'sepiaTone', self.isSepia.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'sepiaToneAmount', self.sepiaAmount.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'effects', 'colorTint', self.isColorTint.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'colorTintAmount', self.colorTintAmount.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'colorTintColor', self.colorTintColor.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'effects', 'fadeEdges', self.isFadedEdges.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'fadeEdgeAmount', self.fadedEdgeAmount.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'effects', 'border', self.isBordered.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'borderAmount', self.borderAmount.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'borderColor', self.borderColor.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'effects', 'nashville', self.isNashville.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam(
-                'effects', 'nashvilleAmount', self.nashvilleAmount.get()
-            )
-            gifSettingChanges += self.gif.GetConfig().SetParam('effects', 'blur', str(blur))
-            gifSettingChanges += self.gif.GetConfig().SetParam(
+            self.gif.GetConfig().SetParam('effects', 'brightness', self.sclBright.get() * 10)
+            self.gif.GetConfig().SetParam('effects', 'contrast', self.sclBright.get() * 10)
+            self.gif.GetConfig().SetParam('color', 'saturation', saturation)
+            self.gif.GetConfig().SetParamBool('effects', 'sharpen', self.isSharpened.get())
+            self.gif.GetConfig().SetParam('effects', 'sharpenAmount', self.sharpenedAmount.get())
+            self.gif.GetConfig().SetParamBool('effects', 'sepiaTone', self.isSepia.get())
+            self.gif.GetConfig().SetParam('effects', 'sepiaToneAmount', self.sepiaAmount.get())
+            self.gif.GetConfig().SetParamBool('effects', 'colorTint', self.isColorTint.get())
+            self.gif.GetConfig().SetParam('effects', 'colorTintAmount', self.colorTintAmount.get())
+            self.gif.GetConfig().SetParam('effects', 'colorTintColor', self.colorTintColor.get())
+            self.gif.GetConfig().SetParamBool('effects', 'fadeEdges', self.isFadedEdges.get())
+            self.gif.GetConfig().SetParam('effects', 'fadeEdgeAmount', self.fadedEdgeAmount.get())
+            self.gif.GetConfig().SetParamBool('effects', 'border', self.isBordered.get())
+            self.gif.GetConfig().SetParam('effects', 'borderAmount', self.borderAmount.get())
+            self.gif.GetConfig().SetParam('effects', 'borderColor', self.borderColor.get())
+            self.gif.GetConfig().SetParamBool('effects', 'nashville', self.isNashville.get())
+            self.gif.GetConfig().SetParam('effects', 'nashvilleAmount', self.nashvilleAmount.get())
+            self.gif.GetConfig().SetParam('effects', 'blur', str(blur))
+            self.gif.GetConfig().SetParam(
                 'color', 'numColors', str(int(self.sclNumColors.get() * 2.55))
             )
-            gifSettingChanges += self.gif.GetConfig().SetParam('color', 'colorSpace', colorSpace)
-            gifSettingChanges += self.gif.GetConfig().SetParamBool(
-                'audio', 'audioEnabled', self.isAudioEnabled.get()
-            )
-
-            # Make sure we catch any caption and/or image blitting changes
-            gifSettingChanges += self.captionChanges
-            gifSettingChanges += self.miscGifChanges
-
-            # Settings that only affect final file format
-            fileFormatSettingChanges += self.audioChanges
-            fileFormatSettingChanges += self.frameTimingOrCompressionChanges
-            fileFormatSettingChanges += self.gif.GetConfig().SetParam(
-                'rate', 'speedModifier', str(self.sclSpeedModifier.get())
-            )
-
-            # We are assuming we are going to process these settings. Reset change counters
-            if not preview:
-                self.captionChanges = 0
-                self.miscGifChanges = 0
-                self.audioChanges = 0
-            else:
-                self.miscGifChanges += gifSettingChanges  # for now, just store these here
+            self.gif.GetConfig().SetParam('color', 'colorSpace', colorSpace)
+            self.gif.GetConfig().SetParamBool('audio', 'audioEnabled', self.isAudioEnabled.get())
 
-        # This code is too complicated
-
-        # Keep track of the last time edits were made
-
-        if self.lastProcessTsByLevel[1] == 0:
-            timeOrRateSettingChanges += 1
-        if (
-            self.lastProcessTsByLevel[2] == 0
-            or (self.lastProcessTsByLevel[1] > self.lastProcessTsByLevel[2])
-            or (
-                self.gif.GetExtractedImagesLastModifiedTs()
-                > self.gif.GetResizedImagesLastModifiedTs()
-            )
-        ):
-            sizeSettingChanges += 1
-        if (
-            self.lastProcessTsByLevel[3] == 0
-            or (self.lastProcessTsByLevel[2] > self.lastProcessTsByLevel[3])
-            or (self.gif.GetResizedImagesLastModifiedTs() > self.gif.GetGifLastModifiedTs())
-            or len(self.gif.GetProcessedImageList()) == 0
-        ):
-            gifSettingChanges += 1
+            self.gif.GetConfig().SetParam('rate', 'speedModifier', str(self.sclSpeedModifier.get()))
 
         # Conflict. They changed form settings that will generate new stills, but they also made manual edits in explorer
         if (
-            self.lastProcessTsByLevel[1] > 0
-            and self.lastProcessTsByLevel[1] < self.gif.GetExtractedImagesLastModifiedTs()
-            and timeOrRateSettingChanges
+            self.extractedFramesGeneration is not None
+            and self.extractedFramesGeneration != self.gif.GetFramesGeneration()
+            and self.gif.IsStageStale(igf_stages.STAGE_EXTRACT)
         ):
             logging.info(
-                'Edits detected. Prompt user. TimestampLastProcess: %d ; TimestampImagesLastModified: %d',
-                self.lastProcessTsByLevel[1],
-                self.gif.GetExtractedImagesLastModifiedTs(),
+                'Edits detected. Prompt user. Generation at last extraction: %s ; now: %s',
+                self.extractedFramesGeneration,
+                self.gif.GetFramesGeneration(),
             )
 
             if tkinter.messagebox.askyesno(
@@ -2547,30 +2464,33 @@ class GifApp:
                 + 'Making changes to animation smoothness, duration or start time will generate a new sequence of '
                 + 'images, overwriting your changes. Would you like to generate a new sequence of images based your updated settings?',
             ):
-                timeOrRateSettingChanges = 1
+                self.gif.stageGraph.Invalidate(igf_stages.STAGE_EXTRACT)
             else:
-                timeOrRateSettingChanges = 0
+                self.gif.MarkStageBuilt(igf_stages.STAGE_EXTRACT)
 
         processOk = True
         inputDisabled = False
 
+        # The stages below see these settings, whatever is changed while they run
+        settings = self.gif.GetConfig().GetSnapshot()
+
         try:
-            if processStages >= 1 and timeOrRateSettingChanges > 0:
+            if processStages >= 1 and self.gif.IsStageStale(igf_stages.STAGE_EXTRACT, settings):
                 self.ResetFrameTrackbar()
                 self.EnableInputs(False, False)
                 inputDisabled = True
                 self.SetStatus('(1/' + str(processStages) + ') Extracting frames...')
-                self.gif.ExtractFrames()
+                self.gif.ExtractFrames(settings)
 
                 #
                 # Dup detection and removal
                 #
 
                 frameCount = self.gif.GetNumFrames()
-                deleteDupFrames = self.conf.GetParamBool('settings', 'autoDeleteDuplicateFrames')
+                deleteDupFrames = settings.GetParamBool('settings', 'autoDeleteDuplicateFrames')
 
                 self.SetStatus('(1/' + str(processStages) + ') Checking for duplicate frames...')
-                numDups = self.gif.CheckDuplicates(deleteDupFrames)
+                numDups = self.gif.CheckDuplicates(deleteDupFrames, settings)
 
                 if numDups > 0 and deleteDupFrames:
                     self.SetStatus(
@@ -2583,11 +2503,12 @@ class GifApp:
                         "How boring! All of your frames are exactly the same! Note: If you're looking a black/blank image, try screen capturing on your other monitor - it's a known issue."
                     )
 
-                self.lastProcessTsByLevel[1] = time.time()
+                self.gif.MarkStageBuilt(igf_stages.STAGE_EXTRACT, settings)
+                self.extractedFramesGeneration = self.gif.GetFramesGeneration()
 
                 doUpdateThumbs = True
 
-            if processStages >= 2 and (timeOrRateSettingChanges or sizeSettingChanges):
+            if processStages >= 2 and self.gif.IsStageStale(igf_stages.STAGE_RESIZE, settings):
                 self.EnableInputs(False, False)
                 inputDisabled = True
 
@@ -2598,22 +2519,21 @@ class GifApp:
                 else:
                     self.SetStatus('(2/' + str(processStages) + ') Cropping and resizing...')
 
-                if not preview:
-                    self.gif.CropAndResize()
-                    self.lastProcessTsByLevel[2] = time.time()
+                if not preview and self.gif.CropAndResize(None, settings):
+                    self.gif.MarkStageBuilt(igf_stages.STAGE_RESIZE, settings)
 
-            imageProcessingRequired = (
-                timeOrRateSettingChanges or sizeSettingChanges or gifSettingChanges
-            )
+            imageProcessingRequired = self.gif.IsStageStale(igf_stages.STAGE_PROCESS, settings)
             if processStages >= 3 and (
-                (imageProcessingRequired or fileFormatSettingChanges) or preview
+                imageProcessingRequired
+                or self.gif.IsStageStale(igf_stages.STAGE_ENCODE, settings)
+                or preview
             ):
                 self.EnableInputs(False, False)
                 inputDisabled = True
 
                 if preview:
                     self.SetStatus('Generating preview')
-                    self.gif.GenerateFramePreview(self.GetThumbNailIndex())
+                    self.gif.GenerateFramePreview(self.GetThumbNailIndex(), settings)
                 else:
                     self.SetStatus(
                         '(3/'
@@ -2624,8 +2544,9 @@ class GifApp:
                             self.gif.GetNextOutputPath(),
                         )
                     )
-                    self.gif.Generate(not imageProcessingRequired)
-                    self.lastProcessTsByLevel[3] = time.time()
+                    if self.gif.Generate(not imageProcessingRequired, settings):
+                        self.gif.MarkStageBuilt(igf_stages.STAGE_PROCESS, settings)
+                        self.gif.MarkStageBuilt(igf_stages.STAGE_ENCODE, settings)
 
                 self.SetStatus('Done')
 
@@ -2686,7 +2607,11 @@ class GifApp:
                     + self.gif.GetLastGifOutputPath()
                 )
 
-                self.PlayGif(self.gif.GetProcessedImageList(), self.gif.GetGifFrameDelay())
+                self.PlayGif(
+                    self.gif.GetProcessedImageList(),
+                    self.gif.GetGifFrameDelay(),
+                    self.gif.GetFrameDelays(),
+                )
 
         if doUpdateThumbs:
             self.SetThumbNailIndex(1)
@@ -2982,7 +2907,7 @@ class GifApp:
         self.guiBusy = False
         return True
 
-    def PlayGif(self, filename, frameDelay):
+    def PlayGif(self, filename, frameDelay, frameDelays=None):
         if not self.gif:
             self.Alert('Gif Player', 'Internal error. Unable to play!')
             return
@@ -3009,7 +2934,13 @@ class GifApp:
             ):
                 soundPath = self.gif.GetAudioClipPath()
 
-            anim = GifPlayerWidget(popupWindow, filename, frameDelay * 10, isResizable, soundPath)
+            frameDelaysMs = None
+            if frameDelays is not None and len(frameDelays) == len(filename):
+                frameDelaysMs = [delay * 10 for delay in frameDelays]
+
+            anim = GifPlayerWidget(
+                popupWindow, filename, frameDelay * 10, isResizable, soundPath, frameDelaysMs
+            )
         except MemoryError:
             self.Alert('Gif Player', 'Unable to show preview. Your GIF is too big.')
             return
@@ -3289,27 +3220,15 @@ class GifApp:
 
     def SetLogoDefaults(self):
         if len(self.OnSetLogoDefaults) > 0:
-            self.miscGifChanges += self.conf.SetParamBool(
-                'imagelayer1', 'applyFx', self.OnSetLogoDefaults['logoApplyFx']
-            )
-            self.miscGifChanges += self.conf.SetParam(
-                'imagelayer1', 'path', self.OnSetLogoDefaults['logoPath']
-            )
-            self.miscGifChanges += self.conf.SetParam(
+            self.conf.SetParamBool('imagelayer1', 'applyFx', self.OnSetLogoDefaults['logoApplyFx'])
+            self.conf.SetParam('imagelayer1', 'path', self.OnSetLogoDefaults['logoPath'])
+            self.conf.SetParam(
                 'imagelayer1', 'positioning', self.OnSetLogoDefaults['logoPositioning']
             )
-            self.miscGifChanges += self.conf.SetParam(
-                'imagelayer1', 'resize', self.OnSetLogoDefaults['logoResize']
-            )
-            self.miscGifChanges += self.conf.SetParam(
-                'imagelayer1', 'opacity', self.OnSetLogoDefaults['logoOpacity']
-            )
-            self.miscGifChanges += self.conf.SetParam(
-                'imagelayer1', 'xNudge', self.OnSetLogoDefaults['logoXoffset']
-            )
-            self.miscGifChanges += self.conf.SetParam(
-                'imagelayer1', 'yNudge', self.OnSetLogoDefaults['logoYoffset']
-            )
+            self.conf.SetParam('imagelayer1', 'resize', self.OnSetLogoDefaults['logoResize'])
+            self.conf.SetParam('imagelayer1', 'opacity', self.OnSetLogoDefaults['logoOpacity'])
+            self.conf.SetParam('imagelayer1', 'xNudge', self.OnSetLogoDefaults['logoXoffset'])
+            self.conf.SetParam('imagelayer1', 'yNudge', self.OnSetLogoDefaults['logoYoffset'])
 
     def OnSetLogo(self):
         # Default form values
@@ -3912,7 +3831,6 @@ class GifApp:
             # Disable import button
             btnImport.configure(state='disabled')
 
-            self.miscGifChanges += 1
             if self.gif is not None and self.gif.ImportFrames(
                 start, imgList, reverseImport, insertAfter, riffle, stretch.get() == 0
             ):
@@ -4146,7 +4064,6 @@ class GifApp:
             return False
 
         if self.gif.ReverseFrames():
-            self.miscGifChanges += 1
             self.SetStatus('Reversed frames')
             self.UpdateThumbnailPreview()  # We have new frames
             return True
@@ -4424,9 +4341,9 @@ class GifApp:
                 return False
 
             if AudioFileExists():
-                self.audioChanges += self.conf.SetParam('audio', 'path', txtPath.get())
-                self.audioChanges += self.conf.SetParam('audio', 'startTime', str(GetStartTime()))
-                self.audioChanges += self.conf.SetParam('audio', 'volume', str(volume.get()))
+                self.conf.SetParam('audio', 'path', txtPath.get())
+                self.conf.SetParam('audio', 'startTime', str(GetStartTime()))
+                self.conf.SetParam('audio', 'volume', str(volume.get()))
 
                 # audioChanged = False
                 btnPreview.configure(state='normal')
@@ -5475,59 +5392,45 @@ class GifApp:
             listValues = list(self.cbxCaptionList['values'])
 
             if len(caption) <= 0:
-                self.captionChanges += self.conf.SetParam(confName, 'text', '')
-                self.captionChanges += self.conf.SetParam(confName, 'font', '')
-                self.captionChanges += self.conf.SetParam(confName, 'style', '')
-                self.captionChanges += self.conf.SetParam(confName, 'size', '')
-                self.captionChanges += self.conf.SetParam(confName, 'frameStart', '')
-                self.captionChanges += self.conf.SetParam(confName, 'frameEnd', '')
-                self.captionChanges += self.conf.SetParam(confName, 'color', '')
-                self.captionChanges += self.conf.SetParam(confName, 'animationEnvelope', '')
-                self.captionChanges += self.conf.SetParam(confName, 'animationType', '')
-                self.captionChanges += self.conf.SetParam(confName, 'positioning', '')
-                self.captionChanges += self.conf.SetParam(confName, 'outlineColor', '')
-                self.captionChanges += self.conf.SetParam(confName, 'outlineThickness', '')
-                self.captionChanges += self.conf.SetParam(confName, 'opacity', '')
-                self.captionChanges += self.conf.SetParam(confName, 'dropShadow', '')
-                self.captionChanges += self.conf.SetParam(confName, 'applyFx', '')
-                self.captionChanges += self.conf.SetParam(confName, 'interlineSpacing', '')
+                self.conf.SetParam(confName, 'text', '')
+                self.conf.SetParam(confName, 'font', '')
+                self.conf.SetParam(confName, 'style', '')
+                self.conf.SetParam(confName, 'size', '')
+                self.conf.SetParam(confName, 'frameStart', '')
+                self.conf.SetParam(confName, 'frameEnd', '')
+                self.conf.SetParam(confName, 'color', '')
+                self.conf.SetParam(confName, 'animationEnvelope', '')
+                self.conf.SetParam(confName, 'animationType', '')
+                self.conf.SetParam(confName, 'positioning', '')
+                self.conf.SetParam(confName, 'outlineColor', '')
+                self.conf.SetParam(confName, 'outlineThickness', '')
+                self.conf.SetParam(confName, 'opacity', '')
+                self.conf.SetParam(confName, 'dropShadow', '')
+                self.conf.SetParam(confName, 'applyFx', '')
+                self.conf.SetParam(confName, 'interlineSpacing', '')
 
                 listValues[captionIdx] = '[deleted]'
             else:
-                self.captionChanges += self.conf.SetParam(confName, 'text', caption)
-                self.captionChanges += self.conf.SetParam(confName, 'font', fontFamily.get())
-                self.captionChanges += self.conf.SetParam(confName, 'style', fontStyle.get())
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'size', spnCaptionFontSize.get()
-                )
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'frameStart', sclStartFrame.get()
-                )
-                self.captionChanges += self.conf.SetParam(confName, 'frameEnd', sclEndFrame.get())
-                self.captionChanges += self.conf.SetParam(confName, 'color', lblFontPreview['fg'])
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'animationEnvelope', animateSetting.get()
-                )
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'animationType', animationType.get()
-                )
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'positioning', positioning.get()
-                )
-                self.captionChanges += self.conf.SetParam(
+                self.conf.SetParam(confName, 'text', caption)
+                self.conf.SetParam(confName, 'font', fontFamily.get())
+                self.conf.SetParam(confName, 'style', fontStyle.get())
+                self.conf.SetParam(confName, 'size', spnCaptionFontSize.get())
+                self.conf.SetParam(confName, 'frameStart', sclStartFrame.get())
+                self.conf.SetParam(confName, 'frameEnd', sclEndFrame.get())
+                self.conf.SetParam(confName, 'color', lblFontPreview['fg'])
+                self.conf.SetParam(confName, 'animationEnvelope', animateSetting.get())
+                self.conf.SetParam(confName, 'animationType', animationType.get())
+                self.conf.SetParam(confName, 'positioning', positioning.get())
+                self.conf.SetParam(
                     confName,
                     'outlineColor',
                     self.OnCaptionConfigDefaults['defaultFontOutlineColor'],
                 )  # Fixed for now
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'outlineThickness', outlineThickness.get()
-                )
-                self.captionChanges += self.conf.SetParam(confName, 'opacity', opacity.get())
-                self.captionChanges += self.conf.SetParam(confName, 'dropShadow', dropShadow.get())
-                self.captionChanges += self.conf.SetParam(confName, 'applyFx', applyFxToText.get())
-                self.captionChanges += self.conf.SetParam(
-                    confName, 'interlineSpacing', lineSpacing.get()
-                )
+                self.conf.SetParam(confName, 'outlineThickness', outlineThickness.get())
+                self.conf.SetParam(confName, 'opacity', opacity.get())
+                self.conf.SetParam(confName, 'dropShadow', dropShadow.get())
+                self.conf.SetParam(confName, 'applyFx', applyFxToText.get())
+                self.conf.SetParam(confName, 'interlineSpacing', lineSpacing.get())
 
                 if isEdit:
                     listValues[captionIdx] = caption
@@ -0,0 +1,113 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o0004000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+READ_SIZE = 65536
+
+
+class DirectoryWatcher:
+    """Tell when files in a set of directories change, whoever changed them. Uses inotify, so it
+    only does anything on Linux. Elsewhere IsAvailable() is False and nothing is reported.
+
+    Events are collected without blocking when Poll() is called, which runs the callback of
+    every directory that changed since the last poll.
+    """
+
+    def __init__(self):
+        self.fd = -1
+        self.callbacks = {}  # watch descriptor -> callback
+        self.libc = None
+
+        if not sys.platform.startswith('linux'):
+            return
+
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            self.fd = -1
+
+        if self.fd < 0:
+            logging.info('File system watcher is not available')
+
+    def __del__(self):
+        self.Close()
+
+    def IsAvailable(self):
+        return self.fd >= 0
+
+    def Watch(self, directory, callback):
+        """Call callback() after files in directory change. Returns False if the directory
+        can't be watched."""
+        if not self.IsAvailable():
+            return False
+
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            logging.error(
+                'Unable to watch %s: %s' % (directory, os.strerror(ctypes.get_errno()))
+            )
+            return False
+
+        self.callbacks[wd] = callback
+        return True
+
+    def Poll(self):
+        if not self.IsAvailable():
+            return
+
+        changed = set()
+        overflow = False
+
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError:
+                overflow = True
+                break
+
+            if not data:
+                break
+
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _, nameLen = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size + nameLen
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                else:
+                    changed.add(wd)
+
+        # Events were lost, so anything might have changed
+        if overflow:
+            changed = set(self.callbacks)
+
+        for wd in changed:
+            callback = self.callbacks.get(wd)
+            if callback is not None:
+                callback()
+
+    def Close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.callbacks = {}
@@ -44,6 +44,8 @@ class InstaCommandLine:
         # self.args          = parser.parse_args()
 
         self.videoFileName = sys.argv[1]  # self.args.video
+        # Frames are kept as extracted unless asked otherwise
+        self.cullDuplicates = '--cull-duplicates' in sys.argv[2:]
 
     def ArgsArePresent(self):
         return len(sys.argv) > 1
@@ -67,6 +69,7 @@ class InstaCommandLine:
         self.gif = igf_animgif.AnimatedGif(
             self.conf, self.videoFileName, self.workDir, self.OnShowProgress, None
         )
+        self.gif.cullDuplicates = self.cullDuplicates
         self.MakeGif()
         return 0
 
@@ -79,12 +82,11 @@ class InstaCommandLine:
 
     # Makes a GIF according to current configuration
     def MakeGif(self):
-        print('Extracting frames:')
-        self.gif.ExtractFrames()
-        print('Cropping and resizing:')
-        self.gif.CropAndResize()
-        print('Generating GIF:')
-        self.gif.Generate()
+        if not self.gif.Build(onStage=self.OnBuildStage):
+            print('Failed to make the GIF')
+
+    def OnBuildStage(self, stage):
+        print('Running %s stage:' % stage)
 
 
 def main():
@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import igf_animgif  # noqa: E402
+import igf_common  # noqa: E402
+
+
+def find_tool(envVar, names, confKey):
+    """A tool from the environment variable, the PATH or instagiffer.conf, None if there's none"""
+    candidates = [os.environ.get(envVar)] + [shutil.which(name) for name in names]
+    conf = igf_common.InstaConfig(os.path.join(REPO_DIR, 'instagiffer.conf'))
+    candidates.append(conf.GetParam('paths', confKey))
+
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+@pytest.fixture(scope='session')
+def ffmpeg():
+    path = find_tool('INSTAGIFFER_FFMPEG', ('ffmpeg',), 'ffmpeg')
+    if path is None:
+        pytest.skip('ffmpeg not found. Set INSTAGIFFER_FFMPEG')
+    return path
+
+
+@pytest.fixture(scope='session')
+def convert():
+    path = find_tool('INSTAGIFFER_CONVERT', ('convert',), 'convert')
+    if path is None:
+        pytest.skip('ImageMagick convert not found. Set INSTAGIFFER_CONVERT')
+    return path
+
+
+@pytest.fixture
+def config(tmp_path, ffmpeg, convert):
+    """Default configuration in a scratch copy, pointing at the tools found"""
+    confPath = tmp_path / 'instagiffer.conf'
+    shutil.copyfile(os.path.join(REPO_DIR, 'instagiffer.conf'), confPath)
+    conf = igf_common.InstaConfig(str(confPath))
+    conf.SetParam('paths', 'ffmpeg', ffmpeg)
+    conf.SetParam('paths', 'convert', convert)
+    conf.SetParam('paths', 'gifOutputPath', str(tmp_path / 'insta.gif'))
+    conf.SetParam('settings', 'autoDeleteDuplicateFrames', 'False')
+
+    # Set by the GUI before every build
+    for key in ('sharpenAmount', 'fadeEdgeAmount', 'borderAmount', 'nashvilleAmount'):
+        conf.SetParam('effects', key, '100')
+    return conf
+
+
+@pytest.fixture
+def make_clip(tmp_path, ffmpeg):
+    """make_clip(seconds, fps) writes an ffmpeg testsrc clip. Every frame of it is different"""
+
+    def MakeClip(seconds=2.0, fps=25, size='160x120'):
+        clipPath = str(tmp_path / 'testsrc.mp4')
+        subprocess.run(
+            [
+                ffmpeg, '-v', 'error', '-y', '-f', 'lavfi',
+                '-i', 'testsrc=duration=%s:size=%s:rate=%s' % (seconds, size, fps),
+                '-pix_fmt', 'yuv420p', clipPath,
+            ],
+            check=True,
+        )  # fmt: skip
+        return clipPath
+
+    return MakeClip
+
+
+@pytest.fixture
+def make_gif(tmp_path, config):
+    """make_gif(mediaPath) opens media in an AnimatedGif with its own working directory"""
+
+    def MakeGif(mediaPath):
+        workDir = tmp_path / 'work'
+        workDir.mkdir(exist_ok=True)
+        gif = igf_animgif.AnimatedGif(config, mediaPath, str(workDir), lambda *args: True, None)
+
+        # Like the GUI does for a new video: no crop, full size
+        width, height = gif.GetVideoWidth(), gif.GetVideoHeight()
+        config.SetParam('size', 'cropWidth', width)
+        config.SetParam('size', 'cropHeight', height)
+        config.SetParam('size', 'resizePostCrop', '%dx%d' % (width, height))
+        return gif
+
+    return MakeGif
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+import igf_animgif
+
+ENVELOPES = [
+    '%s %s' % (envelopeType, speed)
+    for envelopeType in ('fadein', 'fadeout', 'fadeinout', 'triangle', 'sawtooth', 'square')
+    for speed in ('slow', 'medium', 'fast')
+] + ['random']
+
+
+def baseline_envelope(envelopeName, fps, fromFrame, toFrame, numFrames, rng):
+    """The envelope as CaptionProcessing used to build it inline for every frame"""
+    animationDuration = 1.0
+
+    if 'slow' in envelopeName:
+        animationDuration = 2.0
+    if 'medium' in envelopeName:
+        animationDuration = 1.0
+    if 'fast' in envelopeName:
+        animationDuration = 0.5
+
+    dutyCycle = float(fps) * animationDuration
+    animStep = int(round(100 / dutyCycle))
+
+    if animStep == 0:
+        animStep = 1
+
+    saw = [x / 100.0 for x in range(0, 101, animStep)]
+    tri = [x / 100.0 for x in range(0, 101, animStep)]
+    squ = ([1.00] * int(dutyCycle)) + ([0.00] * int(dutyCycle))
+
+    if saw[-1] != 1.0:
+        saw.append(1.0)
+
+    if tri[-1] != 1.0:
+        tri.append(1.0)
+
+    if len(squ) == 0:
+        squ = [1.0, 0.0]
+
+    tri = tri + tri[::-1][1:-1]
+    rnd = []
+
+    for _ in range(0, 50):
+        rnd.append(rng.randint(0, 100) / 100.0)
+
+    totalTextFrames = 1 + toFrame - fromFrame
+
+    patternEnv = []
+    if 'triangle' in envelopeName:
+        patternEnv = tri
+    elif 'square' in envelopeName:
+        patternEnv = squ
+    elif 'random' in envelopeName:
+        patternEnv = rnd
+    elif 'sawtooth' in envelopeName:
+        patternEnv = saw
+    else:
+        patternEnv = [1.0]
+
+    # repeat pattern
+    if totalTextFrames > 0:
+        patternEnv = ([op for op in patternEnv * totalTextFrames])[0:totalTextFrames]
+
+    if 'fade' in envelopeName and 'in' in envelopeName:
+        for fx in range(0, min(len(saw), len(patternEnv))):
+            patternEnv[fx] *= saw[fx]
+
+    if 'fade' in envelopeName and 'out' in envelopeName:
+        si = 0
+        for fx in range(len(patternEnv) - 1, -1, -1):
+            patternEnv[fx] *= saw[si]
+            si += 1
+            if si >= len(saw):
+                break
+
+    animationEnv = [0.0] * (fromFrame - 1)
+    animationEnv += patternEnv
+    animationEnv += [0.0] * (numFrames - len(animationEnv))
+    return animationEnv
+
+
+@pytest.mark.parametrize('envelopeName', ENVELOPES)
+@pytest.mark.parametrize('fps', [1, 5, 10, 24, 30, 60])
+@pytest.mark.parametrize('fromFrame, toFrame', [(1, 90), (7, 31), (12, 12), (1, 3)])
+def test_envelope_matches_inline_version(envelopeName, fps, fromFrame, toFrame):
+    numFrames = 90
+
+    # Both roll the random pattern first, so the same seed gives the same pattern
+    expected = baseline_envelope(envelopeName, fps, fromFrame, toFrame, numFrames, random.Random(7))
+    envelope = igf_animgif.build_caption_envelope(
+        envelopeName, fps, fromFrame, toFrame, numFrames, random.Random(7)
+    )
+
+    assert envelope == expected
+
+
+def test_random_envelope_holds_for_the_whole_render():
+    envelope = igf_animgif.build_caption_envelope('random', 10, 1, 120, 120, random.Random(3))
+
+    # The old per-frame version rolled a new pattern for every frame. One pattern repeats now
+    assert envelope[:50] == envelope[50:100]
+    assert len(set(envelope)) > 1
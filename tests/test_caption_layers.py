@@ -0,0 +1,78 @@
+import PIL.Image
+import PIL.ImageChops
+import pytest
+
+
+def set_caption(conf, captionId, family, style, **params):
+    caption = {
+        'text': 'Hello',
+        'font': family,
+        'style': style,
+        'size': '14pt',
+        'color': '#ffffff',
+        'outlineColor': '#000000',
+        'outlineThickness': '1',
+        'opacity': '100',
+        'dropShadow': '0',
+        'interlineSpacing': '0',
+        'applyFx': 'False',
+        'positioning': 'Bottom',
+        'frameStart': '1',
+        'frameEnd': '99',
+        'animationEnvelope': 'off',
+        'animationType': 'blink',
+    }
+    caption.update(params)
+    for key, value in caption.items():
+        conf.SetParam(captionId, key, value)
+
+
+def render_processed_frames(gif, conf, cacheLayers):
+    conf.SetParam('performance', 'cacheCaptionLayers', str(cacheLayers))
+    gif.DeleteProcessedImages()
+    assert gif.ImageProcessing()
+
+    frames = []
+    for fileName in gif.GetProcessedImageList():
+        with PIL.Image.open(fileName) as img:
+            frames.append(img.convert('RGBA'))
+    return frames
+
+
+@pytest.mark.parametrize(
+    'positioning, animationType',
+    [
+        ('Top Left', 'left-right'),
+        ('Center', 'up-down'),
+        ('Bottom Right', 'subtle change'),
+        ('Middle Right', 'left-right'),
+    ],
+)
+def test_cached_layers_match_drawing_on_frames(
+    make_clip, make_gif, config, positioning, animationType
+):
+    gif = make_gif(make_clip(seconds=1.2, fps=10))
+    fonts = gif.GetFonts()
+    if fonts.GetFontCount() == 0:
+        pytest.skip('ImageMagick knows no fonts')
+    family = fonts.GetFamilyList()[0]
+    style = fonts.GetFontAttributeList(family)[0]
+
+    config.SetParam('effects', 'border', 'True')
+    config.SetParam('effects', 'borderAmount', '20')
+    set_caption(
+        config, 'caption1', family, style, applyFx='True', positioning=positioning,
+        animationEnvelope='triangle fast', animationType=animationType,
+    )  # fmt: skip
+    set_caption(config, 'caption2', family, style, text='World', positioning='Center')
+
+    assert gif.ExtractFrames()
+    assert gif.CropAndResize()
+
+    cached = render_processed_frames(gif, config, True)
+    direct = render_processed_frames(gif, config, False)
+
+    assert len(cached) == len(direct) == gif.GetNumFrames()
+    for frameIdx, (a, b) in enumerate(zip(cached, direct, strict=True)):
+        assert a.size == b.size
+        assert PIL.ImageChops.difference(a, b).getbbox() is None, 'frame %d differs' % frameIdx
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+import igf_common
+
+
+@pytest.fixture
+def conf(tmp_path):
+    confPath = tmp_path / 'instagiffer.conf'
+    shutil.copyfile(
+        os.path.join(os.path.dirname(igf_common.__file__), 'instagiffer.conf'), confPath
+    )
+    return igf_common.InstaConfig(str(confPath))
+
+
+def test_snapshot_parses_values_up_front(conf):
+    conf.SetParam('rate', 'frameRate', '24')
+    conf.SetParam('length', 'durationSec', '2.5')
+    conf.SetParam('effects', 'borderColor', '#f80')
+    conf.SetParam('effects', 'colorTintColor', 'orange')
+    settings = conf.GetSnapshot()
+
+    assert settings.GetParamInt('rate', 'frameRate') == 24
+    assert settings.GetParamFloat('rate', 'frameRate') == 24.0
+    assert settings.GetParamFloat('length', 'durationSec') == 2.5
+    assert settings.GetParamInt('length', 'durationSec', 7) == 7
+    assert settings.GetParamColor('effects', 'borderColor') == (255, 136, 0)
+    assert settings.GetParamColor('captiondefaults', 'fontColor') == (255, 255, 255)
+    assert settings.GetParamColor('effects', 'colorTintColor') is None
+    assert settings.GetParamBool('captiondefaults', 'applyFx') is False
+    assert settings.GetParamBool('nosuchsection', 'nosuchkey') is False
+
+
+def test_snapshot_falls_back_to_platform_sections(conf):
+    conf.SetParam('paths-' + sys.platform, 'testTool', '/opt/tool')
+    settings = conf.GetSnapshot()
+
+    assert settings.GetParam('paths', 'testTool') == '/opt/tool'
+    assert settings.GetParam('paths', 'testTool') == conf.GetParam('paths', 'testTool')
+
+
+def test_snapshot_is_read_only(conf):
+    settings = conf.GetSnapshot()
+
+    with pytest.raises(AttributeError):
+        settings.values = {}
+    with pytest.raises(AttributeError):
+        settings.cache = {}
+    with pytest.raises(TypeError):
+        settings.ints['rate', 'framerate'] = 1
+
+
+def test_snapshot_keeps_its_settings(conf):
+    conf.SetParam('rate', 'frameRate', '10')
+    settings = conf.GetSnapshot()
+    conf.SetParam('rate', 'frameRate', '30')
+
+    assert settings.GetParamInt('rate', 'frameRate') == 10
+    assert conf.GetSnapshot().GetParamInt('rate', 'frameRate') == 30
+    assert conf.GetSnapshot().GetHash() != settings.GetHash()
@@ -0,0 +1,57 @@
+import math
+import os
+import subprocess
+
+import PIL.Image
+import PIL.ImageChops
+import pytest
+
+import igf_frames
+
+CLIP_FPS = 25
+FRAME_RATE = 10
+
+
+def decode_all_frames(ffmpeg, clipPath, outDir):
+    """Every frame of the clip, in order, as ffmpeg decodes it"""
+    os.makedirs(outDir)
+    subprocess.run(
+        [
+            ffmpeg, '-v', 'error', '-i', clipPath, '-fps_mode', 'passthrough',
+            os.path.join(outDir, 'src%04d.png'),
+        ],
+        check=True,
+    )  # fmt: skip
+    return [os.path.join(outDir, name) for name in sorted(os.listdir(outDir))]
+
+
+def same_picture(pathA, pathB):
+    with PIL.Image.open(pathA) as a, PIL.Image.open(pathB) as b:
+        return PIL.ImageChops.difference(a.convert('RGB'), b.convert('RGB')).getbbox() is None
+
+
+@pytest.mark.parametrize('rawPipe', [False, True])
+@pytest.mark.parametrize('startTime', ['00:00:00.0', '00:00:00.8', '00:00:01.3'])
+def test_frames_line_up_with_start_time(
+    make_clip, make_gif, config, ffmpeg, tmp_path, startTime, rawPipe
+):
+    clipPath = make_clip(seconds=3.0, fps=CLIP_FPS)
+    sourceFrames = decode_all_frames(ffmpeg, clipPath, str(tmp_path / 'source'))
+    gif = make_gif(clipPath)
+
+    config.SetParam('length', 'startTime', startTime)
+    config.SetParam('length', 'durationSec', '1.0')
+    config.SetParam('rate', 'frameRate', str(FRAME_RATE))
+    config.SetParam('settings', 'fixSlowdownGlitch', 'True')
+    config.SetParam('performance', 'rawPipeExtract', str(rawPipe))
+
+    assert gif.ExtractFrames()
+
+    frames = sorted(gif.GetExtractedImageList())
+    assert len(frames) == FRAME_RATE
+
+    # Each frame is the one on screen at its slot, starting with the requested start time
+    startSec = igf_frames.time_str_to_microseconds(startTime) / igf_frames.US_PER_SEC
+    for slot, fileName in enumerate(frames):
+        sourceIdx = math.floor(round((startSec + slot / FRAME_RATE) * CLIP_FPS, 6))
+        assert same_picture(fileName, sourceFrames[sourceIdx]), 'slot %d' % (slot)
@@ -0,0 +1,90 @@
+import logging
+import os
+import re
+import subprocess
+
+import pytest
+
+import igf_frames
+
+
+@pytest.fixture
+def gif_with_still_ending(tmp_path, ffmpeg, make_gif, config):
+    """A GIF of a clip that moves for a second and then holds its last frame for a second,
+    with the held frames culled as duplicates"""
+    clipPath = str(tmp_path / 'still_ending.mp4')
+    subprocess.run(
+        [
+            ffmpeg, '-v', 'error', '-y', '-f', 'lavfi',
+            '-i', 'testsrc=duration=1:size=160x120:rate=10,tpad=stop_mode=clone:stop_duration=1',
+            '-pix_fmt', 'yuv420p', clipPath,
+        ],
+        check=True,
+    )  # fmt: skip
+
+    gif = make_gif(clipPath)
+    config.SetParam('length', 'durationSec', '2.0')
+    config.SetParam('rate', 'frameRate', '10')
+    config.SetParam('settings', 'duplicateFrameDetection', 'perceptual')
+    config.SetParam('performance', 'resizeBackend', 'pillow')
+
+    assert gif.ExtractFrames()
+    assert gif.CheckDuplicates(cull=True) > 0
+    return gif
+
+
+def delays_from_input_args(inputArgs):
+    """Delay of each frame and the frame numbers, in the order the encoder reads them"""
+    delays = []
+    numbers = []
+    for delay, fileName in re.findall(r'-delay (\d+) "([^"]+)"', inputArgs):
+        frameRange = re.search(r'\[(\d+)-(\d+)\]$', fileName)
+        if frameRange:
+            first, last = int(frameRange.group(1)), int(frameRange.group(2))
+        else:
+            first = last = igf_frames.get_frame_number(fileName)
+        delays += [int(delay)] * (last - first + 1)
+        numbers += list(range(first, last + 1))
+    return delays, numbers
+
+
+def render_processed_frames(gif):
+    assert gif.CropAndResize()
+    gif.DeleteProcessedImages()
+    gif.CopyFramesToProcessedFolder()
+
+
+def test_held_frames_keep_their_delay_without_renaming(gif_with_still_ending):
+    gif = gif_with_still_ending
+    gif.ReverseFrames()
+    render_processed_frames(gif)
+
+    processedDir = gif.GetProcessedImagesDir()
+    processedFiles = {
+        name: igf_frames.file_identity(os.path.join(processedDir, name))
+        for name in os.listdir(processedDir)
+    }
+
+    settings = gif.GetConfig().GetSnapshot()
+    delays, numbers = delays_from_input_args(gif.GetGifInputArgs(settings))
+
+    assert delays == gif.GetFrameDelays()
+    assert len(set(delays)) > 1
+    assert numbers == list(range(1, gif.GetNumFrames() + 1))
+    assert {
+        name: igf_frames.file_identity(os.path.join(processedDir, name))
+        for name in os.listdir(processedDir)
+    } == processedFiles
+
+
+def test_missing_processed_frame_is_reported(gif_with_still_ending, caplog):
+    gif = gif_with_still_ending
+    render_processed_frames(gif)
+    os.remove(gif.GetProcessedImageList()[0])
+    gif.RescanFrameDirs()
+
+    with caplog.at_level(logging.ERROR):
+        inputArgs = gif.GetGifInputArgs(gif.GetConfig().GetSnapshot())
+
+    assert '-delay' not in inputArgs
+    assert 'processed frames for' in caplog.text
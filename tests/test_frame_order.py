@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import igf_frames
+
+
+def file_identities(directory):
+    return {
+        name: igf_frames.file_identity(os.path.join(directory, name))
+        for name in os.listdir(directory)
+    }
+
+
+def closest_frame(fileName, candidates):
+    """Index of the candidate that looks most like fileName"""
+    signature = igf_frames.luma_signature(fileName)
+    differences = [
+        igf_frames.luma_signature_difference(signature, igf_frames.luma_signature(candidate))
+        for candidate in candidates
+    ]
+    return differences.index(min(differences))
+
+
+@pytest.mark.parametrize('singlePass', [False, True])
+def test_reordered_frames_are_resized_in_order_without_renaming(
+    make_clip, make_gif, config, singlePass
+):
+    gif = make_gif(make_clip(seconds=1.0, fps=10))
+    config.SetParam('size', 'resizePostCrop', '80x60')
+    config.SetParam('performance', 'resizeBackend', 'pillow')
+    config.SetParam('performance', 'singlePassExtract', str(singlePass))
+
+    assert gif.ExtractFrames()
+    extracted = gif.GetExtractedImageList()
+    extractedFiles = file_identities(gif.GetExtractedImagesDir())
+
+    # Reverse, then move the last frame to the front
+    gif.ReverseFrames()
+    order = gif.GetExtractedImageList()
+    order = order[-1:] + order[:-1]
+    gif.frameStore.SetOrder(order)
+
+    assert gif.CropAndResize()
+    assert file_identities(gif.GetExtractedImagesDir()) == extractedFiles
+
+    resized = gif.GetResizedImageList()
+    assert len(resized) == len(order)
+    for frameIdx, resizedFile in enumerate(resized):
+        assert extracted[closest_frame(resizedFile, extracted)] == order[frameIdx]
+
+    # Previews of single frames land on the same names
+    assert gif.GetResizedImageList(1) == resized[0]
@@ -0,0 +1,87 @@
+import os
+import random
+
+import PIL.Image
+import PIL.ImageChops
+import PIL.ImageDraw
+import pytest
+
+import igf_common
+import igf_frames
+
+SIZE = 320, 240
+
+
+@pytest.fixture(scope='module')
+def threshold():
+    """The default perceptual duplicate threshold, in percent"""
+    confPath = os.path.join(os.path.dirname(igf_common.__file__), 'instagiffer.conf')
+    conf = igf_common.InstaConfig(confPath)
+    return float(conf.GetParam('settings', 'duplicateFrameThreshold'))
+
+
+def background():
+    img = PIL.Image.linear_gradient('L').resize(SIZE).point(lambda v: 40 + v // 2)
+    return PIL.Image.merge('RGB', (img, img, img))
+
+
+def with_noise(img, seed, amount=1):
+    """img with per-pixel noise of up to amount levels, like re-encoding a still picture at a
+    good quality leaves"""
+    rng = random.Random(seed)
+    noise = PIL.Image.frombytes(
+        'L', img.size, bytes(rng.randint(0, 2 * amount) for _ in range(img.width * img.height))
+    )
+    offset = PIL.Image.new('L', img.size, amount)
+    bands = [
+        PIL.ImageChops.subtract(PIL.ImageChops.add(band, noise), offset) for band in img.split()
+    ]
+    return PIL.Image.merge('RGB', bands)
+
+
+def with_caption(img):
+    """img with a small blinking caption in the bottom margin"""
+    img = img.copy()
+    PIL.ImageDraw.Draw(img).rectangle((130, 212, 190, 226), fill='white')
+    return img
+
+
+def with_square(img, x):
+    img = img.copy()
+    PIL.ImageDraw.Draw(img).rectangle((x, 100, x + 31, 131), fill='white')
+    return img
+
+
+def signatures(tmp_path, frames):
+    sigs = []
+    for frameIdx, img in enumerate(frames):
+        fileName = str(tmp_path / ('image%04d.png' % (frameIdx + 1)))
+        img.save(fileName)
+        sigs.append(igf_frames.luma_signature(fileName))
+    return sigs
+
+
+def consecutive_differences(sigs):
+    return [igf_frames.luma_signature_difference(a, b) for a, b in zip(sigs, sigs[1:])]
+
+
+def test_blinking_caption_is_not_a_duplicate(tmp_path, threshold):
+    frames = [with_noise(background(), seed) for seed in range(6)]
+    frames = [with_caption(img) if idx % 2 else img for idx, img in enumerate(frames)]
+
+    for difference in consecutive_differences(signatures(tmp_path, frames)):
+        assert difference > threshold
+
+
+def test_moving_square_is_not_a_duplicate(tmp_path, threshold):
+    frames = [with_noise(with_square(background(), 20 + 6 * idx), idx) for idx in range(6)]
+
+    for difference in consecutive_differences(signatures(tmp_path, frames)):
+        assert difference > threshold
+
+
+def test_encoder_noise_is_a_duplicate(tmp_path, threshold):
+    frames = [with_noise(with_caption(background()), seed) for seed in range(6)]
+
+    for difference in consecutive_differences(signatures(tmp_path, frames)):
+        assert difference <= threshold
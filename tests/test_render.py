@@ -0,0 +1,23 @@
+import PIL.Image
+import PIL.ImageChops
+import pytest
+
+import igf_render
+
+
+@pytest.mark.parametrize('formatName', sorted(igf_render.FRAME_FORMATS))
+@pytest.mark.parametrize('finalSize', [(64, 48), (32, 24)])
+def test_pillow_renderer_writes_frame(tmp_path, formatName, finalSize):
+    inputFileName = str(tmp_path / 'image0001.png')
+    PIL.Image.linear_gradient('L').resize((64, 48)).convert('RGB').save(inputFileName)
+
+    frameFormat = igf_render.FRAME_FORMATS[formatName]
+    outputFileName = str(tmp_path / ('resized.' + frameFormat.extension))
+    geometry = igf_render.FrameGeometry((64, 48), None, finalSize)
+    renderer = igf_render.PillowFrameRenderer(geometry, frameFormat=frameFormat)
+
+    assert renderer.Render(inputFileName, outputFileName)
+    with PIL.Image.open(outputFileName) as img, PIL.Image.open(inputFileName) as original:
+        assert img.size == finalSize
+        if finalSize == original.size:
+            assert PIL.ImageChops.difference(img.convert('RGB'), original).getbbox() is None
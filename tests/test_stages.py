@@ -0,0 +1,27 @@
+import PIL.Image
+
+import igf_stages
+
+
+def resized_frame_size(gif):
+    with PIL.Image.open(gif.GetResizedImageList()[0]) as img:
+        return img.size
+
+
+def test_settings_changed_during_a_build_wait_for_the_next_one(make_clip, make_gif, config):
+    gif = make_gif(make_clip(seconds=1.0, fps=10))
+    config.SetParam('performance', 'resizeBackend', 'pillow')
+    config.SetParam('size', 'resizePostCrop', '80x60')
+
+    def OnStage(stage):
+        if stage == igf_stages.STAGE_EXTRACT:
+            config.SetParam('size', 'resizePostCrop', '40x30')
+
+    assert gif.Build(igf_stages.STAGE_RESIZE, OnStage)
+    assert resized_frame_size(gif) == (80, 60)
+    assert not gif.IsStageStale(igf_stages.STAGE_EXTRACT)
+    assert gif.IsStageStale(igf_stages.STAGE_RESIZE)
+
+    assert gif.Build(igf_stages.STAGE_RESIZE)
+    assert resized_frame_size(gif) == (40, 30)
+    assert not gif.IsStageStale(igf_stages.STAGE_RESIZE)